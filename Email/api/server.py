@@ -2,22 +2,27 @@
 
 from __future__ import annotations
 
+import asyncio
 import os
 import json
 import logging
+import sys
+from datetime import date, datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from config import DEFAULT_UNREAD_WINDOW_DAYS
 from db import initialize_database
+from services.calendar_mirror import get_calendar_mirror
 from services.email_processor import EmailProcessor, ProcessedEmail, process_messages
-from services.email_search import run_email_search
-from tools import GmailClient, build_query, list_message_ids
+from services.email_search import arun_email_search, warm_email_search_agent
+from services.triage import collect_by_category
+from tools import GmailClient, build_query, governor_stats, list_message_ids, list_message_threads
 from tools.calendar_client import CalendarClient
 from api.cache import initialize_cache, store_emails, fetch_emails
 from memory.supermemory_client import log_chat_memory
@@ -35,19 +40,40 @@ app.add_middleware(
 
 initialize_database()
 initialize_cache()
-_processor = EmailProcessor()
+# Set FOCUSMATE_FUSED_ANALYSIS=1 to analyse and prioritize each email in one LLM call.
+_processor = EmailProcessor(fused=os.getenv("FOCUSMATE_FUSED_ANALYSIS", "").lower() in {"1", "true", "yes"})
 _client: GmailClient = _processor.gmail
-_calendar_client: Optional[CalendarClient] = None
+# Set FOCUSMATE_THREAD_ANALYSIS=1 to analyse each Gmail conversation once instead of every message.
+_thread_mode = os.getenv("FOCUSMATE_THREAD_ANALYSIS", "").lower() in {"1", "true", "yes"}
+
+@app.on_event("startup")
+async def _warm_search_agent() -> None:
+    # Build the shared search agent (model client, prompt, Calendar service) before the first /qa call.
+    await asyncio.to_thread(warm_email_search_agent)
+
+
+@app.on_event("startup")
+def _start_calendar_mirror() -> None:
+    # /calendar/events reads the local mirror; a daemon thread keeps it current.
+    get_calendar_mirror(_processor.calendar).start()
+
+
+@app.on_event("shutdown")
+def _stop_calendar_mirror() -> None:
+    get_calendar_mirror().stop()
+
 
 def _get_calendar_client() -> CalendarClient:
-    global _calendar_client
-    if _calendar_client is None:
-        _calendar_client = CalendarClient()
-    return _calendar_client
+    # Credentials, the discovery service and per-thread transports come from the shared registry.
+    return _processor.calendar
 
 
 # Timeline path - assumes Plan directory is adjacent to Email directory
 TIMELINE_PATH = Path(__file__).parent.parent.parent / "Plan" / "day_timeline.json"
+# The Plan directory's timeline store and loaders are shared with the desktop viewer.
+sys.path.append(str(TIMELINE_PATH.parent))
+from timeline_index import TimelineIndex
+from timeline_loader import etag_matches, get_plan_loader, load_plan_raw
 
 
 def _collect_emails(
@@ -56,30 +82,27 @@ def _collect_emails(
     include_read: bool,
     limit: int,
     extra_query: str = "",
+    reanalyze: bool = False,
+    loop: Optional[asyncio.AbstractEventLoop] = None,
 ) -> Dict[str, List[ProcessedEmail]]:
-    categorized: Dict[str, List[ProcessedEmail]] = {"task": [], "article": [], "instruction": []}
     query = build_query(include_read=include_read, days=days, extra=extra_query)
     max_messages = limit * 6  # safeguard to avoid scanning the entire inbox
 
-    processed_count = 0
-    for message_id in list_message_ids(_client, query):
-        if processed_count >= max_messages:
-            break
-        processed = _processor.process_message(message_id, mark_as_read=False)
-        processed_count += 1
-        if not processed:
-            continue
-
-        key = processed.classification
-        if key not in categorized:
-            continue
-        if len(categorized[key]) >= limit:
-            continue
-        categorized[key].append(processed)
-
-        if all(len(items) >= limit for items in categorized.values()):
-            break
-
+    threads = None
+    if _thread_mode:
+        threads = list_message_threads(_client, query, limit=max_messages)
+        message_ids = list(threads)
+    else:
+        message_ids = list_message_ids(_client, query, limit=max_messages)
+    categorized, _ = collect_by_category(
+        _processor,
+        message_ids,
+        limit_per_category=limit,
+        max_processed=max_messages,
+        reanalyze=reanalyze,
+        loop=loop,
+        threads=threads,
+    )
     return categorized
 
 
@@ -89,18 +112,25 @@ def _refresh_cache(
     include_read: bool = False,
     limit: int = 3,
     extra_query: str = "",
+    reanalyze: bool = False,
+    loop: Optional[asyncio.AbstractEventLoop] = None,
 ) -> Dict[str, List[ProcessedEmail]]:
     categorized = _collect_emails(
-        days=days, include_read=include_read, limit=limit, extra_query=extra_query
+        days=days, include_read=include_read, limit=limit, extra_query=extra_query, reanalyze=reanalyze, loop=loop
     )
     store_emails(categorized)
     return categorized
 
 
-def _get_cached(limit: int, cache_only: bool = False) -> Dict[str, List[ProcessedEmail]]:
-    cached = fetch_emails(limit)
+async def _arefresh_cache(**options) -> Dict[str, List[ProcessedEmail]]:
+    """Run ``_refresh_cache`` off the event loop while its LLM calls run concurrently on it."""
+    return await asyncio.to_thread(_refresh_cache, loop=asyncio.get_running_loop(), **options)
+
+
+async def _get_cached(limit: int, cache_only: bool = False) -> Dict[str, List[ProcessedEmail]]:
+    cached = await asyncio.to_thread(fetch_emails, limit)
     if not cache_only and not any(len(values) for values in cached.values()):
-        cached = _refresh_cache(limit=limit)
+        cached = await _arefresh_cache(limit=limit)
     return {key: values[:limit] for key, values in cached.items()}
 
 
@@ -109,20 +139,49 @@ def health_check() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def get_metrics() -> Dict[str, dict]:
+    cache = _processor.analysis_chain.cache
+    return {
+        "analysis_cache": cache.stats() if cache is not None else {},
+        "priority_paths": _processor.priority_agent.stats(),
+        "rate_limits": governor_stats(),
+    }
+
+
+def _plan_date(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+
 @app.get("/timeline")
-def get_timeline() -> dict:
-    """Get the current day timeline from the Plan directory."""
+def get_timeline(
+    plan_date: Optional[str] = Query(None, alias="date", description="Day (YYYY-MM-DD); today by default"),
+    version: Optional[int] = Query(None, ge=1, description="Plan version; the latest by default"),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """Get a day's plan from the Plan timeline store.
+
+    The latest version is only re-read when a new one is stored; clients that
+    send the previous ``ETag`` in ``If-None-Match`` get an empty 304 while it
+    is unchanged.
+    """
+    plan_date = _plan_date(plan_date)
     try:
-        if not TIMELINE_PATH.exists():
-            raise HTTPException(
-                status_code=404,
-                detail="Timeline not found. Please run Plan/plan_my_da.py first to generate the timeline."
-            )
-        
-        with open(TIMELINE_PATH, 'r', encoding='utf-8') as f:
-            timeline = json.load(f)
-        
-        return timeline
+        # Today's latest plan is cached; other days and versions are read on demand
+        if plan_date is None and version is None:
+            raw, etag = get_plan_loader().load_raw()
+        else:
+            raw, etag = load_plan_raw(plan_date, version)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Timeline not found. Please run Plan/plan_my_da.py first to generate the timeline."
+        )
     except json.JSONDecodeError:
         raise HTTPException(
             status_code=500,
@@ -133,6 +192,50 @@ def get_timeline() -> dict:
             status_code=500,
             detail=f"Error loading timeline: {str(e)}"
         )
+    
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=raw, media_type="application/json", headers=headers)
+
+
+@app.get("/timeline/current")
+def get_current_block(
+    at: Optional[str] = Query(None, description="ISO 8601 time to query instead of now"),
+) -> Dict[str, object]:
+    """Return the focus step or segment in progress, its task, and what comes next."""
+    try:
+        moment = _parse_iso(at) or datetime.now().astimezone()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {e}")
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    try:
+        # An explicit time on another day reads that day's plan, uncached
+        day = moment.astimezone().date()
+        if day == datetime.now().astimezone().date():
+            index = get_plan_loader().index()
+        else:
+            raw, _ = load_plan_raw(day.isoformat())
+            index = TimelineIndex(json.loads(raw))
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Timeline not found. Please run Plan/plan_my_da.py first to generate the timeline."
+        )
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=500, detail="Error parsing timeline JSON")
+
+    current = index.current(moment)
+    task = index.current_task(moment)
+    upcoming = index.next(moment)
+    return {
+        "now": moment.isoformat(),
+        "current": current.to_dict() if current else None,
+        "progress": index.status(current, moment)[1] if current else None,
+        "task": task.to_dict() if task else None,
+        "next": upcoming.to_dict() if upcoming else None,
+    }
 
 
 @app.post("/timeline/{task_id}/complete")
@@ -145,19 +248,30 @@ def mark_task_complete(task_id: str) -> dict:
     }
 
 
+def _parse_iso(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
 @app.get("/calendar/events")
 def get_calendar_events(
     time_min: Optional[str] = Query(None, description="ISO 8601 start time (e.g., 2025-11-01T00:00:00Z)"),
     time_max: Optional[str] = Query(None, description="ISO 8601 end time"),
     max_results: int = Query(50, ge=1, le=250),
+    calendar_id: str = Query("primary", description="Calendar to read; the primary one by default"),
 ) -> Dict[str, List[dict]]:
-    """Fetch events from Google Calendar."""
+    """Return events of one calendar from the local calendar mirror."""
+    try:
+        bounds = [_parse_iso(value) for value in (time_min, time_max)]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
     try:
-        calendar = _get_calendar_client()
-        events = calendar.list_events(
+        events = get_calendar_mirror(_get_calendar_client()).events(
+            time_min=bounds[0],
+            time_max=bounds[1],
             max_results=max_results,
-            time_min=time_min,
-            time_max=time_max,
+            calendar_ids=[calendar_id],
         )
         
         # Normalize events to match frontend expectations
@@ -181,7 +295,7 @@ def get_calendar_events(
 
 
 @app.get("/emails")
-def get_emails(
+async def get_emails(
     category: Optional[str] = Query(None, description="Optional category filter: task|article|instruction"),
     limit: int = Query(3, ge=1, le=20),
     refresh: bool = Query(False, description="Force refresh from Gmail instead of using cache"),
@@ -189,9 +303,9 @@ def get_emails(
 ) -> Dict[str, List[dict]]:
     try:
         if refresh and not cache_only:
-            categorized_processed = _refresh_cache(limit=limit)
+            categorized_processed = await _arefresh_cache(limit=limit)
         else:
-            categorized_processed = _get_cached(limit, cache_only=cache_only)
+            categorized_processed = await _get_cached(limit, cache_only=cache_only)
         
         categorized: Dict[str, List[dict]] = {
             key: [item.to_dict() for item in categorized_processed[key]] for key in categorized_processed
@@ -212,15 +326,16 @@ def get_emails(
 
 
 @app.post("/emails/process")
-def trigger_processing(
+async def trigger_processing(
     days: int = Query(DEFAULT_UNREAD_WINDOW_DAYS, ge=1, le=365),
     include_read: bool = Query(False),
     limit: int = Query(10, ge=1, le=50),
     extra_query: str = Query(""),
+    reanalyze: bool = Query(False, description="Re-run analysis even for already-processed emails"),
 ) -> Dict[str, int]:
     try:
-        categorized = _refresh_cache(
-            days=days, include_read=include_read, limit=limit, extra_query=extra_query
+        categorized = await _arefresh_cache(
+            days=days, include_read=include_read, limit=limit, extra_query=extra_query, reanalyze=reanalyze
         )
         summary: Dict[str, int] = {key: len(value) for key, value in categorized.items()}
         return summary
@@ -232,15 +347,16 @@ def trigger_processing(
 
 
 @app.post("/emails/refresh")
-def refresh_emails(
+async def refresh_emails(
     days: int = Query(DEFAULT_UNREAD_WINDOW_DAYS, ge=1, le=365),
     include_read: bool = Query(False),
     limit: int = Query(3, ge=1, le=20),
     extra_query: str = Query(""),
+    reanalyze: bool = Query(False, description="Re-run analysis even for already-processed emails"),
 ) -> Dict[str, int]:
     try:
-        categorized = _refresh_cache(
-            days=days, include_read=include_read, limit=limit, extra_query=extra_query
+        categorized = await _arefresh_cache(
+            days=days, include_read=include_read, limit=limit, extra_query=extra_query, reanalyze=reanalyze
         )
         return {key: len(value) for key, value in categorized.items()}
     except Exception as e:
@@ -256,8 +372,8 @@ class SearchRequest(BaseModel):
 
 
 @app.post("/emails/search")
-def search_emails(body: SearchRequest):
-    result = run_email_search(body.query, limit=body.limit)
+async def search_emails(body: SearchRequest):
+    result = await arun_email_search(body.query, limit=body.limit)
     return result.model_dump()
 
 
@@ -280,10 +396,10 @@ class QAResponse(BaseModel):
 
 
 @app.post("/qa", response_model=QAResponse)
-def follow_up_chat(body: QARequest) -> QAResponse:
-    cached = fetch_emails(body.limit)
+async def follow_up_chat(body: QARequest) -> QAResponse:
+    cached = await asyncio.to_thread(fetch_emails, body.limit)
     if not any(len(values) for values in cached.values()):
-        cached = _refresh_cache(limit=body.limit, include_read=True)
+        cached = await _arefresh_cache(limit=body.limit, include_read=True)
     history_snippets: List[str] = []
     for item in body.history[-6:]:
         role = item.role.strip().lower()
@@ -302,7 +418,7 @@ def follow_up_chat(body: QARequest) -> QAResponse:
     composite_query = normalized_question
     if history_snippets:
         composite_query = "\n".join(history_snippets + [f"USER: {normalized_question}"])
-    result = run_email_search(composite_query, limit=max(1, min(body.limit, 24)))
+    result = await arun_email_search(composite_query, limit=max(1, min(body.limit, 24)))
     answer = result.answer.strip() if result.answer else ""
     lower_answer = answer.lower()
     needs_fallback = (
@@ -332,7 +448,8 @@ def follow_up_chat(body: QARequest) -> QAResponse:
     )
     user_id = body.user_id or os.getenv("SUPERMEMORY_USER_ID") or "focusmate-user"
     try:
-        log_chat_memory(
+        await asyncio.to_thread(
+            log_chat_memory,
             user_id=user_id,
             question=normalized_question,
             answer=answer,
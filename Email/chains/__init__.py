@@ -1,13 +1,20 @@
 """LangChain chains for FocusMate."""
 
+from .analysis_cache import AnalysisCache
+from .concurrency import llm_concurrency, llm_slot
 from .email_analysis import (
     EmailAnalysis,
     EmailAnalysisChain,
+    FusedEmailAnalysis,
     build_email_analysis_chain,
 )
 
 __all__ = [
+    "AnalysisCache",
     "EmailAnalysis",
     "EmailAnalysisChain",
+    "FusedEmailAnalysis",
     "build_email_analysis_chain",
+    "llm_concurrency",
+    "llm_slot",
 ]
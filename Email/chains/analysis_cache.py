@@ -0,0 +1,95 @@
+"""Persistent content-hash cache for email analysis results."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from typing import Dict, Optional, Sequence
+
+from db import get_cached_analysis, purge_analysis_cache, store_cached_analysis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 5000
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip().lower()
+
+
+class AnalysisCache:
+    """SQLite-backed LRU cache of validated ``EmailAnalysis`` JSON.
+
+    Keys hash the normalized subject, sender, analysed body window and memories
+    together with the prompt version and model, so editing the prompt or switching
+    models never serves stale results. When the cache is created, entries from
+    prompt versions other than its own and ``live_prompt_versions`` are purged;
+    pass every version still in use so processes sharing the database keep each
+    other's entries.
+    """
+
+    def __init__(
+        self,
+        *,
+        prompt_version: str,
+        model: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        purge_stale: bool = True,
+        live_prompt_versions: Sequence[str] = (),
+    ) -> None:
+        self.prompt_version = prompt_version
+        self.model = model
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if purge_stale:
+            purged = purge_analysis_cache(keep_prompt_versions=[prompt_version, *live_prompt_versions])
+            if purged:
+                logger.info("Purged %d cached analyses from older prompt versions", purged)
+
+    def key(self, *, subject: str, sender: str, body: str, memories: str) -> str:
+        material = json.dumps(
+            [
+                _normalize(subject),
+                _normalize(sender),
+                _normalize(body),
+                _normalize(memories),
+                self.prompt_version,
+                self.model,
+            ],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        payload = get_cached_analysis(cache_key)
+        self._bump("hits" if payload is not None else "misses")
+        return payload
+
+    def put(self, cache_key: str, analysis_json: str) -> None:
+        evicted = store_cached_analysis(
+            cache_key,
+            self.prompt_version,
+            self.model,
+            analysis_json,
+            max_entries=self.max_entries,
+        )
+        self._bump("stores")
+        if evicted:
+            self._bump("evictions", evicted)
+
+    def invalidate(self) -> int:
+        """Drop every cached analysis, e.g. after changing parsing or post-processing rules."""
+        return purge_analysis_cache()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _bump(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
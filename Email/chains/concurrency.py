@@ -0,0 +1,36 @@
+"""Shared limit on concurrent async LLM calls."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+
+DEFAULT_LLM_CONCURRENCY = 8
+
+_lock = threading.Lock()
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def llm_concurrency() -> int:
+    """Maximum number of in-flight async LLM requests (``FOCUSMATE_LLM_CONCURRENCY``)."""
+    try:
+        return max(1, int(os.getenv("FOCUSMATE_LLM_CONCURRENCY", DEFAULT_LLM_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_LLM_CONCURRENCY
+
+
+def llm_slot() -> asyncio.Semaphore:
+    """Semaphore shared by every ``ainvoke``/``abatch`` running on the current event loop.
+
+    ``EmailAnalysisChain``, ``PriorityAgent`` and ``EmailSearchAgent`` all acquire it
+    around their model calls, so a bulk refresh cannot flood the provider.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        semaphore = _semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(llm_concurrency())
+            _semaphores[loop] = semaphore
+        return semaphore
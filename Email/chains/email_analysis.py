@@ -2,20 +2,29 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import logging
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Mapping, Optional, Sequence, Tuple, Type, Union
 
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.utils.json import parse_json_markdown
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
+from chains.analysis_cache import AnalysisCache
+from chains.concurrency import llm_slot
 from config import OPENAI_MODEL, OPENAI_TEMPERATURE
+from tools.email_utils import DEFAULT_BODY_TOKEN_BUDGET, compact_body
+from tools.rate_limit import governor
 
 logger = logging.getLogger(__name__)
 
+BODY_WINDOW_CHARS = 20000
+
 
 class Meeting(BaseModel):
     has_meeting: bool = False
@@ -40,19 +49,91 @@ class EmailAnalysis(BaseModel):
     deadline: Deadline = Deadline()
 
 
+class FusedEmailAnalysis(EmailAnalysis):
+    """Analysis plus the priority decision, produced by a single LLM call."""
+
+    priority_bucket: Optional[Literal["Urgent", "Important", "Not important"]] = None
+    priority_score: Optional[int] = None
+    priority_reasoning: Optional[str] = None
+
+
 @dataclass
 class EmailAnalysisChain:
     llm_chain: Any
     parser: PydanticOutputParser
+    cache: Optional[AnalysisCache] = None
+    body_token_budget: Optional[int] = DEFAULT_BODY_TOKEN_BUDGET
 
     def invoke(self, *, subject: str, sender: str, body: str, memories: str) -> EmailAnalysis:
+        payload, cache_key, cached = self._lookup(subject=subject, sender=sender, body=body, memories=memories)
+        if cached is not None:
+            return cached
+        result = governor("openai").call(lambda: self.llm_chain.invoke(payload))
+        return self._store(result, subject, cache_key)
+
+    async def ainvoke(self, *, subject: str, sender: str, body: str, memories: str) -> EmailAnalysis:
+        """Async ``invoke``; the model call waits for a slot on the shared LLM semaphore."""
+        payload, cache_key, cached = await asyncio.to_thread(
+            self._lookup, subject=subject, sender=sender, body=body, memories=memories
+        )
+        if cached is not None:
+            return cached
+        async with llm_slot():
+            result = await governor("openai").acall(lambda: self.llm_chain.ainvoke(payload))
+        return await asyncio.to_thread(self._store, result, subject, cache_key)
+
+    async def abatch(
+        self,
+        inputs: Sequence[Mapping[str, str]],
+        *,
+        return_exceptions: bool = False,
+    ) -> List[Union[EmailAnalysis, BaseException]]:
+        """Analyse many emails concurrently; each input holds ``subject``, ``sender``, ``body`` and ``memories``."""
+        return await asyncio.gather(
+            *(
+                self.ainvoke(
+                    subject=item.get("subject", ""),
+                    sender=item.get("sender", ""),
+                    body=item.get("body", ""),
+                    memories=item.get("memories", ""),
+                )
+                for item in inputs
+            ),
+            return_exceptions=return_exceptions,
+        )
+
+    def _lookup(
+        self, *, subject: str, sender: str, body: str, memories: str
+    ) -> Tuple[Dict[str, str], Optional[str], Optional[EmailAnalysis]]:
+        """Compact the body and check the cache; returns the LLM payload, cache key and any cached analysis."""
+        body_window = body[:BODY_WINDOW_CHARS]
+        if self.body_token_budget is not None:
+            body_window = compact_body(body_window, max_tokens=self.body_token_budget)
+        cache_key: Optional[str] = None
+        if self.cache is not None:
+            cache_key = self.cache.key(subject=subject, sender=sender, body=body_window, memories=memories)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                try:
+                    return {}, cache_key, self.schema.model_validate_json(cached)
+                except ValidationError as exc:
+                    logger.warning("Discarding unreadable cached analysis for subject '%s': %s", subject, exc)
+
         payload = {
             "memories": memories,
             "subject": subject,
             "sender": sender,
-            "body": body[:20000],
+            "body": body_window,
         }
-        result = self.llm_chain.invoke(payload)
+        return payload, cache_key, None
+
+    def _store(self, result: Any, subject: str, cache_key: Optional[str]) -> EmailAnalysis:
+        analysis = self._parse_result(result, subject)
+        if cache_key is not None:
+            self.cache.put(cache_key, analysis.model_dump_json())
+        return analysis
+
+    def _parse_result(self, result: Any, subject: str) -> EmailAnalysis:
         text = self._extract_text(result)
         if not text or not str(text).strip():
             logger.error("Email analysis LLM returned empty response for subject '%s'", subject)
@@ -69,11 +150,15 @@ class EmailAnalysisChain:
                     end = cleaned.rfind("}")
                     cleaned = cleaned[start : end + 1]
                 parsed = parse_json_markdown(cleaned)
-                return EmailAnalysis.model_validate(parsed)
+                return self.schema.model_validate(parsed)
             except Exception as exc:  # pragma: no cover - defensive fallback
                 logger.error("Failed to parse email analysis output: %s", exc)
                 raise
 
+    @property
+    def schema(self) -> Type[EmailAnalysis]:
+        return self.parser.pydantic_object
+
     @staticmethod
     def _extract_text(result: Any) -> str:
         if isinstance(result, str):
@@ -94,7 +179,7 @@ class EmailAnalysisChain:
         return str(content)
 
 
-SYSTEM_PROMPT = """You convert emails into strict JSON for an ADHD productivity app.
+ANALYSIS_INSTRUCTIONS = """You convert emails into strict JSON for an ADHD productivity app.
 Decide the classification BEFORE you populate the fields. Follow this strict ordering of checks:
 1. If the email requests the recipient to do something, confirm availability, attend a meeting, deliver work, or respond by a deadline/date/time → classification = "task".
    - Populate `deadline.due_iso` when a due date or specific time is mentioned.
@@ -107,12 +192,25 @@ Decide the classification BEFORE you populate the fields. Follow this strict ord
 Never label something as "article" if it fit the task or instruction rules above.
 Keep summaries concise (<= 2 sentences) and focused on why the recipient should care.
 Use prior MEMORIES when helpful. Return only the JSON that matches the schema.
-Schema:
+"""
+
+PRIORITY_INSTRUCTIONS = """Also prioritize the email for the recipient in the same JSON:
+- `priority_bucket` = "Urgent" for time-critical or executive-level requests, imminent deadlines, or severe consequences.
+- `priority_bucket` = "Important" for meaningful work that requires attention soon but is not on fire.
+- `priority_bucket` = "Not important" for low-value, marketing, FYI, or deferred items.
+- `priority_score` is 0-100 (0 lowest, 100 highest urgency) and must agree with the bucket.
+- `priority_reasoning` is one short sentence tying the decision to the email.
+"""
+
+SCHEMA_FOOTER = """Schema:
 {{ schema }}
 MEMORIES (optional, may be empty):
 {{ memories }}
 """
 
+SYSTEM_PROMPT = ANALYSIS_INSTRUCTIONS + SCHEMA_FOOTER
+FUSED_SYSTEM_PROMPT = ANALYSIS_INSTRUCTIONS + PRIORITY_INSTRUCTIONS + SCHEMA_FOOTER
+
 HUMAN_PROMPT = """Subject: {subject}
 From: {sender}
 Body:
@@ -120,12 +218,52 @@ Body:
 """
 
 
-def build_email_analysis_chain() -> EmailAnalysisChain:
-    parser = PydanticOutputParser(pydantic_object=EmailAnalysis)
+def prompt_version(system_prompt: str, schema: Type[BaseModel]) -> str:
+    """Fingerprint of the prompts and output schema; changes invalidate cached analyses."""
+    material = "\n".join([system_prompt, HUMAN_PROMPT, json.dumps(schema.model_json_schema(), sort_keys=True)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+PROMPT_VERSION = prompt_version(SYSTEM_PROMPT, EmailAnalysis)
+FUSED_PROMPT_VERSION = prompt_version(FUSED_SYSTEM_PROMPT, FusedEmailAnalysis)
+
+
+def build_email_analysis_chain(
+    *,
+    use_cache: bool = True,
+    fused: bool = False,
+    body_token_budget: Optional[int] = DEFAULT_BODY_TOKEN_BUDGET,
+) -> EmailAnalysisChain:
+    """Build the analysis chain.
+
+    With ``fused=True`` the same call also returns the priority decision
+    (``FusedEmailAnalysis``), so ``PriorityAgent`` does not need a second round trip.
+    Bodies are compacted to ``body_token_budget`` tokens; pass ``None`` to send the
+    raw character window instead.
+    """
+    schema = FusedEmailAnalysis if fused else EmailAnalysis
+    parser = PydanticOutputParser(pydantic_object=schema)
     prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
+        ("system", FUSED_SYSTEM_PROMPT if fused else SYSTEM_PROMPT),
         ("human", HUMAN_PROMPT),
     ], template_format="jinja2").partial(schema=parser.get_format_instructions())
-    model = ChatOpenAI(model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE)
+    # Retries are left to the shared rate governor (tools.rate_limit).
+    model = ChatOpenAI(model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE, max_retries=0)
     llm_chain = prompt | model
-    return EmailAnalysisChain(llm_chain=llm_chain, parser=parser)
+    version = FUSED_PROMPT_VERSION if fused else PROMPT_VERSION
+    # Fused and plain chains run side by side (API vs CLI/Streamlit) on one database
+    cache = (
+        AnalysisCache(
+            prompt_version=version,
+            model=OPENAI_MODEL,
+            live_prompt_versions=(PROMPT_VERSION, FUSED_PROMPT_VERSION),
+        )
+        if use_cache
+        else None
+    )
+    return EmailAnalysisChain(
+        llm_chain=llm_chain,
+        parser=parser,
+        cache=cache,
+        body_token_budget=body_token_budget,
+    )
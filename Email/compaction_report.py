@@ -0,0 +1,85 @@
+"""Measure body compaction on a corpus of saved email bodies.
+
+Usage:
+    python compaction_report.py path/to/fixtures [--analyze]
+
+Each ``.txt``, ``.html`` or ``.eml`` file in the directory is treated as one email
+body. The report lists raw vs compacted token counts; with ``--analyze`` both
+versions are also sent through the analysis chain (cache disabled) to check that
+the classification agrees.
+"""
+
+import argparse
+import email
+import sys
+from email import policy
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from chains.email_analysis import BODY_WINDOW_CHARS
+from tools.email_utils import compact_body, count_tokens, html_to_text
+
+
+def load_fixture(path: Path) -> tuple[str, str, str]:
+    """Return (subject, sender, body text) for a fixture file."""
+    raw = path.read_text(encoding="utf-8", errors="replace")
+    if path.suffix.lower() == ".eml":
+        message = email.message_from_string(raw, policy=policy.default)
+        part = message.get_body(preferencelist=("plain", "html"))
+        content = part.get_content() if part is not None else ""
+        if part is not None and part.get_content_type() == "text/html":
+            content = html_to_text(content)
+        return message.get("Subject", path.stem), message.get("From", ""), content
+    if path.suffix.lower() == ".html":
+        return path.stem, "", html_to_text(raw)
+    return path.stem, "", raw
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report token savings from email body compaction")
+    parser.add_argument("fixtures", type=Path, help="Directory of .txt/.html/.eml email bodies")
+    parser.add_argument("--analyze", action="store_true", help="Also compare LLM classifications (costs API calls)")
+    args = parser.parse_args()
+
+    files = sorted(
+        path for path in args.fixtures.iterdir() if path.suffix.lower() in {".txt", ".html", ".eml"}
+    )
+    if not files:
+        print(f"No fixtures found in {args.fixtures}")
+        return
+
+    raw_chain = compact_chain = None
+    if args.analyze:
+        from chains import build_email_analysis_chain
+
+        raw_chain = build_email_analysis_chain(use_cache=False, body_token_budget=None)
+        compact_chain = build_email_analysis_chain(use_cache=False)
+
+    total_raw = total_compact = agreements = 0
+    print(f"{'fixture':40} {'raw':>8} {'compact':>8} {'saved':>7}  category")
+    for path in files:
+        subject, sender, body = load_fixture(path)
+        window = body[:BODY_WINDOW_CHARS]
+        raw_tokens = count_tokens(window)
+        compact_tokens = count_tokens(compact_body(window))
+        total_raw += raw_tokens
+        total_compact += compact_tokens
+        saved = 100 * (raw_tokens - compact_tokens) / raw_tokens if raw_tokens else 0.0
+        verdict = ""
+        if raw_chain is not None and compact_chain is not None:
+            raw_category = raw_chain.invoke(subject=subject, sender=sender, body=body, memories="").category
+            compact_category = compact_chain.invoke(subject=subject, sender=sender, body=body, memories="").category
+            agrees = raw_category == compact_category
+            agreements += int(agrees)
+            verdict = raw_category if agrees else f"{raw_category} -> {compact_category} (MISMATCH)"
+        print(f"{path.name[:40]:40} {raw_tokens:>8} {compact_tokens:>8} {saved:>6.1f}%  {verdict}")
+
+    overall = 100 * (total_raw - total_compact) / total_raw if total_raw else 0.0
+    print(f"\nTotal tokens: {total_raw} -> {total_compact} ({overall:.1f}% saved)")
+    if args.analyze:
+        print(f"Classification agreement: {agreements}/{len(files)}")
+
+
+if __name__ == "__main__":
+    main()
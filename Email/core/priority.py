@@ -2,10 +2,13 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
+import os
+import threading
 from dataclasses import dataclass, asdict
 from datetime import datetime
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
 
 from dateutil import parser as dtparser
 from langchain_openai import ChatOpenAI
@@ -13,7 +16,9 @@ from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 
+from chains.concurrency import llm_slot
 from config import OPENAI_MODEL, OPENAI_TEMPERATURE
+from tools.rate_limit import governor
 
 VIP_KEYWORDS = ["@yourcompany.com", "ceo@", "manager@"]
 
@@ -60,8 +65,59 @@ HUMAN_PROMPT = """Email context:
 """
 
 
+@dataclass
+class FastPathThresholds:
+    """Heuristic score bands in which ``PriorityAgent`` skips the LLM.
+
+    Scores at or below ``not_important_max`` or at or above ``urgent_min`` are far
+    enough from the bucket boundaries (40 and 70) to be decided locally. An optional
+    ``important_band`` (inclusive low/high) does the same for mid-range scores.
+    VIP senders are never fast-pathed to "Not important"; the LLM weighs them.
+    """
+
+    not_important_max: int = 15
+    urgent_min: int = 85
+    important_band: Optional[Tuple[int, int]] = None
+    enabled: bool = True
+
+    @classmethod
+    def from_env(cls) -> "FastPathThresholds":
+        """Thresholds from ``FOCUSMATE_FAST_PATH_NOT_IMPORTANT_MAX`` / ``FOCUSMATE_FAST_PATH_URGENT_MIN``.
+
+        ``FOCUSMATE_FAST_PATH=0`` sends every email to the LLM.
+        """
+        defaults = cls()
+        return cls(
+            not_important_max=_env_int("FOCUSMATE_FAST_PATH_NOT_IMPORTANT_MAX", defaults.not_important_max),
+            urgent_min=_env_int("FOCUSMATE_FAST_PATH_URGENT_MIN", defaults.urgent_min),
+            enabled=os.getenv("FOCUSMATE_FAST_PATH", "1").lower() not in {"0", "false", "no"},
+        )
+
+    def bucket_for(self, score: int, *, vip: bool = False) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if score <= self.not_important_max and not vip:
+            return "Not important"
+        if score >= self.urgent_min:
+            return "Urgent"
+        if self.important_band and self.important_band[0] <= score <= self.important_band[1]:
+            return "Important"
+        return None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
 class PriorityAgent:
-    def __init__(self) -> None:
+    def __init__(self, fast_path: Optional[FastPathThresholds] = None) -> None:
+        # Read at construction so values from .env loaded at startup apply
+        self._fast_path = fast_path or FastPathThresholds.from_env()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"fast_path": 0, "llm": 0, "fallback": 0}
         self._parser = PydanticOutputParser(pydantic_object=PriorityDecision)
         self._prompt = ChatPromptTemplate.from_messages(
             [
@@ -69,28 +125,67 @@ class PriorityAgent:
                 ("human", HUMAN_PROMPT),
             ]
         )
-        self._model = ChatOpenAI(model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE)
+        self._model = ChatOpenAI(model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE, max_retries=0)
         self._chain = self._prompt | self._model | self._parser
 
     def decide(self, context: PriorityContext) -> PriorityDecision:
-        context_json = json.dumps(asdict(context), ensure_ascii=False, indent=2)
-        payload = {
-            "schema": self._parser.get_format_instructions(),
-            "context_json": context_json,
-        }
+        decision = self._fast_decision(context)
+        if decision is not None:
+            return decision
         try:
-            return self._chain.invoke(payload)
+            payload = self._payload(context)
+            decision = governor("openai").call(lambda: self._chain.invoke(payload))
         except Exception as exc:  # pragma: no cover - defensive fallback
-            bucket, score = heuristic_priority(context)
-            return PriorityDecision(
-                bucket=bucket,
-                score=score,
-                reasoning=f"Fallback heuristic due to error: {exc}",
-            )
+            self._bump("fallback")
+            return heuristic_decision(context, f"Fallback heuristic due to error: {exc}")
+        self._bump("llm")
+        return decision
 
+    async def adecide(self, context: PriorityContext) -> PriorityDecision:
+        """Async ``decide``; the model call waits for a slot on the shared LLM semaphore."""
+        decision = self._fast_decision(context)
+        if decision is not None:
+            return decision
+        try:
+            async with llm_slot():
+                payload = self._payload(context)
+                decision = await governor("openai").acall(lambda: self._chain.ainvoke(payload))
+        except Exception as exc:  # pragma: no cover - defensive fallback
+            self._bump("fallback")
+            return heuristic_decision(context, f"Fallback heuristic due to error: {exc}")
+        self._bump("llm")
+        return decision
+
+    async def abatch(self, contexts: Sequence[PriorityContext]) -> List[PriorityDecision]:
+        """Decide many emails concurrently. Errors fall back to the heuristic, so this never raises."""
+        return await asyncio.gather(*(self.adecide(context) for context in contexts))
+
+    def _fast_decision(self, context: PriorityContext) -> Optional[PriorityDecision]:
+        score = priority_score(context.category, context.has_deadline, context.due_days, context.vip_sender)
+        bucket = self._fast_path.bucket_for(score, vip=context.vip_sender)
+        if bucket is None:
+            return None
+        self._bump("fast_path")
+        return PriorityDecision(bucket=bucket, score=score, reasoning=heuristic_reasoning(context, score))
+
+    def _payload(self, context: PriorityContext) -> Dict[str, str]:
+        return {
+            "schema": self._parser.get_format_instructions(),
+            "context_json": json.dumps(asdict(context), ensure_ascii=False, indent=2),
+        }
 
-def build_priority_agent() -> PriorityAgent:
-    return PriorityAgent()
+    def stats(self) -> Dict[str, int]:
+        """How often each decision path was taken since startup."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+def build_priority_agent(fast_path: Optional[FastPathThresholds] = None) -> PriorityAgent:
+    return PriorityAgent(fast_path=fast_path)
 
 
 def heuristic_priority(context: PriorityContext) -> tuple[str, int]:
@@ -103,6 +198,24 @@ def heuristic_priority(context: PriorityContext) -> tuple[str, int]:
     return priority_bucket(score), score
 
 
+def heuristic_decision(context: PriorityContext, reasoning: str) -> PriorityDecision:
+    bucket, score = heuristic_priority(context)
+    return PriorityDecision(bucket=bucket, score=score, reasoning=reasoning)
+
+
+def heuristic_reasoning(context: PriorityContext, score: int) -> str:
+    factors: List[str] = [f"{context.category or 'uncategorized'} email"]
+    if context.has_deadline:
+        if context.due_days is not None:
+            factors.append(f"due in {max(context.due_days, 0)} day(s)")
+        else:
+            factors.append("has a deadline")
+    else:
+        factors.append("no deadline")
+    factors.append("VIP sender" if context.vip_sender else "non-VIP sender")
+    return f"Clear-cut heuristic decision (score {score}): " + ", ".join(factors) + "."
+
+
 def days_until(iso_timestamp: Optional[str]) -> Optional[int]:
     if not iso_timestamp:
         return None
@@ -6,8 +6,18 @@ from .storage import (
     upsert_email,
     insert_task,
     upsert_calendar_sync,
+    load_calendar_syncs,
+    get_sync_state,
+    set_sync_state,
+    apply_calendar_events,
+    query_calendar_events,
+    get_cached_analysis,
+    store_cached_analysis,
+    purge_analysis_cache,
     store_processed_email_snapshot,
     load_recent_processed,
+    load_processed_snapshots,
+    load_sender_categories,
     search_processed_emails,
 )
 
@@ -17,7 +27,17 @@ __all__ = [
     "upsert_email",
     "insert_task",
     "upsert_calendar_sync",
+    "load_calendar_syncs",
+    "get_sync_state",
+    "set_sync_state",
+    "apply_calendar_events",
+    "query_calendar_events",
+    "get_cached_analysis",
+    "store_cached_analysis",
+    "purge_analysis_cache",
     "store_processed_email_snapshot",
     "load_recent_processed",
+    "load_processed_snapshots",
+    "load_sender_categories",
     "search_processed_emails",
 ]
@@ -7,7 +7,7 @@ import sqlite3
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 from config import DB_PATH
 
@@ -39,6 +39,8 @@ class CalendarSyncRecord:
     email_gmail_id: str
     event_id: str
     created_at: datetime
+    start_iso: Optional[str] = None
+    html_link: Optional[str] = None
 
 
 def _connect(db_path: Path = DB_PATH) -> sqlite3.Connection:
@@ -80,6 +82,11 @@ def initialize_database() -> None:
             created_at TEXT
         )"""
         )
+        # Columns added after the table was first released.
+        existing = {row[1] for row in cur.execute("PRAGMA table_info(CalendarSync)")}
+        for column in ("start_iso", "html_link"):
+            if column not in existing:
+                cur.execute(f"ALTER TABLE CalendarSync ADD COLUMN {column} TEXT")
         cur.execute(
             """CREATE TABLE IF NOT EXISTS ProcessedEmailSnapshot(
             message_id TEXT PRIMARY KEY,
@@ -97,6 +104,37 @@ def initialize_database() -> None:
             cached_at TEXT
         )"""
         )
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS AnalysisCache(
+            cache_key TEXT PRIMARY KEY,
+            prompt_version TEXT,
+            model TEXT,
+            analysis_json TEXT,
+            created_at TEXT,
+            last_used_at TEXT
+        )"""
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON AnalysisCache(last_used_at)")
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS SyncState(
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TEXT
+        )"""
+        )
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS CalendarEvent(
+            calendar_id TEXT,
+            event_id TEXT,
+            start_ts REAL,
+            end_ts REAL,
+            updated TEXT,
+            event_json TEXT,
+            PRIMARY KEY (calendar_id, event_id)
+        )"""
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_calendar_event_start ON CalendarEvent(start_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_calendar_event_end ON CalendarEvent(end_ts)")
         con.commit()
 
 
@@ -163,19 +201,209 @@ def insert_task(
         con.commit()
 
 
-def upsert_calendar_sync(email_gmail_id: str, event_id: str) -> None:
-    payload = (email_gmail_id, event_id, datetime.utcnow().isoformat())
+def upsert_calendar_sync(
+    email_gmail_id: str,
+    event_id: str,
+    *,
+    start_iso: Optional[str] = None,
+    html_link: Optional[str] = None,
+) -> None:
+    payload = (email_gmail_id, event_id, datetime.utcnow().isoformat(), start_iso, html_link)
     with _connect() as con:
         cur = con.cursor()
         cur.execute(
             """INSERT OR REPLACE INTO CalendarSync(
-            email_gmail_id, event_id, created_at
+            email_gmail_id, event_id, created_at, start_iso, html_link
+        ) VALUES(?,?,?,?,?)""",
+            payload,
+        )
+        con.commit()
+
+
+def load_calendar_syncs(message_ids: Iterable[str]) -> Dict[str, CalendarSyncRecord]:
+    """Return the calendar event already created for each of ``message_ids``, if any."""
+    ids = list(dict.fromkeys(message_ids))
+    result: Dict[str, CalendarSyncRecord] = {}
+    with _connect() as con:
+        cur = con.cursor()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            placeholders = ",".join("?" for _ in chunk)
+            cur.execute(
+                f"""SELECT email_gmail_id, event_id, created_at, start_iso, html_link FROM CalendarSync
+                WHERE email_gmail_id IN ({placeholders})""",
+                chunk,
+            )
+            for gmail_id, event_id, created_at, start_iso, html_link in cur.fetchall():
+                result[gmail_id] = CalendarSyncRecord(
+                    email_gmail_id=gmail_id,
+                    event_id=event_id,
+                    created_at=datetime.fromisoformat(created_at),
+                    start_iso=start_iso,
+                    html_link=html_link,
+                )
+    return result
+
+
+def get_sync_state(key: str) -> Optional[str]:
+    with _connect() as con:
+        cur = con.cursor()
+        cur.execute("SELECT value FROM SyncState WHERE key=?", (key,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+def set_sync_state(key: str, value: str) -> None:
+    payload = (key, value, datetime.utcnow().isoformat())
+    with _connect() as con:
+        cur = con.cursor()
+        cur.execute(
+            """INSERT OR REPLACE INTO SyncState(
+            key, value, updated_at
         ) VALUES(?,?,?)""",
             payload,
         )
         con.commit()
 
 
+def apply_calendar_events(calendar_id: str, events: Iterable[dict], *, replace: bool = False) -> int:
+    """Mirror ``events`` (an ``events.list`` page) for ``calendar_id``; return rows changed.
+
+    Cancelled events are deleted. With ``replace`` (a full sync) every other row
+    for the calendar is dropped first, in the same transaction.
+    """
+    removed: List[tuple] = []
+    rows: List[tuple] = []
+    for event in events:
+        if event.get("status") == "cancelled":
+            removed.append((calendar_id, event.get("id")))
+            continue
+        start_ts, end_ts = _event_bounds(event)
+        rows.append((calendar_id, event.get("id"), start_ts, end_ts, event.get("updated"), json.dumps(event)))
+    with _connect() as con:
+        cur = con.cursor()
+        if replace:
+            cur.execute("DELETE FROM CalendarEvent WHERE calendar_id=?", (calendar_id,))
+        cur.executemany("DELETE FROM CalendarEvent WHERE calendar_id=? AND event_id=?", removed)
+        cur.executemany(
+            """INSERT OR REPLACE INTO CalendarEvent(
+            calendar_id, event_id, start_ts, end_ts, updated, event_json
+        ) VALUES(?,?,?,?,?,?)""",
+            rows,
+        )
+        con.commit()
+    return len(removed) + len(rows)
+
+
+def query_calendar_events(
+    time_min: Optional[datetime] = None,
+    time_max: Optional[datetime] = None,
+    *,
+    calendar_ids: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    """Mirrored events overlapping ``[time_min, time_max)``, ordered by start time."""
+    clauses: List[str] = []
+    params: List[object] = []
+    if time_min is not None:
+        clauses.append("end_ts > ?")
+        params.append(time_min.timestamp())
+    if time_max is not None:
+        clauses.append("start_ts < ?")
+        params.append(time_max.timestamp())
+    if calendar_ids is not None:
+        ids = list(calendar_ids)
+        clauses.append(f"calendar_id IN ({','.join('?' for _ in ids)})")
+        params.extend(ids)
+    sql = "SELECT event_json FROM CalendarEvent"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY start_ts, event_id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with _connect() as con:
+        cur = con.cursor()
+        cur.execute(sql, params)
+        return [json.loads(row[0]) for row in cur.fetchall()]
+
+
+def _event_bounds(event: dict) -> tuple:
+    """Start and end of a Calendar event as POSIX timestamps."""
+    return _event_time(event.get("start") or {}), _event_time(event.get("end") or {})
+
+
+def _event_time(value: dict) -> Optional[float]:
+    raw = value.get("dateTime") or value.get("date")
+    if not raw:
+        return None
+    # All-day dates parse as naive midnight, which ``timestamp`` reads as local time.
+    return datetime.fromisoformat(raw.replace("Z", "+00:00")).timestamp()
+
+
+def get_cached_analysis(cache_key: str) -> Optional[str]:
+    """Return the cached analysis JSON for ``cache_key`` and mark it as recently used."""
+    with _connect() as con:
+        cur = con.cursor()
+        cur.execute("SELECT analysis_json FROM AnalysisCache WHERE cache_key=?", (cache_key,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        cur.execute(
+            "UPDATE AnalysisCache SET last_used_at=? WHERE cache_key=?",
+            (datetime.utcnow().isoformat(), cache_key),
+        )
+        con.commit()
+        return row[0]
+
+
+def store_cached_analysis(
+    cache_key: str,
+    prompt_version: str,
+    model: str,
+    analysis_json: str,
+    *,
+    max_entries: int,
+) -> int:
+    """Insert a cache entry and evict least-recently-used rows beyond ``max_entries``.
+
+    Returns the number of evicted rows.
+    """
+    now = datetime.utcnow().isoformat()
+    with _connect() as con:
+        cur = con.cursor()
+        cur.execute(
+            """INSERT OR REPLACE INTO AnalysisCache(
+            cache_key, prompt_version, model, analysis_json, created_at, last_used_at
+        ) VALUES(?,?,?,?,?,?)""",
+            (cache_key, prompt_version, model, analysis_json, now, now),
+        )
+        cur.execute(
+            """DELETE FROM AnalysisCache WHERE cache_key IN (
+            SELECT cache_key FROM AnalysisCache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+        )""",
+            (max_entries,),
+        )
+        evicted = cur.rowcount
+        con.commit()
+        return max(evicted, 0)
+
+
+def purge_analysis_cache(*, keep_prompt_versions: Optional[Iterable[str]] = None) -> int:
+    """Delete cached analyses, keeping entries of ``keep_prompt_versions`` when given."""
+    with _connect() as con:
+        cur = con.cursor()
+        if keep_prompt_versions is None:
+            cur.execute("DELETE FROM AnalysisCache")
+        else:
+            keep = sorted(set(keep_prompt_versions))
+            placeholders = ",".join("?" * len(keep))
+            cur.execute(f"DELETE FROM AnalysisCache WHERE prompt_version NOT IN ({placeholders})", keep)
+        deleted = cur.rowcount
+        con.commit()
+        return max(deleted, 0)
+
+
 def store_processed_email_snapshot(email) -> None:
     from services.email_processor import ProcessedEmail
 
@@ -229,6 +457,47 @@ def load_recent_processed(limit_per_category: int) -> Dict[str, List["ProcessedE
     return result
 
 
+def load_processed_snapshots(message_ids: Iterable[str]) -> Dict[str, "ProcessedEmail"]:
+    """Return stored snapshots for whichever of ``message_ids`` were already processed."""
+    from services.email_processor import ProcessedEmail
+
+    ids = list(dict.fromkeys(message_ids))
+    result: Dict[str, ProcessedEmail] = {}
+    with _connect() as con:
+        cur = con.cursor()
+        # Stay well below SQLite's default limit on bound parameters.
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            placeholders = ",".join("?" for _ in chunk)
+            cur.execute(
+                f"SELECT message_id, payload FROM ProcessedEmailSnapshot WHERE message_id IN ({placeholders})",
+                chunk,
+            )
+            for message_id, payload in cur.fetchall():
+                result[message_id] = ProcessedEmail.from_json(payload)
+    return result
+
+
+def load_sender_categories(senders: Iterable[str]) -> Dict[str, Dict[str, int]]:
+    """Count stored snapshot classifications per sender, for cheap category guesses."""
+    unique = list(dict.fromkeys(sender for sender in senders if sender))
+    result: Dict[str, Dict[str, int]] = {}
+    with _connect() as con:
+        cur = con.cursor()
+        for start in range(0, len(unique), 500):
+            chunk = unique[start : start + 500]
+            placeholders = ",".join("?" for _ in chunk)
+            cur.execute(
+                f"""SELECT sender, category, COUNT(*) FROM ProcessedEmailSnapshot
+                WHERE sender IN ({placeholders})
+                GROUP BY sender, category""",
+                chunk,
+            )
+            for sender, category, count in cur.fetchall():
+                result.setdefault(sender, {})[category] = count
+    return result
+
+
 def search_processed_emails(query: str, limit: int = 10) -> List["ProcessedEmail"]:
     from services.email_processor import ProcessedEmail
 
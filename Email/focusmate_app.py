@@ -9,13 +9,17 @@ from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 from config import DEFAULT_BACKFILL_WINDOW_DAYS, DEFAULT_POLL_INTERVAL, DEFAULT_UNREAD_WINDOW_DAYS
-from db import initialize_database
+from db import get_sync_state, initialize_database, set_sync_state
 from services.email_processor import EmailProcessor, ProcessedEmail, process_messages
-from tools import GmailClient, build_query, list_message_ids
+from services.triage import collect_by_category
+from tools import GmailClient, HistoryExpiredError, build_query, list_message_ids, list_message_threads
+from tools.rate_limit import status_code
 
 
 load_dotenv()
 
+HISTORY_STATE_KEY = "gmail_history_id"
+
 
 @dataclass
 class RunConfig:
@@ -26,26 +30,96 @@ class RunConfig:
     extra_query: str = ""
     summary: bool = False
     limit: int = 3
+    history_sync: bool = True
+    reanalyze: bool = False
+    fused: bool = False
+    threads: bool = False
 
 
 class FocusMateApp:
-    def __init__(self, processor: Optional[EmailProcessor] = None) -> None:
+    def __init__(
+        self,
+        processor: Optional[EmailProcessor] = None,
+        *,
+        reanalyze: bool = False,
+        thread_mode: bool = False,
+    ) -> None:
         self.processor = processor or EmailProcessor()
         self.gmail_client = self.processor.gmail
+        self.reanalyze = reanalyze
+        self.thread_mode = thread_mode
 
     def run_backfill(self, days: int, *, extra_query: str = "") -> None:
         query = build_query(include_read=True, days=days, extra=extra_query)
-        message_ids = list_message_ids(self.gmail_client, query, limit=10)
-        for processed in process_messages(message_ids, mark_as_read=False, processor=self.processor):
-            self._print_result(processed)
+        self._process_query(query, mark_as_read=False)
 
     def run_unread(self, days: int, *, extra_query: str = "", include_read: bool = False) -> None:
         query = build_query(include_read=include_read, days=days, extra=extra_query)
-        message_ids = list_message_ids(self.gmail_client, query, limit=10)
-        mark_as_read = not include_read
-        for processed in process_messages(message_ids, mark_as_read=mark_as_read, processor=self.processor):
+        self._process_query(query, mark_as_read=not include_read)
+
+    def _process_query(self, query: str, *, mark_as_read: bool) -> None:
+        threads = None
+        if self.thread_mode:
+            threads = list_message_threads(self.gmail_client, query, limit=10)
+            message_ids = list(threads)
+        else:
+            message_ids = list_message_ids(self.gmail_client, query, limit=10)
+        for processed in process_messages(
+            message_ids,
+            mark_as_read=mark_as_read,
+            processor=self.processor,
+            reanalyze=self.reanalyze,
+            threads=threads,
+        ):
             self._print_result(processed)
 
+    def run_incremental(self, days: int, *, extra_query: str = "") -> None:
+        """Process only messages added since the last stored Gmail historyId.
+
+        Falls back to a full ``run_unread``-style scan of every unread message in the
+        window when no historyId is stored yet or Gmail reports that the stored one has
+        expired. History deltas are filtered to the Primary inbox; ``extra_query`` only
+        applies to the fallback scan. The stored historyId only advances once every
+        listed message has been processed, so skipped ones are listed again next poll.
+        """
+        start_history_id = get_sync_state(HISTORY_STATE_KEY)
+        threads = None
+        latest_history_id = None
+        if start_history_id:
+            try:
+                threads, latest_history_id = self.gmail_client.list_history_threads(start_history_id)
+            except HistoryExpiredError:
+                print("Stored Gmail history expired; running a full scan.")
+        if threads is None:
+            # Capture the historyId before listing so nothing added mid-scan is missed.
+            # No cap: anything left unlisted would predate the stored historyId and never be seen again.
+            latest_history_id = self.gmail_client.get_profile().get("historyId")
+            query = build_query(include_read=False, days=days, extra=extra_query)
+            threads = list_message_threads(self.gmail_client, query)
+        done = set()
+        for processed in process_messages(
+            list(threads),
+            mark_as_read=True,
+            processor=self.processor,
+            reanalyze=self.reanalyze,
+            threads=threads if self.thread_mode else None,
+        ):
+            done.add(processed.message_id)
+            self._print_result(processed)
+        # Messages deleted since they were listed would otherwise hold the historyId back forever.
+        skipped = [message_id for message_id in threads if message_id not in done and self._message_exists(message_id)]
+        if skipped:
+            print(f"{len(skipped)} message(s) could not be processed; they will be retried on the next poll.")
+        elif latest_history_id:
+            set_sync_state(HISTORY_STATE_KEY, str(latest_history_id))
+
+    def _message_exists(self, message_id: str) -> bool:
+        try:
+            self.gmail_client.get_message(message_id, fmt="minimal")
+        except Exception as exc:
+            return status_code(exc) != 404
+        return True
+
     def _print_result(self, processed):
         timestamp = f" [{processed.received_at}]" if processed.received_at else ""
         print(f"[{processed.priority_bucket}] ({processed.classification.upper()}){timestamp} {processed.subject}")
@@ -61,13 +135,23 @@ class FocusMateApp:
         print(f"  Priority reasoning: {processed.priority_reasoning}")
         print()
 
-    def run_polling(self, days: int, *, interval_minutes: int, extra_query: str = "") -> None:
+    def run_polling(
+        self,
+        days: int,
+        *,
+        interval_minutes: int,
+        extra_query: str = "",
+        history_sync: bool = True,
+    ) -> None:
         if interval_minutes <= 0:
             raise ValueError("Polling interval must be greater than zero minutes.")
         print(f"Starting polling every {interval_minutes} minute(s). Press Ctrl+C to stop.")
         try:
             while True:
-                self.run_unread(days, extra_query=extra_query, include_read=False)
+                if history_sync:
+                    self.run_incremental(days, extra_query=extra_query)
+                else:
+                    self.run_unread(days, extra_query=extra_query, include_read=False)
                 time.sleep(interval_minutes * 60)
         except KeyboardInterrupt:
             print("Polling interrupted by user.")
@@ -107,26 +191,22 @@ class FocusMateApp:
         extra_query: str,
         max_total: int = 10,
     ) -> Dict[str, List[ProcessedEmail]]:
-        categorized: Dict[str, List[ProcessedEmail]] = {"task": [], "article": [], "instruction": []}
         query = build_query(include_read=include_read, days=days, extra=extra_query)
         max_messages = min(limit_per_category * 6, max_total)
-        processed_count = 0
-
-        for message_id in list_message_ids(self.gmail_client, query, limit=max_messages):
-            if processed_count >= max_messages:
-                break
-            processed = self.processor.process_message(message_id, mark_as_read=False)
-            processed_count += 1
-            if processed is None:
-                continue
-            bucket = processed.classification
-            if bucket not in categorized:
-                continue
-            if len(categorized[bucket]) >= limit_per_category:
-                continue
-            categorized[bucket].append(processed)
-            if all(len(items) >= limit_per_category for items in categorized.values()):
-                break
+        threads = None
+        if self.thread_mode:
+            threads = list_message_threads(self.gmail_client, query, limit=max_messages)
+            message_ids = list(threads)
+        else:
+            message_ids = list_message_ids(self.gmail_client, query, limit=max_messages)
+        categorized, _ = collect_by_category(
+            self.processor,
+            message_ids,
+            limit_per_category=limit_per_category,
+            max_processed=max_messages,
+            reanalyze=self.reanalyze,
+            threads=threads,
+        )
         return categorized
 
 
@@ -139,6 +219,10 @@ def parse_args() -> RunConfig:
     parser.add_argument("--summary", action="store_true", help="Print categorized summary to the console without marking emails as read")
     parser.add_argument("--include-read", action="store_true", help="Include read emails when building summaries or processing unread")
     parser.add_argument("--limit", type=int, default=3, help="Emails per category to display in summary mode (default: 3)")
+    parser.add_argument("--fused", action="store_true", help="Analyse and prioritize each email in a single LLM call")
+    parser.add_argument("--threads", action="store_true", help="Analyse each Gmail conversation once instead of every message in it")
+    parser.add_argument("--reanalyze", action="store_true", help="Re-run analysis for emails that already have a cached result")
+    parser.add_argument("--full-poll", action="store_true", help="Re-list the whole query window on every poll instead of using Gmail history sync")
     args = parser.parse_args()
 
     return RunConfig(
@@ -149,13 +233,21 @@ def parse_args() -> RunConfig:
         summary=args.summary,
         include_read=args.include_read,
         limit=max(1, args.limit),
+        history_sync=not args.full_poll,
+        reanalyze=args.reanalyze,
+        fused=args.fused,
+        threads=args.threads,
     )
 
 
 def main() -> None:
     initialize_database()
     config = parse_args()
-    app = FocusMateApp()
+    app = FocusMateApp(
+        EmailProcessor(fused=config.fused),
+        reanalyze=config.reanalyze,
+        thread_mode=config.threads,
+    )
 
     if config.summary:
         days = config.unread_days or DEFAULT_UNREAD_WINDOW_DAYS
@@ -181,6 +273,7 @@ def main() -> None:
                 config.unread_days,
                 interval_minutes=config.poll_interval_minutes,
                 extra_query=config.extra_query,
+                history_sync=config.history_sync,
             )
     elif not config.backfill_days:
         app.run_unread(DEFAULT_UNREAD_WINDOW_DAYS, extra_query=config.extra_query)
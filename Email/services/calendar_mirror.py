@@ -0,0 +1,159 @@
+"""Local SQLite mirror of Google Calendar kept current with incremental sync."""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+from db import apply_calendar_events, get_sync_state, query_calendar_events, set_sync_state
+from tools.calendar_client import CalendarClient
+from tools.rate_limit import status_code
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_INTERVAL_SECONDS = 300.0
+# SyncState key holding when the last sync round in which at least one calendar
+# synced finished (UTC ISO). Each calendar also records its own time under
+# calendar_synced_key(); Plan and the voice server only trust calendars whose own
+# time is recent, so one failing calendar does not make the whole mirror stale.
+SYNCED_AT_KEY = "calendar_mirror:synced_at"
+
+
+def calendar_synced_key(calendar_id: str) -> str:
+    return f"calendar_mirror:{calendar_id}:synced_at"
+
+
+def sync_interval() -> float:
+    """Seconds between background syncs (``FOCUSMATE_CALENDAR_SYNC_SECONDS``)."""
+    try:
+        return max(10.0, float(os.getenv("FOCUSMATE_CALENDAR_SYNC_SECONDS", DEFAULT_SYNC_INTERVAL_SECONDS)))
+    except ValueError:
+        return DEFAULT_SYNC_INTERVAL_SECONDS
+
+
+class CalendarMirror:
+    """Keeps the ``CalendarEvent`` table in step with Google Calendar.
+
+    The first sync of each calendar downloads every event and stores the
+    ``nextSyncToken``; later syncs only fetch what changed since. Reads never
+    touch the network.
+    """
+
+    def __init__(
+        self,
+        calendar: Optional[CalendarClient] = None,
+        *,
+        calendar_ids: Optional[Sequence[str]] = None,
+    ) -> None:
+        self.calendar = calendar or CalendarClient()
+        self._calendar_ids = list(calendar_ids) if calendar_ids else None
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sync(self) -> int:
+        """Bring every mirrored calendar up to date; return the number of rows changed."""
+        with self._sync_lock:
+            changed = 0
+            synced_any = False
+            for calendar_id in self._resolve_calendar_ids():
+                try:
+                    changed += self._sync_calendar(calendar_id)
+                except Exception as exc:  # pragma: no cover - network dependent
+                    logger.warning("Calendar mirror sync failed for %s: %s", calendar_id, exc)
+                    continue
+                synced_any = True
+                set_sync_state(calendar_synced_key(calendar_id), datetime.now(timezone.utc).isoformat())
+            if synced_any:
+                set_sync_state(SYNCED_AT_KEY, datetime.now(timezone.utc).isoformat())
+            return changed
+
+    def is_synced(self, calendar_ids: Optional[Sequence[str]] = None) -> bool:
+        """True once every calendar in ``calendar_ids`` (any calendar when ``None``) has synced."""
+        if calendar_ids is None:
+            return get_sync_state(SYNCED_AT_KEY) is not None
+        return all(get_sync_state(calendar_synced_key(calendar_id)) is not None for calendar_id in calendar_ids)
+
+    def events(
+        self,
+        *,
+        time_min: Optional[datetime] = None,
+        time_max: Optional[datetime] = None,
+        max_results: Optional[int] = None,
+        calendar_ids: Optional[Sequence[str]] = None,
+    ) -> List[dict]:
+        """Mirrored events overlapping the range, syncing first if those calendars never synced.
+
+        ``calendar_ids`` limits the result to those calendars (all mirrored ones when ``None``).
+        """
+        if not self.is_synced(calendar_ids):
+            self.sync()
+        return query_calendar_events(time_min, time_max, calendar_ids=calendar_ids, limit=max_results)
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Sync now and then every ``interval`` seconds on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval or sync_interval(),), name="calendar-mirror", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.is_set():
+            try:
+                changed = self.sync()
+                logger.debug("Calendar mirror synced (%d changes)", changed)
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.warning("Calendar mirror sync failed: %s", exc)
+            self._stop.wait(interval)
+
+    def _resolve_calendar_ids(self) -> List[str]:
+        if self._calendar_ids is not None:
+            return self._calendar_ids
+        try:
+            return self.calendar.list_calendar_ids() or ["primary"]
+        except Exception as exc:  # pragma: no cover - network dependent
+            logger.warning("Could not list calendars, mirroring primary only: %s", exc)
+            return ["primary"]
+
+    def _sync_calendar(self, calendar_id: str) -> int:
+        token_key = f"calendar_mirror:{calendar_id}:sync_token"
+        sync_token = get_sync_state(token_key)
+        try:
+            events, next_token = self.calendar.sync_events(calendar_id=calendar_id, sync_token=sync_token)
+        except Exception as exc:
+            if not sync_token or status_code(exc) != 410:
+                raise
+            # The token expired; Google requires a fresh full sync.
+            logger.info("Calendar sync token for %s expired; running a full sync", calendar_id)
+            sync_token = None
+            events, next_token = self.calendar.sync_events(calendar_id=calendar_id)
+        changed = apply_calendar_events(calendar_id, events, replace=sync_token is None)
+        if next_token:
+            set_sync_state(token_key, next_token)
+        return changed
+
+
+_mirror: Optional[CalendarMirror] = None
+_mirror_lock = threading.Lock()
+
+
+def get_calendar_mirror(calendar: Optional[CalendarClient] = None) -> CalendarMirror:
+    """Return the process-wide ``CalendarMirror``, creating it on first use."""
+    global _mirror
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = CalendarMirror(calendar)
+    return _mirror
@@ -0,0 +1,63 @@
+"""Calendar inserts collected during a refresh and sent together at the end."""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from services.email_processor import ProcessedEmail
+
+
+@dataclass
+class PendingCalendarWrite:
+    message_id: str
+    title: str
+    start_iso: str
+    end_iso: str
+    location: Optional[str] = None
+    processed: List["ProcessedEmail"] = field(default_factory=list)
+
+
+class CalendarWriteBatch:
+    """Thread-safe queue of calendar inserts, de-duplicated by message ID and start time.
+
+    Pass one to ``process_messages``; ``EmailProcessor.flush_calendar_writes`` sends
+    everything queued in as few Calendar batch requests as possible and updates
+    the processed emails that were waiting on an event.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], PendingCalendarWrite] = {}
+
+    def add(self, write: PendingCalendarWrite) -> None:
+        with self._lock:
+            self._pending.setdefault((write.message_id, write.start_iso), write)
+
+    def is_queued(self, message_id: str) -> bool:
+        with self._lock:
+            return any(key[0] == message_id for key in self._pending)
+
+    def attach(self, processed: "ProcessedEmail", *, message_id: Optional[str] = None) -> None:
+        """Remember ``processed`` so its notes can be updated once the event exists.
+
+        ``message_id`` names the email whose write it waits on, when that differs
+        from ``processed.message_id`` (thread members share one event).
+        """
+        owner = message_id or processed.message_id
+        with self._lock:
+            for (queued_id, _), write in self._pending.items():
+                if queued_id == owner:
+                    write.processed.append(processed)
+
+    def drain(self) -> List[PendingCalendarWrite]:
+        with self._lock:
+            writes = list(self._pending.values())
+            self._pending.clear()
+            return writes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
@@ -5,34 +5,55 @@ from __future__ import annotations
 import json
 import logging
 import re
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timedelta
-from typing import Iterable, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 from dotenv import load_dotenv
-from chains import EmailAnalysis, EmailAnalysisChain, build_email_analysis_chain
+from chains import EmailAnalysis, EmailAnalysisChain, FusedEmailAnalysis, build_email_analysis_chain
 from core.priority import (
     PriorityAgent,
     PriorityContext,
+    PriorityDecision,
     build_priority_agent,
     days_until,
+    heuristic_decision,
     is_vip,
 )
-from db import email_exists, insert_task, store_processed_email_snapshot, upsert_calendar_sync, upsert_email
+from db import (
+    apply_calendar_events,
+    email_exists,
+    insert_task,
+    load_calendar_syncs,
+    load_processed_snapshots,
+    store_processed_email_snapshot,
+    upsert_calendar_sync,
+    upsert_email,
+)
+from services.calendar_writes import CalendarWriteBatch, PendingCalendarWrite
 from tools import (
     CalendarClient,
     GmailClient,
-    create_deadline_hold,
+    compact_body,
+    count_tokens,
     decode_body,
     generate_logo_dalle,
     header,
     html_to_text,
 )
+from tools.calendar_client import build_event_body, deadline_hold
+from tools.email_utils import DEFAULT_BODY_TOKEN_BUDGET, truncate_to_tokens
+from chains.email_analysis import BODY_WINDOW_CHARS
 from langchain_openai import ChatOpenAI
 from config import OPENAI_MODEL, OPENAI_TEMPERATURE
 from dateutil import parser as date_parser
 from dateutil import tz
 
+if TYPE_CHECKING:
+    import asyncio
+
+    from services.pipeline import PipelineLimits
+
 
 load_dotenv()
 
@@ -69,6 +90,11 @@ TZ_ALIASES = {
     "PDT": "America/Los_Angeles",
 }
 DEFAULT_MEETING_DURATION_MINUTES = 45
+# Thread mode: how many earlier messages go into the digest, and tokens kept per message.
+THREAD_DIGEST_MESSAGES = 5
+THREAD_DIGEST_TOKENS = 80
+OWN_MESSAGE_LABELS = {"SENT", "DRAFT"}
+CALENDAR_QUEUED_NOTE = "Acknowledgement: Calendar event queued; it is created when this refresh finishes."
 
 
 THEME_IMAGES = {
@@ -144,6 +170,18 @@ class ProcessedEmail:
         )
 
 
+@dataclass
+class PreparedEmail:
+    """Headers and decoded body of a fetched message, ready for analysis."""
+
+    message_id: str
+    subject: str
+    sender: str
+    received_at: Optional[str]
+    body_text: str
+    thread_digest: str = ""
+
+
 class EmailProcessor:
     def __init__(
         self,
@@ -151,40 +189,150 @@ class EmailProcessor:
         calendar_client: Optional[CalendarClient] = None,
         analysis_chain: Optional[EmailAnalysisChain] = None,
         priority_agent: Optional[PriorityAgent] = None,
+        *,
+        fused: bool = False,
     ) -> None:
+        """``fused=True`` asks the analysis call for the priority decision too, skipping ``PriorityAgent``."""
         self.gmail = gmail_client or GmailClient()
         self.calendar = calendar_client or CalendarClient()
-        self.analysis_chain = analysis_chain or build_email_analysis_chain()
+        self.analysis_chain = analysis_chain or build_email_analysis_chain(fused=fused)
         self.priority_agent = priority_agent or build_priority_agent()
 
-    def process_message(self, message_id: str, *, mark_as_read: bool) -> Optional[ProcessedEmail]:
+    def process_message(
+        self,
+        message_id: str,
+        *,
+        mark_as_read: bool,
+        reanalyze: bool = False,
+    ) -> Optional[ProcessedEmail]:
+        if not reanalyze:
+            cached = load_processed_snapshots([message_id]).get(message_id)
+            if cached is not None:
+                if mark_as_read:
+                    self.gmail.modify_message(message_id, {"removeLabelIds": ["UNREAD"]})
+                return cached
         message = self.gmail.get_message(message_id, fmt="full")
+        return self.process_fetched_message(message, mark_as_read=mark_as_read)
+
+    def process_fetched_message(self, message: dict, *, mark_as_read: bool) -> Optional[ProcessedEmail]:
+        """Process a full-format Gmail message that has already been fetched."""
+        prepared = self.prepare_message(message)
+        analysis = self.analyze(prepared)
+        decision = self.prioritize(prepared, analysis)
+        return self.finalize(prepared, analysis, decision, mark_as_read=mark_as_read)
+
+    def prepare_message(self, message: dict) -> PreparedEmail:
         payload = message.get("payload", {})
         headers = payload.get("headers", [])
-
-        subject = header(headers, "Subject")
-        sender = header(headers, "From")
         received_ms = int(message.get("internalDate", "0"))
-        received_iso = datetime.utcfromtimestamp(received_ms / 1000).isoformat() + "Z"
-
         body_html = decode_body(payload)
-        body_text = html_to_text(body_html)
-
-        analysis: EmailAnalysis = self.analysis_chain.invoke(
-            subject=subject,
-            sender=sender,
-            body=body_text,
-            memories="",
+        return PreparedEmail(
+            message_id=message.get("id", ""),
+            subject=header(headers, "Subject"),
+            sender=header(headers, "From"),
+            received_at=datetime.utcfromtimestamp(received_ms / 1000).isoformat() + "Z",
+            body_text=html_to_text(body_html),
         )
 
+    def prepare_thread(self, thread: dict) -> Tuple[PreparedEmail, List[PreparedEmail]]:
+        """Pick the message to analyse for a thread and summarize the rest as a digest.
+
+        The newest message not sent by the user is analysed; earlier messages are
+        folded into ``thread_digest``. Returns the analysed message and every
+        message in the thread.
+        """
+        messages = sorted(thread.get("messages", []) or [], key=lambda item: int(item.get("internalDate", "0")))
+        received = [item for item in messages if not OWN_MESSAGE_LABELS & set(item.get("labelIds", []) or [])]
+        newest = (received or messages)[-1]
+        members = [self.prepare_message(item) for item in messages]
+        prepared = next(member for member in members if member.message_id == newest.get("id", ""))
+        earlier = [member for member in reversed(members) if member is not prepared][:THREAD_DIGEST_MESSAGES]
+        if earlier:
+            lines = [
+                f"- {member.sender} ({member.received_at}): "
+                + " ".join(compact_body(member.body_text, max_tokens=THREAD_DIGEST_TOKENS).split())
+                for member in earlier
+            ]
+            prepared.thread_digest = "\n".join(lines)
+        return prepared, members
+
+    def attach_thread_result(
+        self,
+        processed: ProcessedEmail,
+        members: List[PreparedEmail],
+    ) -> Dict[str, ProcessedEmail]:
+        """Store ``processed`` as the snapshot of every message in its thread."""
+        results: Dict[str, ProcessedEmail] = {processed.message_id: processed}
+        for member in members:
+            if member.message_id in results:
+                continue
+            copy = replace(
+                processed,
+                message_id=member.message_id,
+                subject=member.subject or processed.subject,
+                sender=member.sender,
+                received_at=member.received_at,
+                notes=list(processed.notes),
+            )
+            store_processed_email_snapshot(copy)
+            results[member.message_id] = copy
+        return results
+
+    def analyze(self, prepared: PreparedEmail) -> EmailAnalysis:
+        return self.analysis_chain.invoke(**self._analysis_input(prepared))
+
+    async def aanalyze(self, prepared: PreparedEmail) -> EmailAnalysis:
+        return await self.analysis_chain.ainvoke(**self._analysis_input(prepared))
+
+    def prioritize(self, prepared: PreparedEmail, analysis: EmailAnalysis) -> PriorityDecision:
+        context = self._priority_context(prepared, analysis)
+        if isinstance(analysis, FusedEmailAnalysis):
+            return self._fused_decision(analysis, context)
+        return self.priority_agent.decide(context)
+
+    async def aprioritize(self, prepared: PreparedEmail, analysis: EmailAnalysis) -> PriorityDecision:
+        context = self._priority_context(prepared, analysis)
+        if isinstance(analysis, FusedEmailAnalysis):
+            return self._fused_decision(analysis, context)
+        return await self.priority_agent.adecide(context)
+
+    def _analysis_input(self, prepared: PreparedEmail) -> Dict[str, str]:
+        body = prepared.body_text
+        if prepared.thread_digest:
+            body = self._with_thread_digest(body, prepared.thread_digest)
+        return {
+            "subject": prepared.subject,
+            "sender": prepared.sender,
+            "body": body,
+            "memories": "",
+        }
+
+    def _with_thread_digest(self, body: str, thread_digest: str) -> str:
+        """Newest body plus the thread digest, sized so the chain's own trimming keeps the digest.
+
+        The digest gets at most half of the analysis token budget (or character
+        window); the newest body is compacted to whatever is left.
+        """
+        digest = f"\n\nEarlier messages in this thread:\n{thread_digest}"
+        budget = getattr(self.analysis_chain, "body_token_budget", DEFAULT_BODY_TOKEN_BUDGET)
+        if budget is None:
+            digest = digest[: BODY_WINDOW_CHARS // 2]
+            return compact_body(body, max_tokens=None)[: BODY_WINDOW_CHARS - len(digest)] + digest
+        digest = truncate_to_tokens(digest, budget // 2)
+        # A few tokens of slack: tokenizing the joined text can differ at the seam
+        body_budget = max(1, budget - count_tokens(digest) - 8)
+        return compact_body(body, max_tokens=body_budget) + digest
+
+    @staticmethod
+    def _priority_context(prepared: PreparedEmail, analysis: EmailAnalysis) -> PriorityContext:
         has_deadline = analysis.deadline.has_deadline and bool(analysis.deadline.due_iso)
         due_iso = analysis.deadline.due_iso if has_deadline else None
         due_days = days_until(due_iso)
-        vip = is_vip(sender)
+        vip = is_vip(prepared.sender)
 
-        context = PriorityContext(
-            subject=subject,
-            sender=sender,
+        return PriorityContext(
+            subject=prepared.subject,
+            sender=prepared.sender,
             category=analysis.category,
             summary=analysis.summary or "",
             is_task=analysis.is_task,
@@ -197,7 +345,35 @@ class EmailProcessor:
             meeting=analysis.meeting.model_dump(),
         )
 
-        decision = self.priority_agent.decide(context)
+    @staticmethod
+    def _fused_decision(analysis: FusedEmailAnalysis, context: PriorityContext) -> PriorityDecision:
+        if analysis.priority_bucket is None or analysis.priority_score is None:
+            return heuristic_decision(context, "Fallback heuristic: fused analysis returned no priority decision.")
+        return PriorityDecision(
+            bucket=analysis.priority_bucket,
+            score=max(0, min(100, analysis.priority_score)),
+            reasoning=analysis.priority_reasoning or "",
+        )
+
+    def finalize(
+        self,
+        prepared: PreparedEmail,
+        analysis: EmailAnalysis,
+        decision: PriorityDecision,
+        *,
+        mark_as_read: bool,
+        calendar_writes: Optional[CalendarWriteBatch] = None,
+    ) -> Optional[ProcessedEmail]:
+        """Apply local hints, calendar/task actions and persistence for an analysed email.
+
+        With ``calendar_writes`` new calendar events are queued on it instead of
+        being created inline; see ``flush_calendar_writes``.
+        """
+        message_id = prepared.message_id
+        subject = prepared.subject
+        sender = prepared.sender
+        received_iso = prepared.received_at
+        body_text = prepared.body_text
         bucket = decision.bucket
         score = decision.score
 
@@ -244,17 +420,16 @@ class EmailProcessor:
             task_hint=task_hint,
             deadline_hint=deadline_hint,
             instruction_hint=instruction_hint,
+            calendar_writes=calendar_writes,
         )
 
         flowchart: Optional[str] = None
         flowchart_type: Optional[str] = None
         if classification == "task":
-            if event_id:
-                notes.append(f"Acknowledgement: Calendar event created (id: {event_id}).")
-                if event_link:
-                    notes.append(f"Calendar link: {event_link}")
+            if not event_id and calendar_writes is not None and calendar_writes.is_queued(message_id):
+                notes.append(CALENDAR_QUEUED_NOTE)
             else:
-                notes.append("Acknowledgement: Task captured for follow-up (calendar unavailable).")
+                notes.extend(calendar_notes(event_id, event_link))
             notes.append(f"ADHD-friendly summary: {analysis.summary or 'Focus on the key next step and timebox it.'}")
         elif classification == "instruction":
             flowchart, flowchart_type = build_flowchart(analysis.steps, analysis.summary or subject)
@@ -286,6 +461,8 @@ class EmailProcessor:
             summary=analysis.summary,
             calendar_event_link=event_link if classification == "task" else None,
         )
+        if calendar_writes is not None and classification == "task":
+            calendar_writes.attach(processed_email)
 
         store_processed_email_snapshot(processed_email)
 
@@ -325,6 +502,7 @@ class EmailProcessor:
         task_hint: bool,
         deadline_hint: bool,
         instruction_hint: bool,
+        calendar_writes: Optional[CalendarWriteBatch] = None,
     ) -> Tuple[str, Optional[str], Optional[str]]:
         effective_deadline = has_deadline or deadline_hint
         normalized_category = (analysis.category or "").strip().lower()
@@ -338,6 +516,7 @@ class EmailProcessor:
                 effective_deadline,
                 due_iso,
                 force=task_hint,
+                calendar_writes=calendar_writes,
             )
             return "task", event_id, event_link
 
@@ -364,6 +543,7 @@ class EmailProcessor:
                 effective_deadline,
                 due_iso,
                 force=True,
+                calendar_writes=calendar_writes,
             )
             return "task", event_id, event_link
 
@@ -379,6 +559,7 @@ class EmailProcessor:
         due_iso: Optional[str],
         *,
         force: bool = False,
+        calendar_writes: Optional[CalendarWriteBatch] = None,
     ) -> Tuple[Optional[str], Optional[str]]:
         should_track_task = force or analysis.is_task or analysis.category in TASK_CATEGORIES or has_deadline
         if should_track_task:
@@ -396,6 +577,7 @@ class EmailProcessor:
             analysis,
             has_deadline,
             due_iso,
+            calendar_writes=calendar_writes,
         )
         return event_id, event_link
 
@@ -406,45 +588,142 @@ class EmailProcessor:
         analysis: EmailAnalysis,
         has_deadline: bool,
         due_iso: Optional[str],
+        *,
+        calendar_writes: Optional[CalendarWriteBatch] = None,
     ) -> Tuple[Optional[str], Optional[str]]:
-        event_id = None
-        event_link = None
+        location: Optional[str] = None
         if analysis.meeting.has_meeting and analysis.meeting.start_iso and analysis.meeting.end_iso:
-            try:
-                event = self.calendar.create_event(
-                    analysis.title or subject,
-                    analysis.meeting.start_iso,
-                    analysis.meeting.end_iso,
-                    location=analysis.meeting.location or None,
-                )
-                event_id = event.get("id")
-                event_link = event.get("htmlLink")
-            except Exception as exc:  # pragma: no cover - tolerant fallback
-                logger.warning("Calendar event creation failed: %s", exc)
-                event_id = None
+            title, start_iso, end_iso = analysis.title or subject, analysis.meeting.start_iso, analysis.meeting.end_iso
+            location = analysis.meeting.location or None
         elif has_deadline and due_iso:
-            try:
-                event = create_deadline_hold(self.calendar, analysis.title or subject, due_iso)
-                event_id = event.get("id") if isinstance(event, dict) else None
-                event_link = event.get("htmlLink") if isinstance(event, dict) else None
-            except Exception as exc:  # pragma: no cover - tolerant fallback
-                logger.warning("Calendar deadline hold failed: %s", exc)
-                event_id = None
+            title, start_iso, end_iso = deadline_hold(analysis.title or subject, due_iso)
+        else:
+            return None, None
+
+        # Reprocessing must not create a second event for the same message and start time.
+        existing = load_calendar_syncs([message_id]).get(message_id)
+        if existing is not None and existing.start_iso in (None, start_iso):
+            return existing.event_id, existing.html_link
+
+        if calendar_writes is not None:
+            calendar_writes.add(PendingCalendarWrite(message_id, title, start_iso, end_iso, location))
+            return None, None
+
+        try:
+            event = self.calendar.create_event(title, start_iso, end_iso, location=location)
+        except Exception as exc:  # pragma: no cover - tolerant fallback
+            logger.warning("Calendar event creation failed: %s", exc)
+            return None, None
+        event_id = event.get("id")
+        event_link = event.get("htmlLink")
         if event_id:
-            upsert_calendar_sync(message_id, event_id)
+            upsert_calendar_sync(message_id, event_id, start_iso=start_iso, html_link=event_link)
         return event_id, event_link
 
+    def flush_calendar_writes(self, calendar_writes: CalendarWriteBatch) -> int:
+        """Create every queued event in Calendar batch requests and update the waiting emails.
+
+        Returns the number of events created; failed inserts leave the email marked
+        as captured without a calendar event. Created events are also written to the
+        local calendar mirror so ``/calendar/events`` shows them before its next sync.
+        """
+        writes = calendar_writes.drain()
+        if not writes:
+            return 0
+        bodies = [build_event_body(write.title, write.start_iso, write.end_iso, location=write.location) for write in writes]
+        try:
+            events = self.calendar.create_events(bodies)
+        except Exception as exc:  # pragma: no cover - tolerant fallback
+            logger.warning("Calendar batch insert failed: %s", exc)
+            events = [None] * len(writes)
+
+        created = 0
+        mirrored: List[dict] = []
+        for write, body, event in zip(writes, bodies, events):
+            event_id = event.get("id") if event else None
+            event_link = event.get("htmlLink") if event else None
+            if event_id:
+                upsert_calendar_sync(write.message_id, event_id, start_iso=write.start_iso, html_link=event_link)
+                # The next incremental sync replaces this with Google's full copy.
+                mirrored.append({**body, "id": event_id, "htmlLink": event_link, "status": "confirmed"})
+                created += 1
+            for processed in write.processed:
+                if CALENDAR_QUEUED_NOTE in processed.notes:
+                    index = processed.notes.index(CALENDAR_QUEUED_NOTE)
+                    processed.notes[index : index + 1] = calendar_notes(event_id, event_link)
+                processed.calendar_event_link = event_link
+                store_processed_email_snapshot(processed)
+        if mirrored:
+            try:
+                apply_calendar_events("primary", mirrored)
+            except Exception as exc:  # pragma: no cover - the mirror catches up on its next sync
+                logger.warning("Could not add new events to the calendar mirror: %s", exc)
+        return created
+
 
 def process_messages(
     message_ids: Iterable[str],
     *,
     mark_as_read: bool,
     processor: EmailProcessor,
+    ordered: bool = False,
+    reanalyze: bool = False,
+    threads: Optional[Mapping[str, str]] = None,
+    limits: Optional["PipelineLimits"] = None,
+    loop: Optional["asyncio.AbstractEventLoop"] = None,
+    calendar_writes: Optional[CalendarWriteBatch] = None,
 ) -> Iterable[ProcessedEmail]:
-    for message_id in message_ids:
-        processed = processor.process_message(message_id, mark_as_read=mark_as_read)
-        if processed:
-            yield processed
+    """Process messages through the concurrent staged pipeline.
+
+    Already-processed messages are served from their snapshot unless ``reanalyze``
+    is set. Passing ``threads`` (message ID → threadId, see ``list_message_threads``)
+    analyses each Gmail conversation once. Pass ``limits=PipelineLimits(1, 1, 1, 1)``
+    to process one message at a time. Passing a running event ``loop`` issues the
+    LLM calls as coroutines on it (see ``EmailPipeline.run``).
+
+    New calendar events are queued and created in one batch once the results have
+    been consumed. Pass your own ``calendar_writes`` to span several calls, and
+    flush it with ``processor.flush_calendar_writes``.
+    """
+    from services.pipeline import run_pipeline
+
+    owns_batch = calendar_writes is None
+    if calendar_writes is None:
+        calendar_writes = CalendarWriteBatch()
+    results = run_pipeline(
+        message_ids,
+        mark_as_read=mark_as_read,
+        processor=processor,
+        ordered=ordered,
+        reanalyze=reanalyze,
+        threads=threads,
+        limits=limits,
+        loop=loop,
+        calendar_writes=calendar_writes,
+    )
+    if not owns_batch:
+        return results
+    return _flush_when_done(results, processor, calendar_writes)
+
+
+def _flush_when_done(
+    results: Iterable[ProcessedEmail],
+    processor: EmailProcessor,
+    calendar_writes: CalendarWriteBatch,
+) -> Iterator[ProcessedEmail]:
+    try:
+        yield from results
+    finally:
+        processor.flush_calendar_writes(calendar_writes)
+
+
+def calendar_notes(event_id: Optional[str], event_link: Optional[str]) -> List[str]:
+    if not event_id:
+        return ["Acknowledgement: Task captured for follow-up (calendar unavailable)."]
+    notes = [f"Acknowledgement: Calendar event created (id: {event_id})."]
+    if event_link:
+        notes.append(f"Calendar link: {event_link}")
+    return notes
 
 
 def select_theme_image(summary: str) -> str:
@@ -2,9 +2,12 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+import threading
 import uuid
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from langchain_anthropic import ChatAnthropic
 from langchain_core.output_parsers import PydanticOutputParser
@@ -12,11 +15,15 @@ from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
 
+from chains.concurrency import llm_slot
 from config import OPENAI_MODEL, OPENAI_TEMPERATURE
 from db import insert_task, load_recent_processed, search_processed_emails
 from tools.calendar_client import CalendarClient
+from tools.rate_limit import governor
 from services.email_processor import ProcessedEmail
 
+logger = logging.getLogger(__name__)
+
 
 class EmailSearchOutput(BaseModel):
     answer: str = Field(description="Direct answer to the user's query using email context.")
@@ -65,7 +72,13 @@ EMAIL CONTEXT:
 
 
 class EmailSearchAgent:
-    def __init__(self) -> None:
+    """Search assistant that is safe to share between threads and requests.
+
+    The model client (and its HTTP connection pool) and the rendered prompt are
+    built once; the Calendar service comes from the shared Google service registry.
+    """
+
+    def __init__(self, calendar_client: Optional[CalendarClient] = None) -> None:
         self.parser = PydanticOutputParser(pydantic_object=EmailSearchOutput)
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -74,9 +87,16 @@ class EmailSearchAgent:
             ],
             template_format="jinja2",
         ).partial(format_instructions=self.parser.get_format_instructions())
-        self.model = ChatOpenAI(model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE)
+        self.model = ChatOpenAI(model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE, max_retries=0)
         self.prompt_chain = prompt | self.model
-        self.calendar = CalendarClient()
+        self.calendar = calendar_client or CalendarClient()
+
+    def warm(self) -> None:
+        """Load credentials and build the Calendar service ahead of the first request."""
+        try:
+            self.calendar.service
+        except Exception as exc:  # pragma: no cover - calendar actions are optional
+            logger.warning("Calendar warm-up failed; search will still work: %s", exc)
 
     def _build_context(self, query: str, limit: int) -> Tuple[str, List[str]]:
         aggregated = load_recent_processed(limit)
@@ -144,7 +164,27 @@ class EmailSearchAgent:
 
     def search(self, query: str, *, limit: int = 12) -> EmailSearchOutput:
         context, candidate_ids = self._build_context(query, limit)
-        response = self.prompt_chain.invoke({"query": query, "context": context})
+        payload = {"query": query, "context": context}
+        response = governor("openai").call(lambda: self.prompt_chain.invoke(payload))
+        output = self._parse_output(response, candidate_ids)
+        self._maybe_execute_actions(output)
+        return output
+
+    async def asearch(self, query: str, *, limit: int = 12) -> EmailSearchOutput:
+        """Async ``search``; the model call waits for a slot on the shared LLM semaphore."""
+        context, candidate_ids = await asyncio.to_thread(self._build_context, query, limit)
+        payload = {"query": query, "context": context}
+        async with llm_slot():
+            response = await governor("openai").acall(lambda: self.prompt_chain.ainvoke(payload))
+        output = self._parse_output(response, candidate_ids)
+        await asyncio.to_thread(self._maybe_execute_actions, output)
+        return output
+
+    async def abatch(self, queries: Sequence[str], *, limit: int = 12) -> List[EmailSearchOutput]:
+        """Answer several queries concurrently."""
+        return await asyncio.gather(*(self.asearch(query, limit=limit) for query in queries))
+
+    def _parse_output(self, response: Any, candidate_ids: List[str]) -> EmailSearchOutput:
         if hasattr(response, "content"):
             text = response.content
         else:
@@ -163,7 +203,6 @@ class EmailSearchAgent:
 
         if not output.referenced_messages:
             output.referenced_messages = candidate_ids[:3]
-        self._maybe_execute_actions(output)
         return output
 
     def _maybe_execute_actions(self, output: EmailSearchOutput) -> None:
@@ -204,6 +243,30 @@ class EmailSearchAgent:
             output.follow_up_question = "What title and deadline should I use for the task?"
 
 
+_agent_lock = threading.Lock()
+_agent: Optional[EmailSearchAgent] = None
+
+
+def get_email_search_agent() -> EmailSearchAgent:
+    """Return the process-wide ``EmailSearchAgent``, creating it on first use."""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = EmailSearchAgent()
+    return _agent
+
+
+def warm_email_search_agent() -> EmailSearchAgent:
+    """Create and warm the shared agent; call at startup so the first request skips the setup."""
+    agent = get_email_search_agent()
+    agent.warm()
+    return agent
+
+
 def run_email_search(query: str, limit: int = 12) -> EmailSearchOutput:
-    agent = EmailSearchAgent()
-    return agent.search(query, limit=limit)
+    return get_email_search_agent().search(query, limit=limit)
+
+
+async def arun_email_search(query: str, limit: int = 12) -> EmailSearchOutput:
+    return await get_email_search_agent().asearch(query, limit=limit)
@@ -0,0 +1,385 @@
+"""Concurrent staged execution of the email processing workflow."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from db import load_processed_snapshots
+from services.calendar_writes import CalendarWriteBatch
+from services.email_processor import EmailProcessor, PreparedEmail, ProcessedEmail
+from tools import MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_SKIPPED = object()
+ASYNC_STAGES = ("analysis", "priority")
+
+
+@dataclass
+class PipelineLimits:
+    """Worker counts per stage.
+
+    The Gmail stage (batched fetches and mark-as-read) and the persistence stage
+    (SQLite and Calendar writes) default to one worker to stay well inside
+    per-user Google quotas; each worker thread gets its own transport from the
+    Google service registry, so both can be raised safely. When the
+    pipeline runs its LLM stages on an event loop, ``analysis`` and ``priority``
+    are unused and the shared LLM semaphore bounds concurrency instead.
+    """
+
+    fetch: int = 1
+    analysis: int = 4
+    priority: int = 4
+    persistence: int = 1
+
+
+class EmailPipeline:
+    """Run fetch → analysis → priority → persistence with a thread pool per stage.
+
+    Messages move to the next stage as soon as their previous stage finishes, so
+    LLM calls for different emails overlap instead of running back to back. Each
+    ``run`` starts and stops its own stage pools; use the pipeline as a context
+    manager to share one set of pools across several runs.
+    """
+
+    def __init__(
+        self,
+        processor: EmailProcessor,
+        *,
+        limits: Optional[PipelineLimits] = None,
+        batch_size: int = MAX_BATCH_SIZE,
+    ) -> None:
+        self.processor = processor
+        self.limits = limits or PipelineLimits()
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self._pools: Optional[Dict[str, ThreadPoolExecutor]] = None
+
+    def __enter__(self) -> "EmailPipeline":
+        self._pools = {}
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pools, self._pools = self._pools or {}, None
+        for pool in pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _stage_pools(self, stages: Iterable[str]) -> Tuple[Dict[str, ThreadPoolExecutor], bool]:
+        """Pools for ``stages`` and whether the caller owns (and must shut down) them."""
+        owned = self._pools is None
+        pools = {} if owned else self._pools
+        for stage in stages:
+            if stage not in pools:
+                pools[stage] = ThreadPoolExecutor(
+                    max_workers=max(1, getattr(self.limits, stage)), thread_name_prefix=f"email-{stage}"
+                )
+        return pools, owned
+
+    def run(
+        self,
+        message_ids: Iterable[str],
+        *,
+        mark_as_read: bool,
+        ordered: bool = False,
+        reanalyze: bool = False,
+        threads: Optional[Mapping[str, str]] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        calendar_writes: Optional[CalendarWriteBatch] = None,
+    ) -> Iterator[ProcessedEmail]:
+        """Yield processed emails as they complete.
+
+        Messages that already have a stored snapshot are served from it without a
+        Gmail fetch or LLM call unless ``reanalyze`` is set. With ``ordered=True``
+        results are yielded in the order of ``message_ids``. Passing ``threads``
+        (message ID → threadId) enables thread mode: each thread is fetched once
+        via ``threads.get``, analysed once, and the result is yielded for every
+        listed message in it. Passing ``loop`` runs the analysis and priority
+        stages as coroutines on that (already running) event loop via
+        ``ainvoke``, instead of blocking a worker thread per LLM call; the
+        generator itself must then be consumed from another thread. New calendar
+        events are queued on ``calendar_writes`` when given; the caller flushes it.
+        Closing the generator early cancels work that has not started yet and waits
+        for persistence already in progress. The first stage error is re-raised to
+        the caller.
+        """
+        ids = list(dict.fromkeys(message_ids))
+        if not ids:
+            return
+        positions = {message_id: index for index, message_id in enumerate(ids)}
+        results: "queue.Queue[tuple[int, object]]" = queue.Queue()
+        stop = threading.Event()
+        in_flight: Dict[Future, str] = {}
+        stages = ("fetch", "persistence") if loop is not None else ("fetch", "analysis", "priority", "persistence")
+        pools, owns_pools = self._stage_pools(stages)
+        if loop is None:
+            analyze_message, analyze_thread = self._prepare_and_analyze, self._prepare_and_analyze_thread
+            prioritize = self.processor.prioritize
+        else:
+            analyze_message, analyze_thread = self._aprepare_and_analyze, self._aprepare_and_analyze_thread
+            prioritize = self.processor.aprioritize
+
+        def submit(stage: str, index: int, fn: Callable, *args, then: Optional[Callable] = None) -> None:
+            if stop.is_set():
+                return
+            if loop is not None and stage in ASYNC_STAGES:
+                coroutine = fn(*args)
+                try:
+                    future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+                except RuntimeError:  # event loop already closed
+                    coroutine.close()
+                    return
+            else:
+                try:
+                    future = pools[stage].submit(fn, *args)
+                except RuntimeError:  # executor already shut down by an early close
+                    return
+            in_flight[future] = stage
+            future.add_done_callback(lambda done: in_flight.pop(done, None))
+
+            def _done(done: Future) -> None:
+                if stop.is_set() or done.cancelled():
+                    return
+                exc = done.exception()
+                if exc is not None:
+                    results.put((index, exc))
+                    return
+                if then is not None:
+                    try:
+                        then(done.result())
+                    except Exception as callback_exc:  # surface instead of letting the consumer block
+                        results.put((index, callback_exc))
+
+            future.add_done_callback(_done)
+
+        def on_fetched(
+            chunk: List[str],
+            cached: Dict[str, ProcessedEmail],
+            fetched: Dict[str, dict],
+            thread_groups: Dict[str, Tuple[Optional[dict], List[str]]],
+        ) -> None:
+            for message_id in cached:
+                on_finalized(positions[message_id], cached[message_id])
+            for thread, members in thread_groups.values():
+                indexes = [positions[member] for member in members]
+                if thread is None:
+                    for index in indexes:
+                        results.put((index, _SKIPPED))
+                    continue
+                submit(
+                    "analysis",
+                    indexes[0],
+                    analyze_thread,
+                    thread,
+                    then=lambda outcome, members=members: on_thread_analyzed(members, *outcome),
+                )
+            if threads is not None:
+                return
+            for message_id in chunk:
+                if message_id in cached:
+                    continue
+                index = positions[message_id]
+                message = fetched.get(message_id)
+                if message is None:
+                    results.put((index, _SKIPPED))
+                    continue
+                submit(
+                    "analysis",
+                    index,
+                    analyze_message,
+                    message,
+                    then=lambda outcome, index=index: on_analyzed(index, *outcome),
+                )
+
+        def on_analyzed(index: int, prepared: PreparedEmail, analysis) -> None:
+            submit(
+                "priority",
+                index,
+                prioritize,
+                prepared,
+                analysis,
+                then=lambda decision: submit(
+                    "persistence",
+                    index,
+                    self._finalize,
+                    prepared,
+                    analysis,
+                    decision,
+                    calendar_writes,
+                    then=lambda processed: on_finalized(index, processed),
+                ),
+            )
+
+        def on_thread_analyzed(members: List[str], prepared: PreparedEmail, thread_members, analysis) -> None:
+            index = positions[members[0]]
+
+            def fan_out(processed: Optional[ProcessedEmail]) -> None:
+                if processed is None:
+                    for member in members:
+                        results.put((positions[member], _SKIPPED))
+                    return
+                attached = self.processor.attach_thread_result(processed, thread_members)
+                if calendar_writes is not None:
+                    for member_email in attached.values():
+                        if member_email is not processed:
+                            calendar_writes.attach(member_email, message_id=processed.message_id)
+                for member in members:
+                    on_finalized(positions[member], attached.get(member))
+
+            submit(
+                "priority",
+                index,
+                prioritize,
+                prepared,
+                analysis,
+                then=lambda decision: submit(
+                    "persistence",
+                    index,
+                    self._finalize,
+                    prepared,
+                    analysis,
+                    decision,
+                    calendar_writes,
+                    then=fan_out,
+                ),
+            )
+
+        def on_finalized(index: int, processed: Optional[ProcessedEmail]) -> None:
+            if processed is not None and mark_as_read:
+                # Route back through the Gmail stage so mark-as-read shares its concurrency budget.
+                submit(
+                    "fetch",
+                    index,
+                    self.processor.gmail.modify_message,
+                    processed.message_id,
+                    {"removeLabelIds": ["UNREAD"]},
+                    then=lambda _: results.put((index, processed)),
+                )
+            else:
+                results.put((index, processed if processed is not None else _SKIPPED))
+
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start : start + self.batch_size]
+            first = positions[chunk[0]]
+            submit(
+                "fetch",
+                first,
+                self._fetch_chunk,
+                chunk,
+                reanalyze,
+                threads,
+                then=lambda outcome, chunk=chunk: on_fetched(chunk, *outcome),
+            )
+
+        try:
+            yield from self._drain(results, len(ids), ordered=ordered)
+        finally:
+            stop.set()
+            # Persistence work already running may still queue calendar writes; let it
+            # finish so the caller's flush (which runs after this) sees every write.
+            persisting = [
+                future for future, stage in list(in_flight.items()) if not future.cancel() and stage == "persistence"
+            ]
+            if owns_pools:
+                for name, pool in pools.items():
+                    pool.shutdown(wait=name == "persistence", cancel_futures=True)
+            else:
+                wait(persisting)
+
+    def _fetch_chunk(
+        self,
+        chunk: List[str],
+        reanalyze: bool,
+        threads: Optional[Mapping[str, str]],
+    ) -> Tuple[Dict[str, ProcessedEmail], Dict[str, dict], Dict[str, Tuple[Optional[dict], List[str]]]]:
+        cached = {} if reanalyze else load_processed_snapshots(chunk)
+        missing = [message_id for message_id in chunk if message_id not in cached]
+        if not missing:
+            return cached, {}, {}
+        if threads is None:
+            return cached, self.processor.gmail.get_messages(missing), {}
+        members: Dict[str, List[str]] = {}
+        for message_id in missing:
+            members.setdefault(threads.get(message_id, message_id), []).append(message_id)
+        fetched_threads = self.processor.gmail.get_threads(list(members))
+        groups = {thread_id: (fetched_threads.get(thread_id), ids) for thread_id, ids in members.items()}
+        return cached, {}, groups
+
+    def _prepare_and_analyze_thread(self, thread: dict):
+        prepared, members = self.processor.prepare_thread(thread)
+        return prepared, members, self.processor.analyze(prepared)
+
+    def _prepare_and_analyze(self, message: dict):
+        prepared = self.processor.prepare_message(message)
+        return prepared, self.processor.analyze(prepared)
+
+    async def _aprepare_and_analyze_thread(self, thread: dict):
+        prepared, members = await asyncio.to_thread(self.processor.prepare_thread, thread)
+        return prepared, members, await self.processor.aanalyze(prepared)
+
+    async def _aprepare_and_analyze(self, message: dict):
+        prepared = await asyncio.to_thread(self.processor.prepare_message, message)
+        return prepared, await self.processor.aanalyze(prepared)
+
+    def _finalize(
+        self,
+        prepared: PreparedEmail,
+        analysis,
+        decision,
+        calendar_writes: Optional[CalendarWriteBatch],
+    ) -> Optional[ProcessedEmail]:
+        return self.processor.finalize(
+            prepared, analysis, decision, mark_as_read=False, calendar_writes=calendar_writes
+        )
+
+    @staticmethod
+    def _drain(
+        results: "queue.Queue[tuple[int, object]]",
+        total: int,
+        *,
+        ordered: bool,
+    ) -> Iterator[ProcessedEmail]:
+        pending: Dict[int, object] = {}
+        next_index = 0
+        for _ in range(total):
+            index, outcome = results.get()
+            if isinstance(outcome, BaseException):
+                raise outcome
+            if not ordered:
+                if outcome is not _SKIPPED:
+                    yield outcome  # type: ignore[misc]
+                continue
+            pending[index] = outcome
+            while next_index in pending:
+                ready = pending.pop(next_index)
+                next_index += 1
+                if ready is not _SKIPPED:
+                    yield ready  # type: ignore[misc]
+
+
+def run_pipeline(
+    message_ids: Iterable[str],
+    *,
+    mark_as_read: bool,
+    processor: EmailProcessor,
+    ordered: bool = False,
+    reanalyze: bool = False,
+    threads: Optional[Mapping[str, str]] = None,
+    limits: Optional[PipelineLimits] = None,
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+    calendar_writes: Optional[CalendarWriteBatch] = None,
+) -> Iterator[ProcessedEmail]:
+    pipeline = EmailPipeline(processor, limits=limits)
+    return pipeline.run(
+        message_ids,
+        mark_as_read=mark_as_read,
+        ordered=ordered,
+        reanalyze=reanalyze,
+        threads=threads,
+        loop=loop,
+        calendar_writes=calendar_writes,
+    )
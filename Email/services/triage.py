@@ -0,0 +1,226 @@
+"""Metadata-first triage that decides which emails are worth a full analysis."""
+
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from core.priority import is_vip
+from db import load_processed_snapshots, load_sender_categories
+from services.calendar_writes import CalendarWriteBatch
+from services.email_processor import (
+    EmailProcessor,
+    ProcessedEmail,
+    detect_instruction,
+    detect_task_intent,
+    extract_instruction_steps,
+)
+from services.pipeline import EmailPipeline
+from tools import MAX_BATCH_SIZE, header
+
+CATEGORIES = ("task", "article", "instruction")
+METADATA_HEADERS = ["Subject", "From"]
+MARKETING_LABELS = {"CATEGORY_PROMOTIONS", "CATEGORY_SOCIAL", "CATEGORY_FORUMS"}
+
+# How much each evidence source is trusted when predicting a category.
+CONFIDENCE_SNAPSHOT = 3
+CONFIDENCE_HISTORY = 2
+CONFIDENCE_HINT = 1
+CONFIDENCE_DEFAULT = 0
+
+
+@dataclass
+class TriageCandidate:
+    message_id: str
+    position: int
+    subject: str
+    sender: str
+    snippet: str
+    predicted_category: str
+    confidence: int
+    vip: bool
+
+
+def predict_category(
+    subject: str,
+    snippet: str,
+    labels: Iterable[str],
+    sender_history: Optional[Dict[str, int]] = None,
+) -> Tuple[str, int]:
+    """Guess the processor's classification from headers, snippet and sender history."""
+    if sender_history:
+        category, _ = Counter(sender_history).most_common(1)[0]
+        if category in CATEGORIES:
+            return category, CONFIDENCE_HISTORY
+    if detect_task_intent(subject, snippet):
+        return "task", CONFIDENCE_HINT
+    if extract_instruction_steps(snippet) or detect_instruction(f"{subject}\n{snippet}"):
+        return "instruction", CONFIDENCE_HINT
+    if set(labels) & MARKETING_LABELS:
+        return "article", CONFIDENCE_HINT
+    return "article", CONFIDENCE_DEFAULT
+
+
+def triage_messages(processor: EmailProcessor, message_ids: List[str]) -> List[TriageCandidate]:
+    """Fetch metadata for ``message_ids`` in one batch and predict each message's category."""
+    known = load_processed_snapshots(message_ids)
+    unknown = [message_id for message_id in message_ids if message_id not in known]
+    metadata = processor.gmail.get_messages(unknown, fmt="metadata", metadata_headers=METADATA_HEADERS) if unknown else {}
+    senders = {
+        message_id: header(message.get("payload", {}).get("headers", []), "From")
+        for message_id, message in metadata.items()
+    }
+    history = load_sender_categories(senders.values())
+
+    candidates: List[TriageCandidate] = []
+    for position, message_id in enumerate(message_ids):
+        snapshot = known.get(message_id)
+        if snapshot is not None:
+            candidates.append(
+                TriageCandidate(
+                    message_id=message_id,
+                    position=position,
+                    subject=snapshot.subject,
+                    sender=snapshot.sender,
+                    snippet="",
+                    predicted_category=snapshot.classification,
+                    confidence=CONFIDENCE_SNAPSHOT,
+                    vip=is_vip(snapshot.sender),
+                )
+            )
+            continue
+        message = metadata.get(message_id)
+        if message is None:
+            continue
+        headers = message.get("payload", {}).get("headers", [])
+        subject = header(headers, "Subject")
+        sender = senders[message_id]
+        snippet = message.get("snippet", "")
+        category, confidence = predict_category(subject, snippet, message.get("labelIds", []) or [], history.get(sender))
+        candidates.append(
+            TriageCandidate(
+                message_id=message_id,
+                position=position,
+                subject=subject,
+                sender=sender,
+                snippet=snippet,
+                predicted_category=category,
+                confidence=confidence,
+                vip=is_vip(sender),
+            )
+        )
+    return candidates
+
+
+def _rank(candidate: TriageCandidate) -> Tuple[int, int, int]:
+    return (-candidate.confidence, 0 if candidate.vip else 1, candidate.position)
+
+
+def collect_by_category(
+    processor: EmailProcessor,
+    message_ids: Iterable[str],
+    *,
+    limit_per_category: int,
+    max_processed: int,
+    reanalyze: bool = False,
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+    threads: Optional[Mapping[str, str]] = None,
+) -> Tuple[Dict[str, List[ProcessedEmail]], int]:
+    """Fill up to ``limit_per_category`` emails per category, analysing as few as possible.
+
+    Each listing page is triaged from metadata first. Full fetch and analysis only
+    run for messages predicted to land in a category that still has room; messages
+    with no evidence either way are tried last. Returns the categorized emails and
+    the number of messages that went through the full pipeline. ``loop`` and
+    ``threads`` (message ID → threadId) are passed on to ``EmailPipeline.run``; with
+    ``threads`` only the first listed message of each conversation is kept, so a
+    thread fills one slot and counts once toward ``max_processed``. Every round
+    shares one pipeline, each category keeps listing order, and calendar events
+    for the whole collection are created in one batch before returning.
+    """
+    categorized: Dict[str, List[ProcessedEmail]] = {category: [] for category in CATEGORIES}
+    processed_count = 0
+    calendar_writes = CalendarWriteBatch()
+    pipeline = EmailPipeline(processor)
+
+    def remaining(category: str) -> int:
+        return max(0, limit_per_category - len(categorized.get(category, [])))
+
+    def process(candidates: List[TriageCandidate]) -> None:
+        nonlocal processed_count
+        ids = [candidate.message_id for candidate in candidates]
+        for processed in pipeline.run(
+            ids,
+            mark_as_read=False,
+            ordered=True,
+            reanalyze=reanalyze,
+            loop=loop,
+            threads=threads,
+            calendar_writes=calendar_writes,
+        ):
+            processed_count += 1
+            bucket = categorized.get(processed.classification)
+            if bucket is not None and len(bucket) < limit_per_category:
+                bucket.append(processed)
+
+    if threads is not None:
+        seen_threads = set()
+        representatives: List[str] = []
+        for message_id in message_ids:
+            thread_id = threads.get(message_id, message_id)
+            if thread_id not in seen_threads:
+                seen_threads.add(thread_id)
+                representatives.append(message_id)
+        message_ids = representatives
+    message_ids = list(message_ids)
+    listing = {message_id: index for index, message_id in enumerate(message_ids)}
+
+    page: List[str] = []
+    pages: List[List[str]] = []
+    for message_id in message_ids:
+        page.append(message_id)
+        if len(page) >= MAX_BATCH_SIZE:
+            pages.append(page)
+            page = []
+    if page:
+        pages.append(page)
+
+    try:
+        with pipeline:
+            for page in pages:
+                if processed_count >= max_processed or not any(remaining(category) for category in CATEGORIES):
+                    break
+                pool = sorted(triage_messages(processor, page), key=_rank)
+                while pool and processed_count < max_processed:
+                    budget = max_processed - processed_count
+                    selected: List[TriageCandidate] = []
+                    for category in CATEGORIES:
+                        wanted = remaining(category)
+                        matches = [
+                            candidate
+                            for candidate in pool
+                            if candidate.predicted_category == category and candidate.confidence > CONFIDENCE_DEFAULT
+                        ]
+                        selected.extend(matches[:wanted])
+                    if not selected and any(remaining(category) for category in CATEGORIES):
+                        # Predictions are exhausted; try the messages we had no evidence about.
+                        selected = [candidate for candidate in pool if candidate.confidence == CONFIDENCE_DEFAULT]
+                        selected = selected[: sum(remaining(category) for category in CATEGORIES)]
+                    if not selected:
+                        break
+                    selected = sorted(selected[:budget], key=lambda candidate: candidate.position)
+                    chosen = {candidate.message_id for candidate in selected}
+                    pool = [candidate for candidate in pool if candidate.message_id not in chosen]
+                    process(selected)
+                    if not any(remaining(category) for category in CATEGORIES):
+                        break
+    finally:
+        # Events are created even if processing stopped early, so queued writes are not lost.
+        processor.flush_calendar_writes(calendar_writes)
+
+    for bucket in categorized.values():
+        # Rounds fill buckets in confidence order; present them in listing order instead.
+        bucket.sort(key=lambda processed: listing.get(processed.message_id, len(listing)))
+    return categorized, processed_count
@@ -14,7 +14,8 @@ from config import DEFAULT_UNREAD_WINDOW_DAYS
 from db import initialize_database
 from services.email_processor import EmailProcessor, ProcessedEmail
 from services.email_search import run_email_search
-from tools import GmailClient, build_query, list_message_ids
+from services.triage import collect_by_category
+from tools import GmailClient, build_query, list_message_ids, list_message_threads
 
 load_dotenv()
 initialize_database()
@@ -29,28 +30,26 @@ def gather_emails(
     days: int = DEFAULT_UNREAD_WINDOW_DAYS,
     include_read: bool = False,
     max_total: int = 10,
+    reanalyze: bool = False,
+    threads: bool = False,
 ) -> Tuple[Dict[str, List[ProcessedEmail]], int]:
-    categorized: Dict[str, List[ProcessedEmail]] = {"task": [], "article": [], "instruction": []}
     query = build_query(include_read=include_read, days=days)
     max_messages = min(limit_per_category * 6, max_total)
 
-    processed_count = 0
-    for message_id in list_message_ids(gmail_client, query, limit=max_messages):
-        if processed_count >= max_messages:
-            break
-        processed = processor.process_message(message_id, mark_as_read=False)
-        processed_count += 1
-        if processed is None:
-            continue
-        category = processed.classification
-        if category not in categorized:
-            continue
-        if len(categorized[category]) >= limit_per_category:
-            continue
-        categorized[category].append(processed)
-        if all(len(items) >= limit_per_category for items in categorized.values()):
-            break
-    return categorized, processed_count
+    thread_ids = None
+    if threads:
+        thread_ids = list_message_threads(gmail_client, query, limit=max_messages)
+        message_ids = list(thread_ids)
+    else:
+        message_ids = list_message_ids(gmail_client, query, limit=max_messages)
+    return collect_by_category(
+        processor,
+        message_ids,
+        limit_per_category=limit_per_category,
+        max_processed=max_messages,
+        reanalyze=reanalyze,
+        threads=thread_ids,
+    )
 
 
 def render_task(email: ProcessedEmail) -> None:
@@ -118,11 +117,13 @@ st.title("FocusMate Mail Assistant")
 limit = st.sidebar.slider("Emails per category", min_value=1, max_value=5, value=3, step=1)
 include_read = st.sidebar.checkbox("Include read emails", value=False)
 days = st.sidebar.slider("Lookback window (days)", min_value=1, max_value=30, value=DEFAULT_UNREAD_WINDOW_DAYS)
+reanalyze = st.sidebar.checkbox("Re-analyse cached emails", value=False)
+thread_mode = st.sidebar.checkbox("Analyse each conversation once", value=False)
 
 if "cached_emails" not in st.session_state:
     with st.spinner("Fetching emails..."):
         emails, requested = gather_emails(
-            limit_per_category=limit, days=days, include_read=include_read, max_total=10
+            limit_per_category=limit, days=days, include_read=include_read, max_total=10, threads=thread_mode
         )
         st.session_state.cached_emails = emails
         st.session_state.last_refresh = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -138,7 +139,12 @@ if "search_error" not in st.session_state:
 if st.sidebar.button("Refresh"):
     with st.spinner("Refreshing emails..."):
         emails, requested = gather_emails(
-            limit_per_category=limit, days=days, include_read=include_read, max_total=10
+            limit_per_category=limit,
+            days=days,
+            include_read=include_read,
+            max_total=10,
+            reanalyze=reanalyze,
+            threads=thread_mode,
         )
         st.session_state.cached_emails = emails
         st.session_state.last_refresh = time.strftime("%Y-%m-%d %H:%M:%S")
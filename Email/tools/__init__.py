@@ -1,18 +1,39 @@
 """External service integrations for FocusMate."""
 
-from .gmail_client import GmailClient, build_query, list_message_ids
+from .gmail_client import (
+    MAX_BATCH_SIZE,
+    GmailClient,
+    HistoryExpiredError,
+    build_query,
+    list_message_ids,
+    list_message_threads,
+)
 from .calendar_client import CalendarClient, create_deadline_hold
-from .email_utils import decode_body, html_to_text, header
+from .google_services import GoogleServiceRegistry, google_services
+from .email_utils import compact_body, count_tokens, decode_body, html_to_text, header
 from .image_generator import generate_logo_dalle
+from .rate_limit import BackendLimits, RateGovernor, configure_governor, governor, governor_stats
 
 __all__ = [
+    "MAX_BATCH_SIZE",
     "GmailClient",
+    "HistoryExpiredError",
     "build_query",
     "list_message_ids",
+    "list_message_threads",
     "CalendarClient",
     "create_deadline_hold",
+    "GoogleServiceRegistry",
+    "google_services",
+    "compact_body",
+    "count_tokens",
     "decode_body",
     "html_to_text",
     "header",
     "generate_logo_dalle",
+    "BackendLimits",
+    "RateGovernor",
+    "configure_governor",
+    "governor",
+    "governor_stats",
 ]
@@ -2,28 +2,37 @@
 
 from __future__ import annotations
 
-import os
-from typing import Optional
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+import logging
+from typing import Dict, List, Optional, Sequence
 
 from config import CALENDAR_SCOPES
+from tools.google_services import google_services
+from tools.rate_limit import governor
+
+# Google recommends at most 50 requests per Calendar batch.
+CALENDAR_BATCH_SIZE = 50
+
+logger = logging.getLogger(__name__)
 
 
 class CalendarClient:
     def __init__(self, token_file: str = "token.json") -> None:
         self._token_file = token_file
         self._service = None
+        self._governor = governor("calendar")
 
     @property
     def service(self):
         if self._service is None:
-            credentials = self._load_credentials()
-            self._service = build("calendar", "v3", credentials=credentials)
+            self._service = google_services.service(
+                "calendar", "v3", token_file=self._token_file, scopes=CALENDAR_SCOPES
+            )
         return self._service
 
+    def _execute(self, request, *, retry_on: str = "transient") -> dict:
+        http = google_services.http(token_file=self._token_file, scopes=CALENDAR_SCOPES)
+        return self._governor.call(lambda: request.execute(http=http), retry_on=retry_on)
+
     def create_event(
         self,
         title: str,
@@ -33,20 +42,53 @@ class CalendarClient:
         location: Optional[str] = None,
         calendar_id: str = "primary",
     ) -> dict[str, Optional[str]]:
-        event_body = {
-            "summary": title,
-            "location": location or None,
-            "start": {"dateTime": start_iso},
-            "end": {"dateTime": end_iso},
-        }
-        event = self.service.events().insert(calendarId=calendar_id, body=event_body).execute()
+        event_body = build_event_body(title, start_iso, end_iso, location=location)
+        # Inserts are not idempotent: only retry when Google throttled the request.
+        event = self._execute(self.service.events().insert(calendarId=calendar_id, body=event_body), retry_on="throttle")
         return {
             "id": event.get("id"),
             "htmlLink": event.get("htmlLink"),
         }
 
+    def create_events(
+        self,
+        event_bodies: Sequence[dict],
+        *,
+        calendar_id: str = "primary",
+    ) -> List[Optional[dict[str, Optional[str]]]]:
+        """Insert several events using Calendar batch requests.
+
+        Returns one ``{"id", "htmlLink"}`` entry per body, in order, or ``None`` for
+        inserts that failed (they are logged, not raised).
+        """
+        created: Dict[int, dict[str, Optional[str]]] = {}
+
+        def _callback(request_id: str, response: Optional[dict], exception: Optional[Exception]) -> None:
+            if exception is not None:
+                logger.warning("Batched calendar insert %s failed: %s", request_id, exception)
+                return
+            created[int(request_id)] = {"id": response.get("id"), "htmlLink": response.get("htmlLink")}
+
+        http = google_services.http(token_file=self._token_file, scopes=CALENDAR_SCOPES)
+        events = self.service.events()
+        for start in range(0, len(event_bodies), CALENDAR_BATCH_SIZE):
+            indexes = range(start, min(start + CALENDAR_BATCH_SIZE, len(event_bodies)))
+
+            def _send(indexes=indexes) -> None:
+                batch = self.service.new_batch_http_request(callback=_callback)
+                for index in indexes:
+                    if index not in created:
+                        batch.add(events.insert(calendarId=calendar_id, body=event_bodies[index]), request_id=str(index))
+                batch.execute(http=http)
+
+            try:
+                self._governor.call(_send, cost=len(indexes), retry_on="throttle")
+            except Exception as exc:  # pragma: no cover - network dependent
+                logger.warning("Calendar batch insert failed for %d events: %s", len(indexes), exc)
+        return [created.get(index) for index in range(len(event_bodies))]
+
     def delete_event(self, event_id: str, *, calendar_id: str = "primary") -> None:
-        self.service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        self._execute(self.service.events().delete(calendarId=calendar_id, eventId=event_id))
 
     def list_events(
         self,
@@ -68,22 +110,57 @@ class CalendarClient:
         if time_max:
             params["timeMax"] = time_max
         
-        events_result = self.service.events().list(**params).execute()
+        events_result = self._execute(self.service.events().list(**params))
         return events_result.get("items", [])
 
-    def _load_credentials(self) -> Credentials:
-        if not os.path.exists(self._token_file):
-            raise RuntimeError("Missing token.json. Run OAuth to create it.")
-        creds = Credentials.from_authorized_user_file(self._token_file, CALENDAR_SCOPES)
-        if creds.valid:
-            return creds
-        if creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            return creds
-        raise RuntimeError("Invalid Google credentials; re-run OAuth.")
+    def list_calendar_ids(self) -> list[str]:
+        """IDs of every calendar on the user's calendar list; the primary one is reported as ``"primary"``."""
+        ids: list[str] = []
+        page_token: Optional[str] = None
+        while True:
+            response = self._execute(self.service.calendarList().list(pageToken=page_token))
+            ids.extend("primary" if item.get("primary") else item["id"] for item in response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return ids
+
+    def sync_events(
+        self,
+        *,
+        calendar_id: str = "primary",
+        sync_token: Optional[str] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """Return the events changed since ``sync_token`` (all events without one) and the next token.
+
+        Cancelled events are included so callers can delete them. Google answers
+        410 Gone when the token has expired; the ``HttpError`` is raised and the
+        caller should start again with a full sync.
+        """
+        params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 2500}
+        if sync_token:
+            params["syncToken"] = sync_token
+        events: list[dict] = []
+        while True:
+            response = self._execute(self.service.events().list(**params))
+            events.extend(response.get("items", []))
+            if not response.get("nextPageToken"):
+                return events, response.get("nextSyncToken")
+            params["pageToken"] = response["nextPageToken"]
+
+
+def build_event_body(title: str, start_iso: str, end_iso: str, *, location: Optional[str] = None) -> dict:
+    return {
+        "summary": title,
+        "location": location or None,
+        "start": {"dateTime": start_iso},
+        "end": {"dateTime": end_iso},
+    }
+
+
+def deadline_hold(title: str, due_iso: str) -> tuple[str, str, str]:
+    """Title, start and end of the 30-minute hold placed on a task's due date."""
+    return f"{title} (deadline)", f"{due_iso}T09:00:00", f"{due_iso}T09:30:00"
 
 
 def create_deadline_hold(calendar: CalendarClient, title: str, due_iso: str) -> dict[str, Optional[str]]:
-    start = f"{due_iso}T09:00:00"
-    end = f"{due_iso}T09:30:00"
-    return calendar.create_event(f"{title} (deadline)", start, end)
+    return calendar.create_event(*deadline_hold(title, due_iso))
@@ -3,10 +3,57 @@
 from __future__ import annotations
 
 import base64
-from typing import Any, Dict, List
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
 
 from bs4 import BeautifulSoup
 
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None  # type: ignore
+
+DEFAULT_BODY_TOKEN_BUDGET = 3000
+# Rough characters-per-token ratio used when tiktoken is unavailable.
+_CHARS_PER_TOKEN = 4
+
+_QUOTE_HEADER_PATTERNS = [
+    re.compile(r"^on .{0,200}wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^-{2,}\s*original message\s*-{2,}$", re.IGNORECASE),
+    re.compile(r"^from:\s.+\s(sent|date):\s", re.IGNORECASE),
+]
+# Outlook separates quoted replies with an underscore rule followed by a From: header.
+_OUTLOOK_DIVIDER = re.compile(r"^_{10,}$")
+_FROM_HEADER = re.compile(r"^from:\s", re.IGNORECASE)
+_SIGNATURE_PATTERNS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^sent from my (iphone|ipad|android|mobile|galaxy)", re.IGNORECASE),
+    re.compile(r"^get outlook for (ios|android)", re.IGNORECASE),
+]
+_BOILERPLATE_KEYWORDS = (
+    "unsubscribe",
+    "view in browser",
+    "view this email in your browser",
+    "manage your preferences",
+    "manage preferences",
+    "update your preferences",
+    "email preferences",
+    "privacy policy",
+    "terms of service",
+    "all rights reserved",
+    "you are receiving this",
+    "you received this email",
+    "this email was sent to",
+    "add us to your address book",
+    "confidentiality notice",
+    "intended only for the use of",
+    "intended recipient",
+)
+_URL_PATTERN = re.compile(r"https?://[^\s<>\]\)\"']+")
+_LINK_ONLY_LINE = re.compile(r"^(\[link: [^\]]+\]\s*[|•·,-]?\s*)+$")
+
 
 def decode_body(payload: Dict[str, Any]) -> str:
     if not payload:
@@ -30,3 +77,105 @@ def header(headers: List[Dict[str, str]], name: str) -> str:
         if entry.get("name", "").lower() == name.lower():
             return entry.get("value", "")
     return ""
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # pragma: no cover - encoding download may fail offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _encoding()
+    if encoding is None:
+        return text[: max_tokens * _CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def _shorten_url(match: "re.Match[str]") -> str:
+    host = urlparse(match.group(0)).netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"[link: {host or 'url'}]"
+
+
+def _is_boilerplate(line: str) -> bool:
+    lowered = line.lower()
+    return len(line) <= 300 and any(keyword in lowered for keyword in _BOILERPLATE_KEYWORDS)
+
+
+def _strip_footer(lines: List[str]) -> List[str]:
+    """Drop trailing paragraphs made only of boilerplate (and link) lines.
+
+    Keyword lines in the body proper ("review the privacy policy by Friday") are
+    kept; only paragraphs after the last one with real content are removed.
+    """
+    end = len(lines)
+    while end:
+        while end and not lines[end - 1]:
+            end -= 1
+        start = end
+        while start and lines[start - 1]:
+            start -= 1
+        paragraph = lines[start:end]
+        if not paragraph or not any(_is_boilerplate(line) for line in paragraph):
+            break
+        if not all(_is_boilerplate(line) or _LINK_ONLY_LINE.match(line) for line in paragraph):
+            break
+        end = start
+    return lines[:end]
+
+
+def compact_body(text: str, *, max_tokens: Optional[int] = DEFAULT_BODY_TOKEN_BUDGET) -> str:
+    """Shrink an email body before sending it to the LLM.
+
+    Drops quoted reply history, signatures, lines starting with ``>`` and
+    unsubscribe/legal paragraphs at the end of the body; replaces URLs with their
+    host and folds runs of link-only lines into one; collapses whitespace; then
+    trims to ``max_tokens``.
+    """
+    lines = [
+        re.sub(r"[ \t\u00a0]+", " ", raw_line).strip()
+        for raw_line in (text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    ]
+    kept: List[str] = []
+    previous_link_line = False
+    for index, line in enumerate(lines):
+        if any(pattern.match(line) for pattern in _QUOTE_HEADER_PATTERNS):
+            break
+        if _OUTLOOK_DIVIDER.match(line) and _FROM_HEADER.match(next((rest for rest in lines[index + 1:] if rest), "")):
+            break
+        if any(pattern.match(line) for pattern in _SIGNATURE_PATTERNS):
+            break
+        if line.startswith(">"):
+            continue
+        line = _URL_PATTERN.sub(_shorten_url, line)
+        is_link_line = bool(line) and bool(_LINK_ONLY_LINE.match(line))
+        if is_link_line and previous_link_line:
+            continue
+        previous_link_line = is_link_line
+        if not line and (not kept or not kept[-1]):
+            continue
+        kept.append(line)
+
+    compacted = "\n".join(_strip_footer(kept)).strip()
+    if not compacted:
+        # Everything looked like quoted history or boilerplate; keep the text rather than send nothing.
+        compacted = re.sub(r"\s+", " ", text or "").strip()
+    if max_tokens is not None:
+        compacted = truncate_to_tokens(compacted, max_tokens)
+    return compacted
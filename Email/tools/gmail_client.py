@@ -2,14 +2,39 @@
 
 from __future__ import annotations
 
-import os
-from typing import Generator, Iterable, Optional
+import logging
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 from config import GMAIL_SCOPES
+from tools.google_services import google_services
+from tools.rate_limit import governor, is_throttled
+
+# Gmail rejects batch requests with more than 100 sub-requests.
+MAX_BATCH_SIZE = 100
+# Inbox tabs other than Primary; used to mirror ``category:primary`` on history results.
+NON_PRIMARY_CATEGORY_LABELS = {
+    "CATEGORY_PROMOTIONS",
+    "CATEGORY_SOCIAL",
+    "CATEGORY_UPDATES",
+    "CATEGORY_FORUMS",
+}
+# Per-user quota units charged by Gmail for each method.
+QUOTA_UNITS = {
+    "messages.get": 5,
+    "messages.list": 5,
+    "messages.modify": 5,
+    "threads.get": 10,
+    "history.list": 2,
+    "getProfile": 1,
+}
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryExpiredError(RuntimeError):
+    """Raised when a stored historyId is too old for users.history.list."""
 
 
 class GmailClient:
@@ -18,18 +43,147 @@ class GmailClient:
     def __init__(self, token_file: str = "token.json") -> None:
         self._token_file = token_file
         self._service = None
+        self._governor = governor("gmail")
 
     @property
     def service(self):
         if self._service is None:
-            self._service = build("gmail", "v1", credentials=self._load_credentials())
+            self._service = google_services.service("gmail", "v1", token_file=self._token_file, scopes=GMAIL_SCOPES)
         return self._service
 
-    def get_message(self, message_id: str, *, fmt: str = "full") -> dict:
-        return self.service.users().messages().get(userId="me", id=message_id, format=fmt).execute()
+    def _http(self):
+        return google_services.http(token_file=self._token_file, scopes=GMAIL_SCOPES)
+
+    def get_message(
+        self,
+        message_id: str,
+        *,
+        fmt: str = "full",
+        metadata_headers: Optional[List[str]] = None,
+    ) -> dict:
+        request = self.service.users().messages().get(
+            userId="me", id=message_id, format=fmt, metadataHeaders=metadata_headers
+        )
+        return self._execute(request, "messages.get")
+
+    def get_messages(
+        self,
+        message_ids: Iterable[str],
+        *,
+        fmt: str = "full",
+        metadata_headers: Optional[List[str]] = None,
+        batch_size: int = MAX_BATCH_SIZE,
+    ) -> Dict[str, dict]:
+        """Fetch several messages using Gmail batch requests.
+
+        Sub-requests that fail inside a batch are retried one by one; messages that
+        still cannot be fetched are logged and left out of the result. The returned
+        mapping preserves the order of ``message_ids``.
+        """
+        messages = self.service.users().messages()
+        return self._batch_get(
+            message_ids,
+            lambda message_id: messages.get(
+                userId="me", id=message_id, format=fmt, metadataHeaders=metadata_headers
+            ),
+            lambda message_id: self.get_message(message_id, fmt=fmt, metadata_headers=metadata_headers),
+            unit_cost=QUOTA_UNITS["messages.get"],
+            batch_size=batch_size,
+        )
+
+    def get_thread(self, thread_id: str, *, fmt: str = "full") -> dict:
+        return self._execute(self.service.users().threads().get(userId="me", id=thread_id, format=fmt), "threads.get")
+
+    def get_threads(
+        self,
+        thread_ids: Iterable[str],
+        *,
+        fmt: str = "full",
+        batch_size: int = MAX_BATCH_SIZE,
+    ) -> Dict[str, dict]:
+        """Fetch several threads (with all their messages) using Gmail batch requests."""
+        threads = self.service.users().threads()
+        return self._batch_get(
+            thread_ids,
+            lambda thread_id: threads.get(userId="me", id=thread_id, format=fmt),
+            lambda thread_id: self.get_thread(thread_id, fmt=fmt),
+            unit_cost=QUOTA_UNITS["threads.get"],
+            batch_size=batch_size,
+        )
+
+    def _batch_get(
+        self,
+        ids: Iterable[str],
+        build_request: Callable[[str], Any],
+        fetch_one: Callable[[str], dict],
+        *,
+        unit_cost: int,
+        batch_size: int,
+    ) -> Dict[str, dict]:
+        ordered_ids = list(dict.fromkeys(ids))
+        batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        fetched: Dict[str, dict] = {}
+        failed: List[str] = []
+        for start in range(0, len(ordered_ids), batch_size):
+            chunk = ordered_ids[start : start + batch_size]
+            failed.extend(self._execute_batch(chunk, build_request, fetched, unit_cost=unit_cost))
+
+        for item_id in failed:
+            try:
+                fetched[item_id] = fetch_one(item_id)
+            except HttpError as exc:
+                logger.warning("Failed to fetch Gmail resource %s: %s", item_id, exc)
+
+        return {item_id: fetched[item_id] for item_id in ordered_ids if item_id in fetched}
+
+    def _execute_batch(
+        self,
+        ids: List[str],
+        build_request: Callable[[str], Any],
+        fetched: Dict[str, dict],
+        *,
+        unit_cost: int,
+    ) -> List[str]:
+        failed: List[str] = []
+        throttled: List[Exception] = []
+
+        def _callback(request_id: str, response: Optional[dict], exception: Optional[Exception]) -> None:
+            if exception is not None:
+                logger.debug("Batched fetch failed for %s: %s", request_id, exception)
+                failed.append(request_id)
+                if is_throttled(exception):
+                    throttled.append(exception)
+            else:
+                fetched[request_id] = response
+
+        def _send() -> None:
+            # A fresh batch per attempt, so governor retries resend every sub-request.
+            batch = self.service.new_batch_http_request(callback=_callback)
+            for item_id in ids:
+                batch.add(build_request(item_id), request_id=item_id)
+            batch.execute(http=self._http())
+
+        try:
+            self._governor.call(_send, cost=unit_cost * len(ids))
+        except HttpError as exc:
+            logger.warning("Gmail batch request failed; retrying %d requests individually: %s", len(ids), exc)
+            return [item_id for item_id in ids if item_id not in fetched]
+        if throttled:
+            # Sub-requests were rate limited; slow down before they are retried one by one.
+            self._governor.record_throttle(throttled[0])
+        return [item_id for item_id in dict.fromkeys(failed) if item_id not in fetched]
+
+    def _execute(self, request: Any, method: str, *, retry_on: str = "transient") -> dict:
+        return self._governor.call(
+            lambda: request.execute(http=self._http()), cost=QUOTA_UNITS[method], retry_on=retry_on
+        )
 
     def modify_message(self, message_id: str, body: dict) -> None:
-        self.service.users().messages().modify(userId="me", id=message_id, body=body).execute()
+        self._execute(
+            self.service.users().messages().modify(userId="me", id=message_id, body=body),
+            "messages.modify",
+            retry_on="throttle",
+        )
 
     def list_messages(
         self,
@@ -42,11 +196,9 @@ class GmailClient:
         page_token: Optional[str] = None
         yielded = 0
         while True:
-            response = (
-                self.service.users()
-                .messages()
-                .list(userId=user, q=query, maxResults=page_size, pageToken=page_token)
-                .execute()
+            response = self._execute(
+                self.service.users().messages().list(userId=user, q=query, maxResults=page_size, pageToken=page_token),
+                "messages.list",
             )
             for message in response.get("messages", []) or []:
                 if limit is not None and yielded >= limit:
@@ -57,16 +209,69 @@ class GmailClient:
             if not page_token:
                 break
 
-    def _load_credentials(self) -> Credentials:
-        if not os.path.exists(self._token_file):
-            raise RuntimeError("Missing token.json. Run OAuth to create it.")
-        creds = Credentials.from_authorized_user_file(self._token_file, GMAIL_SCOPES)
-        if creds.valid:
-            return creds
-        if creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            return creds
-        raise RuntimeError("Invalid Google credentials; re-run OAuth.")
+    def get_profile(self) -> dict:
+        return self._execute(self.service.users().getProfile(userId="me"), "getProfile")
+
+    def list_history(
+        self,
+        start_history_id: str,
+        *,
+        label_id: str = "INBOX",
+        primary_only: bool = True,
+    ) -> Tuple[List[str], str]:
+        """Return IDs of messages added since ``start_history_id`` and the latest historyId.
+
+        Raises ``HistoryExpiredError`` when Gmail no longer has history that far back,
+        in which case callers should fall back to a full ``list_messages`` scan.
+        """
+        threads, latest_history_id = self.list_history_threads(
+            start_history_id, label_id=label_id, primary_only=primary_only
+        )
+        return list(threads), latest_history_id
+
+    def list_history_threads(
+        self,
+        start_history_id: str,
+        *,
+        label_id: str = "INBOX",
+        primary_only: bool = True,
+    ) -> Tuple[Dict[str, str], str]:
+        """Like ``list_history`` but map each added message ID to its threadId, in order."""
+        message_ids: Dict[str, str] = {}
+        latest_history_id = start_history_id
+        page_token: Optional[str] = None
+        while True:
+            try:
+                response = self._execute(
+                    self.service.users()
+                    .history()
+                    .list(
+                        userId="me",
+                        startHistoryId=start_history_id,
+                        historyTypes=["messageAdded"],
+                        labelId=label_id,
+                        pageToken=page_token,
+                    ),
+                    "history.list",
+                )
+            except HttpError as exc:
+                if getattr(exc.resp, "status", None) == 404:
+                    raise HistoryExpiredError(f"historyId {start_history_id} is no longer available") from exc
+                raise
+            for record in response.get("history", []) or []:
+                for added in record.get("messagesAdded", []) or []:
+                    message = added.get("message", {})
+                    labels = set(message.get("labelIds", []) or [])
+                    if primary_only and labels & NON_PRIMARY_CATEGORY_LABELS:
+                        continue
+                    message_id = message.get("id")
+                    if message_id and message_id not in message_ids:
+                        message_ids[message_id] = message.get("threadId", message_id)
+            latest_history_id = response.get("historyId", latest_history_id)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        return message_ids, latest_history_id
 
 
 def build_query(
@@ -96,3 +301,17 @@ def list_message_ids(
 ) -> Generator[str, None, None]:
     for message in client.list_messages(query, page_size=page_size, limit=limit):
         yield message["id"]
+
+
+def list_message_threads(
+    client: GmailClient,
+    query: str,
+    *,
+    page_size: int = 100,
+    limit: Optional[int] = None,
+) -> Dict[str, str]:
+    """Map listed message IDs to their threadId, preserving listing order."""
+    return {
+        message["id"]: message.get("threadId", message["id"])
+        for message in client.list_messages(query, page_size=page_size, limit=limit)
+    }
@@ -0,0 +1,80 @@
+"""Process-wide cache of Google credentials, discovery services and transports."""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Iterable, Tuple
+
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+_Key = Tuple[str, Tuple[str, ...]]
+
+
+class GoogleServiceRegistry:
+    """Load each token file once, build each discovery service once, and give every
+    thread its own authorized HTTP transport.
+
+    Discovery service objects only describe the API and can be shared; the
+    httplib2 transport underneath is not thread-safe, so requests must be executed
+    with ``request.execute(http=registry.http(...))``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._credentials: Dict[_Key, Credentials] = {}
+        self._services: Dict[Tuple[str, str, _Key], Any] = {}
+        self._local = threading.local()
+
+    def credentials(self, token_file: str, scopes: Iterable[str]) -> Credentials:
+        key = self._key(token_file, scopes)
+        with self._lock:
+            creds = self._credentials.get(key)
+            if creds is None:
+                if not os.path.exists(token_file):
+                    raise RuntimeError("Missing token.json. Run OAuth to create it.")
+                creds = Credentials.from_authorized_user_file(token_file, list(key[1]))
+                self._credentials[key] = creds
+            if not creds.valid:
+                if not (creds.expired and creds.refresh_token):
+                    raise RuntimeError("Invalid Google credentials; re-run OAuth.")
+                creds.refresh(Request())
+            return creds
+
+    def service(self, api: str, version: str, *, token_file: str, scopes: Iterable[str]) -> Any:
+        key = self._key(token_file, scopes)
+        with self._lock:
+            service = self._services.get((api, version, key))
+            if service is None:
+                service = build(api, version, credentials=self.credentials(token_file, scopes))
+                self._services[(api, version, key)] = service
+            return service
+
+    def http(self, *, token_file: str, scopes: Iterable[str]) -> AuthorizedHttp:
+        """Authorized transport owned by the calling thread."""
+        key = self._key(token_file, scopes)
+        transports: Dict[_Key, AuthorizedHttp] = getattr(self._local, "transports", None) or {}
+        self._local.transports = transports
+        transport = transports.get(key)
+        if transport is None:
+            transport = AuthorizedHttp(self.credentials(token_file, scopes), http=httplib2.Http())
+            transports[key] = transport
+        return transport
+
+    def clear(self) -> None:
+        """Forget cached credentials and services, e.g. after re-running OAuth."""
+        with self._lock:
+            self._credentials.clear()
+            self._services.clear()
+        self._local = threading.local()
+
+    @staticmethod
+    def _key(token_file: str, scopes: Iterable[str]) -> _Key:
+        return os.path.abspath(token_file), tuple(sorted(scopes))
+
+
+google_services = GoogleServiceRegistry()
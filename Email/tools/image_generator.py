@@ -7,6 +7,8 @@ import os
 from functools import lru_cache
 from typing import Optional
 
+from tools.rate_limit import governor
+
 try:
     from openai import OpenAI
 except ImportError:  # pragma: no cover - optional dependency
@@ -24,7 +26,8 @@ def _get_client() -> Optional["OpenAI"]:
     if OpenAI is None:
         logger.warning("openai package not installed; cannot generate images")
         return None
-    return OpenAI(api_key=api_key)
+    # Retries are handled by the shared rate governor.
+    return OpenAI(api_key=api_key, max_retries=0)
 
 
 def generate_logo_dalle(subject: str, *, size: str = "1024x1024") -> Optional[str]:
@@ -55,12 +58,14 @@ def generate_logo_dalle(subject: str, *, size: str = "1024x1024") -> Optional[st
     )
 
     try:
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size=size,
-            quality="standard",
-            n=1,
+        response = governor("openai-images").call(
+            lambda: client.images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                size=size,
+                quality="standard",
+                n=1,
+            )
         )
         data = response.data[0]
         if hasattr(data, "url") and data.url:
@@ -0,0 +1,283 @@
+"""Client-side rate governor shared by every outbound API call."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+THROTTLE_STATUSES = {429}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Google reports some per-user quota errors as 403 with one of these reasons.
+GOOGLE_RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded")
+ASYNC_POLL_SECONDS = 0.05
+
+
+@dataclass
+class BackendLimits:
+    """Token bucket and concurrency window for one backend.
+
+    ``rate`` tokens are added per second up to ``burst``; each call spends its
+    ``cost``. Concurrency starts at ``initial_concurrency`` and moves between
+    ``min_concurrency`` and ``max_concurrency``: +1 per window of successful
+    calls, halved on every 429/5xx.
+    """
+
+    rate: float
+    burst: float
+    initial_concurrency: int = 4
+    min_concurrency: int = 1
+    max_concurrency: int = 16
+    max_retries: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+
+# Gmail limits are expressed in quota units (250 per user per second);
+# Calendar and OpenAI limits in requests.
+DEFAULT_LIMITS: Dict[str, BackendLimits] = {
+    "gmail": BackendLimits(rate=250.0, burst=250.0, initial_concurrency=4, max_concurrency=8),
+    "calendar": BackendLimits(rate=10.0, burst=20.0, initial_concurrency=2, max_concurrency=4),
+    "openai": BackendLimits(rate=8.0, burst=16.0, initial_concurrency=4, max_concurrency=16),
+    "openai-images": BackendLimits(rate=5.0 / 60, burst=5.0, initial_concurrency=1, max_concurrency=2),
+}
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of a googleapiclient ``HttpError`` or OpenAI ``APIStatusError``, if any."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "resp", None), "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a ``Retry-After`` header on the failed response."""
+    headers: Any = getattr(getattr(exc, "response", None), "headers", None)
+    if headers is None:
+        headers = getattr(exc, "resp", None)  # httplib2 responses are header dicts
+    if headers is None:
+        return None
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+    except AttributeError:
+        return None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(exc: BaseException) -> bool:
+    status = status_code(exc)
+    if status in THROTTLE_STATUSES:
+        return True
+    if status == 403:
+        return any(reason in str(exc) for reason in GOOGLE_RATE_LIMIT_REASONS)
+    return False
+
+
+def is_retryable(exc: BaseException, retry_on: str = "transient") -> bool:
+    """Whether to retry ``exc``: throttling always, server/connection errors only for ``retry_on="transient"``.
+
+    Use ``retry_on="throttle"`` for non-idempotent calls (e.g. ``events.insert``): a
+    5xx or dropped connection may still have applied the request, and retrying it
+    would apply it twice.
+    """
+    if is_throttled(exc):
+        return True
+    if retry_on == "throttle":
+        return False
+    status = status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    # OpenAI connection errors and timeouts carry no status.
+    return type(exc).__name__ in {"APIConnectionError", "APITimeoutError"}
+
+
+class RateGovernor:
+    """Token bucket plus AIMD concurrency window for one backend.
+
+    ``call`` (threads) and ``acall`` (coroutines) share the same state, so the
+    pipeline's worker threads and the API server's event loop are governed
+    together. Throttling responses pause the whole backend for the server's
+    ``Retry-After`` (or an exponential backoff with jitter) and halve the window;
+    server and connection errors are retried with backoff but leave the window
+    alone; anything else is re-raised immediately. Pass ``retry_on="throttle"``
+    to retry only throttling responses.
+    """
+
+    def __init__(self, name: str, limits: BackendLimits) -> None:
+        self.name = name
+        self.limits = limits
+        self._cond = threading.Condition()
+        self._tokens = limits.burst
+        self._refilled_at = time.monotonic()
+        self._window = float(max(limits.min_concurrency, limits.initial_concurrency))
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._stats: Dict[str, int] = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    def call(self, fn: Callable[[], T], *, cost: float = 1.0, retry_on: str = "transient") -> T:
+        attempt = 0
+        while True:
+            self._acquire(cost)
+            try:
+                result = fn()
+            except Exception as exc:
+                delay = self._on_error(exc, attempt, retry_on)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._on_success()
+            return result
+
+    async def acall(
+        self, fn: Callable[[], Awaitable[T]], *, cost: float = 1.0, retry_on: str = "transient"
+    ) -> T:
+        attempt = 0
+        while True:
+            await self._aacquire(cost)
+            try:
+                result = await fn()
+            except Exception as exc:
+                delay = self._on_error(exc, attempt, retry_on)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:  # cancellation
+                self._release()
+                raise
+            self._on_success()
+            return result
+
+    def record_throttle(self, exc: Optional[BaseException] = None) -> None:
+        """Apply backoff for a throttling error observed outside ``call`` (e.g. inside a batch)."""
+        with self._cond:
+            self._throttle_locked(self._backoff(0, exc))
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {**self._stats, "window": round(self._window, 2), "in_flight": self._in_flight}
+
+    def _acquire(self, cost: float) -> None:
+        with self._cond:
+            while True:
+                wait = self._reserve_locked(cost)
+                if wait <= 0:
+                    return
+                self._cond.wait(wait)
+
+    async def _aacquire(self, cost: float) -> None:
+        while True:
+            with self._cond:
+                wait = self._reserve_locked(cost)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, ASYNC_POLL_SECONDS))
+
+    def _reserve_locked(self, cost: float) -> float:
+        """Take a slot and ``cost`` tokens, or return how long to wait before trying again."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._in_flight >= int(self._window):
+            return ASYNC_POLL_SECONDS
+        self._tokens = min(self.limits.burst, self._tokens + (now - self._refilled_at) * self.limits.rate)
+        self._refilled_at = now
+        cost = min(cost, self.limits.burst)
+        if self._tokens < cost:
+            return (cost - self._tokens) / self.limits.rate
+        self._tokens -= cost
+        self._in_flight += 1
+        self._stats["calls"] += 1
+        return 0.0
+
+    def _release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_success(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._window = min(float(self.limits.max_concurrency), self._window + 1.0 / self._window)
+            self._cond.notify_all()
+
+    def _on_error(self, exc: Exception, attempt: int, retry_on: str = "transient") -> Optional[float]:
+        """Release the slot; return the delay before retrying, or ``None`` to re-raise."""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+            if not is_retryable(exc, retry_on):
+                return None
+            delay = self._backoff(attempt, exc)
+            if is_throttled(exc):
+                # Only rate limiting shrinks the window; plain server errors just back off.
+                self._throttle_locked(delay)
+            if attempt >= self.limits.max_retries:
+                self._stats["failures"] += 1
+                logger.warning("%s call failed after %d retries: %s", self.name, attempt, exc)
+                return None
+            self._stats["retries"] += 1
+        logger.info("%s call failed (%s); retrying in %.1fs", self.name, status_code(exc) or type(exc).__name__, delay)
+        return delay
+
+    def _throttle_locked(self, pause: float) -> None:
+        self._stats["throttled"] += 1
+        self._window = max(float(self.limits.min_concurrency), self._window / 2)
+        if pause > 0:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+        self._cond.notify_all()
+
+    def _backoff(self, attempt: int, exc: Optional[BaseException]) -> float:
+        requested = retry_after(exc) if exc is not None else None
+        if requested is not None:
+            return min(requested, self.limits.max_delay)
+        delay = min(self.limits.max_delay, self.limits.base_delay * (2**attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+
+_registry_lock = threading.Lock()
+_governors: Dict[str, RateGovernor] = {}
+
+
+def governor(name: str) -> RateGovernor:
+    """Return the process-wide governor for ``name`` (``gmail``, ``calendar``, ``openai``, ``openai-images``)."""
+    with _registry_lock:
+        existing = _governors.get(name)
+        if existing is None:
+            existing = RateGovernor(name, DEFAULT_LIMITS.get(name) or BackendLimits(rate=10.0, burst=10.0))
+            _governors[name] = existing
+        return existing
+
+
+def configure_governor(name: str, limits: BackendLimits) -> RateGovernor:
+    """Replace the limits for ``name``; in-flight calls finish under the old governor."""
+    with _registry_lock:
+        _governors[name] = RateGovernor(name, limits)
+        return _governors[name]
+
+
+def governor_stats() -> Dict[str, Dict[str, float]]:
+    with _registry_lock:
+        governors = list(_governors.values())
+    return {item.name: item.stats() for item in governors}
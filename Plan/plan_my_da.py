@@ -2,14 +2,22 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 import datetime
 import os.path
 import pickle
 import os
+import heapq
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from zoneinfo import ZoneInfo
 from openai import OpenAI
 from dotenv import load_dotenv
 import json
+from timeline_store import TimelineStore
 
 # Load environment variables
 load_dotenv()
@@ -18,17 +26,55 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CREDENTIALS_PATH = os.path.join(BASE_DIR, 'credentials.json')
 TIMELINE_PATH = os.path.join(BASE_DIR, 'day_timeline.json')
 
+# FocusMate's mail server mirrors the calendar into its SQLite database; read it
+# instead of calling Google when it has synced recently.
+MIRROR_DB_PATH = os.getenv('FOCUSMATE_DB_PATH', os.path.join(BASE_DIR, '..', 'Email', 'focusmate.db'))
+MIRROR_MAX_AGE = datetime.timedelta(minutes=15)
+# Calendars fetched concurrently when the mirror is not available.
+CALENDAR_FETCH_WORKERS = 8
+
+# Break rules for tasks (minutes)
+MID_BREAK_MIN_TASK = 60    # 60-150 min tasks get one mid-task break
+LONG_TASK_MINUTES = 90     # 90+ min tasks get 10-15 min breaks
+WORK_STRETCH = 60
+MAX_WORK_STRETCH = 90
+# Focus routines keyed by first-task/long-break, time of day and minutes available
+ROUTINE_LIBRARY_PATH = os.path.join(BASE_DIR, 'focus_routine_library.json')
+ROUTINE_GENERATION_WORKERS = 4
+# Overall wall-clock budget for the LLM work of one planning run
+PLANNING_DEADLINE_SECONDS = float(os.getenv('PLAN_DEADLINE_SECONDS', '60'))
+# LLM-written break activity text, keyed by task title and break length
+BREAK_TEXT_CACHE_PATH = os.path.join(BASE_DIR, 'break_text_cache.json')
+
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 # Use system local timezone instead of hardcoded timezone
 MY_TIMEZONE = datetime.datetime.now().astimezone().tzinfo
 
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
-def get_calendar_service():
-    """Authenticate and return the Google Calendar service."""
-    creds = None
+def chat_completion(deadline=None, **kwargs):
+    """client.chat.completions.create, cut off at deadline (a time.monotonic() value).
     
-    if os.path.exists('token.pickle'):
+    With a deadline the request gets the remaining time as its timeout and is not
+    retried, so an overrunning call stops instead of holding the run open.
+    """
+    if deadline is None:
+        return client.chat.completions.create(**kwargs)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("planning deadline reached")
+    return client.with_options(timeout=remaining, max_retries=0).chat.completions.create(**kwargs)
+
+# Credentials and the discovery service are loaded once per process; each thread
+# gets its own authorized transport because httplib2 is not thread-safe.
+_calendar_lock = threading.Lock()
+_calendar_creds = None
+_calendar_service = None
+_calendar_http = threading.local()
+
+def _load_calendar_credentials(creds=None):
+    """Load (or refresh, or obtain via OAuth) the Calendar credentials and save them."""
+    if creds is None and os.path.exists('token.pickle'):
         with open('token.pickle', 'rb') as token:
             creds = pickle.load(token)
     
@@ -42,41 +88,100 @@ def get_calendar_service():
         with open('token.pickle', 'wb') as token:
             pickle.dump(creds, token)
     
-    service = build('calendar', 'v3', credentials=creds)
-    return service
+    return creds
+
+def get_calendar_service():
+    """Authenticate once and return the shared Google Calendar service."""
+    global _calendar_creds, _calendar_service
+    with _calendar_lock:
+        if _calendar_service is None or not _calendar_creds.valid:
+            creds = _load_calendar_credentials(_calendar_creds)
+            if creds is not _calendar_creds:
+                _calendar_service = None
+            _calendar_creds = creds
+        if _calendar_service is None:
+            _calendar_service = build('calendar', 'v3', credentials=_calendar_creds)
+        return _calendar_service
+
+def calendar_http():
+    """Authorized transport for the calling thread; pass it to ``request.execute(http=...)``."""
+    get_calendar_service()
+    transport = getattr(_calendar_http, 'transport', None)
+    if transport is None or transport.credentials is not _calendar_creds:
+        transport = AuthorizedHttp(_calendar_creds, http=httplib2.Http())
+        _calendar_http.transport = transport
+    return transport
+
+def read_calendar_mirror(time_min, time_max):
+    """Events overlapping [time_min, time_max) from the local mirror, ordered by start.
+
+    Only calendars that themselves synced within MIRROR_MAX_AGE are read; returns
+    None when the mirror is missing or no calendar is fresh.
+    """
+    if not os.path.exists(MIRROR_DB_PATH):
+        return None
+    try:
+        con = sqlite3.connect(f'file:{MIRROR_DB_PATH}?mode=ro', uri=True)
+        try:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            fresh = [
+                key[len('calendar_mirror:'):-len(':synced_at')]
+                for key, value in con.execute(
+                    "SELECT key, value FROM SyncState WHERE key LIKE 'calendar_mirror:%:synced_at'"
+                )
+                if now - datetime.datetime.fromisoformat(value) <= MIRROR_MAX_AGE
+            ]
+            if not fresh:
+                return None
+            rows = con.execute(
+                "SELECT event_json FROM CalendarEvent WHERE end_ts > ? AND start_ts < ? "
+                f"AND calendar_id IN ({','.join('?' * len(fresh))}) "
+                "ORDER BY start_ts, event_id",
+                (time_min.timestamp(), time_max.timestamp(), *fresh)
+            ).fetchall()
+        finally:
+            con.close()
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Calendar mirror unavailable: {e}")
+        return None
+    return [json.loads(event_json) for (event_json,) in rows]
 
 def get_todays_events():
-    """Fetch all events for today from Google Calendar."""
-    service = get_calendar_service()
-    
+    """Fetch all events for today, from the local mirror when fresh, else Google Calendar."""
     # Use system local time
     now = datetime.datetime.now().astimezone()
     today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     tomorrow = today + datetime.timedelta(days=1)
     
+    mirrored = read_calendar_mirror(today, tomorrow)
+    if mirrored is not None:
+        return mirrored, now
+    
+    service = get_calendar_service()
+    
     time_min = today.astimezone(ZoneInfo('UTC')).isoformat()
     time_max = tomorrow.astimezone(ZoneInfo('UTC')).isoformat()
     
     try:
-        calendar_list = service.calendarList().list().execute()
-        calendars = calendar_list.get('items', [])
+        calendar_ids = []
+        page_token = None
+        while True:
+            calendar_list = service.calendarList().list(pageToken=page_token).execute(http=calendar_http())
+            calendar_ids.extend(calendar['id'] for calendar in calendar_list.get('items', []))
+            page_token = calendar_list.get('nextPageToken')
+            if not page_token:
+                break
         
-        all_events = []
+        # Each calendar's pages are fetched on its own worker; every result is
+        # already sorted by start time, so a k-way merge replaces a full sort.
+        workers = max(1, min(CALENDAR_FETCH_WORKERS, len(calendar_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            per_calendar = list(pool.map(
+                lambda cal_id: _fetch_calendar_events(service, cal_id, time_min, time_max),
+                calendar_ids
+            ))
         
-        for calendar in calendars:
-            cal_id = calendar['id']
-            events_result = service.events().list(
-                calendarId=cal_id,
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
-            all_events.extend(events)
-        
-        all_events.sort(key=lambda x: x['start'].get('dateTime', x['start'].get('date')))
+        all_events = list(heapq.merge(*per_calendar, key=_event_start_key))
         
         return all_events, now
         
@@ -84,6 +189,33 @@ def get_todays_events():
         print(f"Error fetching events: {e}")
         return [], now
 
+def _fetch_calendar_events(service, cal_id, time_min, time_max):
+    """All of one calendar's events in the range, following nextPageToken."""
+    events = []
+    page_token = None
+    try:
+        while True:
+            events_result = service.events().list(
+                calendarId=cal_id,
+                timeMin=time_min,
+                timeMax=time_max,
+                singleEvents=True,
+                orderBy='startTime',
+                pageToken=page_token
+            ).execute(http=calendar_http())
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return events
+    except Exception as e:
+        print(f"Error fetching events for calendar {cal_id}: {e}")
+        return events
+
+def _event_start_key(event):
+    """Start of an event as a timestamp; all-day dates count from local midnight."""
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    return datetime.datetime.fromisoformat(start.replace('Z', '+00:00')).timestamp()
+
 def parse_event_details(event):
     """Extract detailed information from an event."""
     details = {
@@ -91,6 +223,7 @@ def parse_event_details(event):
         'location': event.get('location', ''),
         'description': event.get('description', ''),
         'event_id': event.get('id', ''),
+        'updated': event.get('updated', ''),
     }
     
     if 'dateTime' in event['start']:
@@ -115,7 +248,14 @@ def parse_event_details(event):
     return details
 
 def load_existing_timeline():
-    """Load existing timeline if it exists."""
+    """Load today's latest stored plan, falling back to the JSON file."""
+    try:
+        timeline = TimelineStore().load(None)
+    except sqlite3.Error as e:
+        print(f"Error reading timeline store: {e}")
+        timeline = None
+    if timeline is not None:
+        return timeline
     if os.path.exists(TIMELINE_PATH):
         try:
             with open(TIMELINE_PATH, 'r', encoding='utf-8') as f:
@@ -124,55 +264,49 @@ def load_existing_timeline():
             print(f"Error loading existing timeline: {e}")
     return None
 
-def generate_focus_prep_routine(next_event_time, next_event_details, current_time, is_first_task=False, time_since_last_task=None):
-    """Generate a focus preparation routine based on available time and time of day.
-    Only generates for:
-    1. First task of the day
-    2. When there's a 4+ hour gap since last task
-    Ensures routine finishes BEFORE task starts and is max 5 minutes."""
-    
+def _time_context(hour):
+    """Time-of-day context used to pick (and key) focus routines."""
+    if hour < 6:
+        return "very early morning (pre-dawn)"
+    elif hour < 9:
+        return "early morning"
+    elif hour < 12:
+        return "late morning"
+    elif hour < 14:
+        return "early afternoon (post-lunch)"
+    elif hour < 17:
+        return "mid-afternoon"
+    elif hour < 20:
+        return "evening"
+    return "late evening/night"
+
+def _routine_budget(next_event_time, current_time):
+    """Minutes available for a focus routine (3-5), or None if the task is too close."""
     time_until_event = int((next_event_time - current_time).total_seconds() / 60)
-    
-    # Check if we should generate focus routine at all
-    if not is_first_task and time_since_last_task is not None:
-        hours_since_last = time_since_last_task / 60  # Convert minutes to hours
-        if hours_since_last < 4:
-            print(f"ℹ️  Only {hours_since_last:.1f} hours since last task - skipping focus routine (continuous work)")
-            return None
-        else:
-            print(f"✓ {hours_since_last:.1f} hours since last task - adding focus routine (long break)")
-    
-    # If task is too soon (less than 6 minutes), skip focus routine
-    if time_until_event < 6:
-        print(f"⚠️  Task starts in {time_until_event} min - too soon for focus routine")
-        return None
-    
-    # Cap the routine duration at 5 minutes max
-    # Leave at least 1 minute buffer before task starts
+    # Leave at least 1 minute buffer before task starts, cap at 5 minutes
     max_routine_duration = min(time_until_event - 1, 5)
-    
-    if max_routine_duration < 3:
-        print(f"⚠️  Only {time_until_event} min until task - skipping focus routine")
+    if time_until_event < 6 or max_routine_duration < 3:
         return None
-    
-    current_hour = current_time.hour
-    
-    # Determine time of day context
-    if current_hour < 6:
-        time_context = "very early morning (pre-dawn)"
-    elif current_hour < 9:
-        time_context = "early morning"
-    elif current_hour < 12:
-        time_context = "late morning"
-    elif current_hour < 14:
-        time_context = "early afternoon (post-lunch)"
-    elif current_hour < 17:
-        time_context = "mid-afternoon"
-    elif current_hour < 20:
-        time_context = "evening"
-    else:
-        time_context = "late evening/night"
-    
+    return max_routine_duration
+
+def _routine_key(is_first_task, time_context, max_minutes):
+    return f"{'first_task' if is_first_task else 'long_break'}|{time_context}|{max_minutes}"
+
+_routine_library = None
+_routine_library_lock = threading.Lock()
+
+def _load_routine_library():
+    global _routine_library
+    if _routine_library is None:
+        try:
+            with open(ROUTINE_LIBRARY_PATH, 'r', encoding='utf-8') as f:
+                _routine_library = json.load(f)
+        except (OSError, ValueError):
+            _routine_library = {}
+    return _routine_library
+
+def _generate_routine_template(is_first_task, time_context, max_routine_duration, deadline=None):
+    """Ask the LLM for a routine for one library slot; returns steps without clock times."""
     # Keep focus routine simple and short
     if is_first_task:
         focus_areas = """Quick morning startup:
@@ -187,24 +321,20 @@ def generate_focus_prep_routine(next_event_time, next_event_details, current_tim
     
     prompt = f"""You are a productivity coach. Create a VERY SHORT and PRACTICAL focus routine.
 
-Current time: {current_time.strftime('%I:%M %p')} ({time_context})
-Next task: {next_event_details['summary']} at {next_event_time.strftime('%I:%M %p')}
-Available time: {time_until_event} minutes
+Time of day: {time_context}
 Maximum routine duration: {max_routine_duration} minutes (MUST NOT EXCEED - KEEP IT SHORT!)
 Context: {"First task of the day" if is_first_task else "Long break (4+ hours) - need to refocus"}
 
 CRITICAL CONSTRAINTS:
 - Total routine MUST be {max_routine_duration} minutes or LESS
 - Keep it SIMPLE and FAST - this is just a quick prep
-- Routine MUST finish by {(next_event_time - datetime.timedelta(minutes=1)).strftime('%I:%M %p')}
-- Start time should be {current_time.strftime('%I:%M %p')} or shortly after
+- It must work for any upcoming task, so do not mention a specific task
 
 {focus_areas}
 
-Return a JSON array with 2-3 QUICK steps (total ≤ {max_routine_duration} min):
+Return a JSON array with 2-3 QUICK steps in order (total ≤ {max_routine_duration} min):
 [
   {{
-    "time": "HH:MM AM/PM",
     "duration_minutes": 2,
     "activity": "Activity name",
     "description": "Brief, specific actions",
@@ -214,13 +344,12 @@ Return a JSON array with 2-3 QUICK steps (total ≤ {max_routine_duration} min):
 
 IMPORTANT: 
 - Keep descriptions SHORT and ACTIONABLE
-- First step starts at or just after current time
 - Sum of all duration_minutes must be ≤ {max_routine_duration}
-- Times must be sequential and not overlap with task
 - Return ONLY valid JSON"""
 
     try:
-        response = client.chat.completions.create(
+        response = chat_completion(
+            deadline,
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are a productivity expert. Return only valid JSON."},
@@ -237,30 +366,246 @@ IMPORTANT:
                 content = content[4:]
         
         routine = json.loads(content)
+        if not isinstance(routine, list):
+            raise ValueError("expected a JSON array of steps")
         
-        # Validate that routine doesn't overlap with task
-        total_duration = sum(step['duration_minutes'] for step in routine)
-        if total_duration > max_routine_duration:
-            print(f"⚠️  Generated routine ({total_duration} min) exceeds limit ({max_routine_duration} min), truncating...")
-            # Truncate steps to fit
-            adjusted_routine = []
-            running_total = 0
-            for step in routine:
-                if running_total + step['duration_minutes'] <= max_routine_duration:
-                    adjusted_routine.append(step)
-                    running_total += step['duration_minutes']
-            routine = adjusted_routine
-        
-        print(f"✓ Focus routine: {sum(step['duration_minutes'] for step in routine)} min, finishes at {(current_time + datetime.timedelta(minutes=sum(step['duration_minutes'] for step in routine))).strftime('%I:%M %p')}")
-        
-        return routine
-    
+        # Skip malformed steps and truncate steps that would overrun the budget
+        adjusted_routine = []
+        running_total = 0
+        for step in routine:
+            if not isinstance(step, dict) or not step.get('activity'):
+                continue
+            try:
+                duration = int(float(step.get('duration_minutes')))
+            except (TypeError, ValueError):
+                continue
+            if duration > 0 and running_total + duration <= max_routine_duration:
+                adjusted_routine.append({
+                    'duration_minutes': duration,
+                    'activity': str(step['activity']),
+                    'description': str(step.get('description', '')),
+                    'purpose': str(step.get('purpose', '')),
+                })
+                running_total += duration
     except Exception as e:
         print(f"Error generating focus routine: {e}")
         return None
+    
+    if len(adjusted_routine) < len(routine):
+        print(f"⚠️  Generated routine exceeded {max_routine_duration} min or had invalid steps, kept {running_total} min")
+    return adjusted_routine or None
 
-def create_optimized_schedule_with_breaks(events, current_time):
-    """Use LLM to create an optimized schedule with appropriate breaks for ALL events."""
+def _default_routine_template(is_first_task, max_routine_duration):
+    """Static routine for a slot the library has no entry for (LLM cut off or failed)."""
+    if is_first_task:
+        steps = [
+            ("Physical prep", "Sit properly and adjust desk and monitor", "Comfortable start"),
+            ("Mental reset", "Take 3 deep breaths and clear your mind", "Calm focus"),
+            ("Workspace ready", "Open your apps, get water, headphones on", "No distractions later"),
+        ]
+    else:
+        steps = [
+            ("Mental reset", "Breathe and let go of break activities", "Switch back to work mode"),
+            ("Physical refresh", "Quick stretch and adjust your posture", "Shake off the break"),
+            ("Get ready", "Open task materials and set your playlist", "Start without friction"),
+        ]
+    durations = [1, 1, max_routine_duration - 2]
+    return [
+        {'duration_minutes': duration, 'activity': activity, 'description': description, 'purpose': purpose}
+        for duration, (activity, description, purpose) in zip(durations, steps)
+    ]
+
+def prepare_focus_routines(slots, deadline=None):
+    """Make sure the library holds a routine for every (is_first_task, time_context,
+    max_minutes) slot, generating the missing ones concurrently. Returns the number generated.
+    Requests still running at deadline are cut off and their slots left empty."""
+    with _routine_library_lock:
+        library = _load_routine_library()
+        missing = sorted({_routine_key(*slot): slot for slot in slots
+                          if _routine_key(*slot) not in library}.items())
+    if not missing:
+        return 0
+    
+    with ThreadPoolExecutor(max_workers=min(ROUTINE_GENERATION_WORKERS, len(missing))) as pool:
+        templates = list(pool.map(lambda item: _generate_routine_template(*item[1], deadline=deadline), missing))
+    
+    with _routine_library_lock:
+        library = _load_routine_library()
+        generated = {key: template for (key, _), template in zip(missing, templates) if template}
+        library.update(generated)
+        if generated:
+            try:
+                with open(ROUTINE_LIBRARY_PATH, 'w', encoding='utf-8') as f:
+                    json.dump(library, f, indent=2, ensure_ascii=False)
+            except OSError as e:
+                print(f"Could not save focus routine library: {e}")
+    return len(generated)
+
+def focus_routine_slot(next_event_time, current_time, is_first_task=False):
+    """Library slot a routine starting at current_time would use, or None if there is no time."""
+    max_routine_duration = _routine_budget(next_event_time, current_time)
+    if max_routine_duration is None:
+        return None
+    return (is_first_task, _time_context(current_time.hour), max_routine_duration)
+
+def generate_focus_prep_routine(next_event_time, next_event_details, current_time, is_first_task=False, time_since_last_task=None, generate_missing=True):
+    """Return a focus preparation routine based on available time and time of day.
+    Only generates for:
+    1. First task of the day
+    2. When there's a 4+ hour gap since last task
+    Ensures routine finishes BEFORE task starts and is max 5 minutes.
+    
+    Routines come from the library (first task / long break, time of day, budget)
+    and are re-timed to start at current_time; a missing slot is generated once
+    unless generate_missing is False, and falls back to a static default routine."""
+    
+    time_until_event = int((next_event_time - current_time).total_seconds() / 60)
+    
+    # Check if we should generate focus routine at all
+    if not is_first_task and time_since_last_task is not None:
+        hours_since_last = time_since_last_task / 60  # Convert minutes to hours
+        if hours_since_last < 4:
+            print(f"ℹ️  Only {hours_since_last:.1f} hours since last task - skipping focus routine (continuous work)")
+            return None
+        else:
+            print(f"✓ {hours_since_last:.1f} hours since last task - adding focus routine (long break)")
+    
+    slot = focus_routine_slot(next_event_time, current_time, is_first_task)
+    if slot is None:
+        print(f"⚠️  Task starts in {time_until_event} min - too soon for focus routine")
+        return None
+    
+    if generate_missing:
+        prepare_focus_routines([slot])
+    with _routine_library_lock:
+        template = _load_routine_library().get(_routine_key(*slot))
+    if not template:
+        # Not saved to the library, so the slot is generated again next run
+        print("ℹ️  No library routine for this slot - using the default routine")
+        template = _default_routine_template(slot[0], slot[2])
+    
+    # Re-time the library steps to start at current_time
+    routine = []
+    step_time = current_time
+    for step in template:
+        routine.append({"time": step_time.strftime('%I:%M %p'), **step})
+        step_time += datetime.timedelta(minutes=step['duration_minutes'])
+    
+    print(f"✓ Focus routine: {sum(step['duration_minutes'] for step in routine)} min, finishes at {step_time.strftime('%I:%M %p')}")
+    
+    return routine
+
+def _break_length(duration_minutes):
+    """Minutes of each break inside a task of this length (0 = no break)."""
+    if duration_minutes < MID_BREAK_MIN_TASK:
+        return 0
+    if duration_minutes < LONG_TASK_MINUTES:
+        return 5 if duration_minutes < 75 else 10
+    return 15 if duration_minutes >= 180 else 10
+
+def plan_task_segments(details):
+    """Split one task into work/break segments using the break rules.
+    
+    - Under 60 minutes: one work segment
+    - 60-150 minutes: one break in the middle (5-10 min), so neither stretch
+      runs past 90 minutes
+    - Over 150 minutes: a break after every 60 minutes of work (10-15 min); the
+      last work stretch may run up to 90 minutes rather than end on a tiny block
+    """
+    duration = details['duration_minutes']
+    break_minutes = _break_length(duration)
+    if not break_minutes:
+        return [(0, duration, 'work')]
+    
+    if duration <= MAX_WORK_STRETCH + WORK_STRETCH:
+        first = (duration - break_minutes) // 2
+        return [(0, first, 'work'), (first, first + break_minutes, 'break'),
+                (first + break_minutes, duration, 'work')]
+    
+    segments = []
+    offset = 0
+    while duration - offset > MAX_WORK_STRETCH:
+        segments.append((offset, offset + WORK_STRETCH, 'work'))
+        segments.append((offset + WORK_STRETCH, offset + WORK_STRETCH + break_minutes, 'break'))
+        offset += WORK_STRETCH + break_minutes
+    if offset < duration:
+        segments.append((offset, duration, 'work'))
+    return segments
+
+def _default_break_text(minutes):
+    if minutes <= 5:
+        return "Quick reset: stand up, breathe, sip water"
+    if minutes <= 10:
+        return "Short break: stretch and refill water"
+    return "Longer break: walk away from the screen and have a snack"
+
+def _break_text_key(task_title, minutes):
+    return f"{task_title.strip().lower()}|{minutes}"
+
+def _load_break_text_cache():
+    try:
+        with open(BREAK_TEXT_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def describe_breaks(requests, deadline=None):
+    """Break activity text for (task_title, minutes) pairs, written by the LLM.
+    
+    Answers are cached on disk, and everything not cached is asked for in a single
+    call that is cut off at deadline. Returns {} for anything the LLM could not provide.
+    """
+    cache = _load_break_text_cache()
+    missing = sorted({_break_text_key(title, minutes): (title, minutes)
+                      for title, minutes in requests
+                      if _break_text_key(title, minutes) not in cache}.items())
+    if missing:
+        prompt = f"""Suggest one short break activity (max 12 words) for each break below.
+Match the break to the kind of work and to its length.
+
+Breaks:
+{json.dumps([{"key": key, "task": title, "minutes": minutes} for key, (title, minutes) in missing], indent=2)}
+
+Return a JSON object mapping each key to its activity. Return ONLY valid JSON."""
+        try:
+            response = chat_completion(
+                deadline,
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": "You are a productivity expert. Return only valid JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=60 + 30 * len(missing)
+            )
+            content = response.choices[0].message.content.strip()
+            if content.startswith('```'):
+                content = content.split('```')[1]
+                if content.startswith('json'):
+                    content = content[4:]
+            answers = json.loads(content)
+            cache.update({key: str(answers[key]) for key, _ in missing if answers.get(key)})
+            with open(BREAK_TEXT_CACHE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"Error describing breaks: {e}")
+    return {(title, minutes): cache[_break_text_key(title, minutes)]
+            for title, minutes in requests if _break_text_key(title, minutes) in cache}
+
+def create_optimized_schedule_with_breaks(events, current_time, *, llm_break_text=None, previous_blocks=None, deadline=None):
+    """Build the work schedule with breaks inserted inside long tasks.
+    
+    Breaks are placed by plan_task_segments, so the schedule is deterministic
+    and instant. With llm_break_text (default: PLAN_LLM_BREAK_TEXT env var) the
+    LLM only writes the break activity text, in one cached batch; breaks keep
+    their default text if it has not answered by deadline.
+    
+    previous_blocks maps event_id to the task blocks of the saved timeline (see
+    index_existing_timeline); blocks whose event is unchanged, and blocks of
+    tasks that have already ended, are reused as they are.
+    """
+    if llm_break_text is None:
+        llm_break_text = os.getenv('PLAN_LLM_BREAK_TEXT', '').lower() in {'1', 'true', 'yes'}
     
     parsed_events = []
     for event in events:
@@ -272,79 +617,115 @@ def create_optimized_schedule_with_breaks(events, current_time):
     if not parsed_events:
         return None
     
-    schedule_info = []
+    previous_blocks = previous_blocks or {}
+    schedule = []
+    rebuilt = []
     for event in parsed_events:
-        # Mark if event is in past or future
         is_past = event['start'] < current_time
-        schedule_info.append({
-            'title': event['summary'],
-            'start': event['start'].strftime('%I:%M %p'),
-            'end': event['end'].strftime('%I:%M %p'),
-            'duration': event['duration_minutes'],
-            'description': event['description'][:200] if event['description'] else '',
-            'location': event['location'],
-            'event_id': event['event_id'],
-            'is_past': is_past
-        })
-    
-    prompt = f"""Analyze ALL tasks for today and insert appropriate breaks WITHIN each long task.
-
-Current time: {current_time.strftime('%I:%M %p')}
-
-ALL Tasks Today (past and future):
-{json.dumps(schedule_info, indent=2)}
-
-Rules:
-- Process ALL tasks regardless of is_past flag
-- For past tasks: Show them as-is with their original structure
-- For future tasks: Insert breaks where needed
-- 90+ minutes: Break every 60-90 min (10-15 min)
-- 60-90 minutes: One mid-task break (5-10 min)
-- Under 60 minutes: No break needed
-- Match break type to work type
-- Keep original start/end times
-- Include event_id in response
-
-Return JSON array with ALL tasks:
-[
-  {{
-    "event_id": "original_event_id",
-    "original_task": "task name",
-    "start": "HH:MM AM/PM",
-    "end": "HH:MM AM/PM",
-    "is_past": true/false,
-    "segments": [
-      {{"type": "work", "start": "HH:MM AM/PM", "end": "HH:MM AM/PM", "activity": "task"}},
-      {{"type": "break", "start": "HH:MM AM/PM", "end": "HH:MM AM/PM", "duration_minutes": 10, "activity": "break activity", "reason": "why needed"}}
-    ]
-  }}
-]
+        previous = previous_blocks.get(event['event_id'])
+        if previous is not None and (event['end'] <= current_time or _block_unchanged(previous, event)):
+            # Completed blocks stay frozen; unchanged ones keep their segments
+            schedule.append({**previous, "is_past": previous.get("is_past", False) or is_past})
+            continue
+        # Past tasks keep their original structure
+        layout = [(0, event['duration_minutes'], 'work')] if is_past else plan_task_segments(event)
+        segments = []
+        worked = 0
+        for begin, finish, kind in layout:
+            segment = {
+                "type": kind,
+                "start": (event['start'] + datetime.timedelta(minutes=begin)).strftime('%I:%M %p'),
+                "end": (event['start'] + datetime.timedelta(minutes=finish)).strftime('%I:%M %p'),
+            }
+            if kind == 'work':
+                segment["activity"] = event['summary']
+                worked += finish - begin
+            else:
+                segment["duration_minutes"] = finish - begin
+                segment["activity"] = _default_break_text(finish - begin)
+                segment["reason"] = f"Worked for {worked} minutes"
+                worked = 0
+            segments.append(segment)
+        block = {
+            "event_id": event['event_id'],
+            "updated": event['updated'],
+            "original_task": event['summary'],
+            "start": event['start'].strftime('%I:%M %p'),
+            "end": event['end'].strftime('%I:%M %p'),
+            "is_past": is_past,
+            "segments": segments
+        }
+        schedule.append(block)
+        rebuilt.append(block)
+    
+    if previous_blocks:
+        print(f"Reused {len(schedule) - len(rebuilt)} unchanged block(s), rebuilt {len(rebuilt)}")
+    
+    if llm_break_text:
+        wanted = [(block['original_task'], segment['duration_minutes'])
+                  for block in rebuilt for segment in block['segments'] if segment['type'] == 'break']
+        if wanted:
+            texts = describe_breaks(wanted, deadline)
+            for block in rebuilt:
+                for segment in block['segments']:
+                    if segment['type'] == 'break':
+                        text = texts.get((block['original_task'], segment['duration_minutes']))
+                        if text:
+                            segment['activity'] = text
+    
+    return schedule
 
-IMPORTANT: Include EVERY task from the input, marking past ones with is_past: true. Return ONLY valid JSON."""
+def _block_unchanged(block, event):
+    """True if a saved task block was built from this exact version of the event."""
+    return (
+        bool(event['updated'])
+        and block.get('updated') == event['updated']
+        and block.get('start') == event['start'].strftime('%I:%M %p')
+        and block.get('end') == event['end'].strftime('%I:%M %p')
+    )
 
+def index_existing_timeline(existing_timeline, current_time):
+    """Task blocks and focus routine sections of today's saved timeline, by event_id.
+    
+    Timelines generated on another day are ignored.
+    """
+    if not existing_timeline:
+        return {}, {}
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a productivity expert. Return only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        content = response.choices[0].message.content.strip()
-        if content.startswith('```'):
-            content = content.split('```')[1]
-            if content.startswith('json'):
-                content = content[4:]
-        
-        schedule = json.loads(content)
-        return schedule
+        generated_at = datetime.datetime.fromisoformat(existing_timeline['generated_at'])
+    except (KeyError, TypeError, ValueError):
+        return {}, {}
+    if generated_at.astimezone().date() != current_time.date():
+        return {}, {}
     
-    except Exception as e:
-        print(f"Error generating schedule: {e}")
+    blocks, focus_sections = {}, {}
+    for section in existing_timeline.get('sections', []):
+        if section.get('section_type') == 'work_schedule':
+            for item in section.get('items', []):
+                if item.get('event_id'):
+                    blocks[item['event_id']] = item
+        elif section.get('section_type') == 'focus_routine' and section.get('for_event_id'):
+            focus_sections[section['for_event_id']] = section
+    return blocks, focus_sections
+
+def reusable_focus_routine(section, task, routine_start_time):
+    """Focus routine entry rebuilt from a saved section, if it was made for this task version and start."""
+    if (
+        section is None
+        or not task['updated']
+        or section.get('event_updated') != task['updated']
+        or section.get('routine_start') != routine_start_time.isoformat()
+    ):
         return None
+    return {
+        'routine': section['items'],
+        'task_name': task['summary'],
+        'task_start': task['start'],
+        'reason': section.get('reason', ''),
+        'event_id': task['event_id'],
+        'event_updated': task['updated'],
+        'routine_start': routine_start_time,
+    }
 
 def merge_timelines(existing_timeline, new_schedule, focus_routine, current_time, focus_metadata=None):
     """Merge new schedule with existing timeline - preserve past, update future."""
@@ -405,6 +786,7 @@ def create_timeline_json(focus_routine, optimized_schedule, current_time, focus_
             task_item = {
                 "type": "task_block",
                 "event_id": task_block.get("event_id", ""),
+                "updated": task_block.get("updated", ""),
                 "original_task": task_block["original_task"],
                 "start": task_block["start"],
                 "end": task_block["end"],
@@ -452,6 +834,9 @@ def create_timeline_json_with_multiple_focus(all_focus_routines, optimized_sched
             "title": f"Focus Routine #{i+1}: Before {focus_info['task_name']}",
             "max_duration": "5 minutes",
             "for_task": focus_info['task_name'],
+            "for_event_id": focus_info.get('event_id', ''),
+            "event_updated": focus_info.get('event_updated', ''),
+            "routine_start": focus_info['routine_start'].isoformat() if focus_info.get('routine_start') else '',
             "task_start_time": focus_info['task_start'].strftime('%I:%M %p'),
             "reason": focus_info['reason'],
             "items": []
@@ -481,6 +866,7 @@ def create_timeline_json_with_multiple_focus(all_focus_routines, optimized_sched
             task_item = {
                 "type": "task_block",
                 "event_id": task_block.get("event_id", ""),
+                "updated": task_block.get("updated", ""),
                 "original_task": task_block["original_task"],
                 "start": task_block["start"],
                 "end": task_block["end"],
@@ -495,11 +881,16 @@ def create_timeline_json_with_multiple_focus(all_focus_routines, optimized_sched
     return timeline
 
 def save_timeline_json(timeline, filename="day_timeline.json"):
-    """Save timeline to JSON file."""
-    filepath = os.path.join(BASE_DIR, filename)
+    """Store timeline as a new plan version and mirror it to a JSON file."""
+    plan_date, version = TimelineStore().save(timeline)
+    print(f"Stored plan for {plan_date} as version {version}")
     
-    with open(filepath, 'w', encoding='utf-8') as f:
+    # Write-then-rename so readers of the file never see a half-written plan
+    filepath = os.path.join(BASE_DIR, filename)
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(timeline, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, filepath)
     
     return filepath
 
@@ -604,6 +995,9 @@ def main():
         print(f"\nFound existing timeline. Updating with latest schedule...")
         print(f"Last updated: {existing_timeline.get('last_updated', 'unknown')}")
     
+    # Blocks and routines of today's saved timeline, reused where the event is unchanged
+    previous_blocks, previous_focus = index_existing_timeline(existing_timeline, current_time)
+    
     print(f"\nCurrent time: {current_time.strftime('%I:%M %p')}")
     
     # Analyze ALL tasks and determine which ones need focus routines
@@ -658,30 +1052,74 @@ def main():
     print("=" * 80)
     print(f"\nTotal tasks needing focus routines: {len(tasks_needing_focus)}")
     
-    # Generate focus routines for all tasks that need them
+    # For the focus routine, use current time or a reasonable time before the task.
+    # If task is far in future (30+ min), start the routine 10 min before it.
+    for task_info in tasks_needing_focus:
+        task = task_info['task']
+        time_until_task = (task['start'] - current_time).total_seconds() / 60
+        task_info['routine_start'] = (
+            task['start'] - datetime.timedelta(minutes=10) if time_until_task > 30 else current_time
+        )
+    
+        task_info['reused'] = reusable_focus_routine(
+            previous_focus.get(task['event_id']), task, task_info['routine_start']
+        )
+    
+    # Missing library routines and the work schedule (which may ask the LLM for
+    # break text) are produced concurrently. Their LLM requests time out at the
+    # planning deadline, so both results are ready by then.
+    slots = [focus_routine_slot(info['task']['start'], info['routine_start'], info['is_first'])
+             for info in tasks_needing_focus if info['reused'] is None]
+    print("\nGenerating focus routines and optimized schedule with breaks...\n")
+    deadline = time.monotonic() + PLANNING_DEADLINE_SECONDS
+    planner = ThreadPoolExecutor(max_workers=2)
+    routines_future = planner.submit(prepare_focus_routines, [slot for slot in slots if slot], deadline)
+    schedule_future = planner.submit(
+        create_optimized_schedule_with_breaks, events, current_time,
+        previous_blocks=previous_blocks, deadline=deadline
+    )
+    planner.shutdown(wait=False)
+    
+    generated = routines_future.result()
+    if generated:
+        print(f"\nAdded {generated} routine(s) to the focus routine library")
+    optimized_schedule = schedule_future.result()
+    if time.monotonic() >= deadline:
+        print("⚠️  Planning deadline reached - missing routines use the default routine and break activities their default text this run")
+    
+    # Routines of tasks that have already started stay frozen
     all_focus_routines = []
+    for task in parsed_events:
+        section = previous_focus.get(task['event_id'])
+        if section is not None and task['start'] < current_time:
+            all_focus_routines.append({
+                'routine': section['items'],
+                'task_name': section.get('for_task', task['summary']),
+                'task_start': task['start'],
+                'reason': section.get('reason', ''),
+                'event_id': task['event_id'],
+                'event_updated': section.get('event_updated', ''),
+                'routine_start': (datetime.datetime.fromisoformat(section['routine_start'])
+                                  if section.get('routine_start') else None),
+            })
     
+    # Build focus routines for all tasks that need them
     for task_info in tasks_needing_focus:
         task = task_info['task']
+        routine_start_time = task_info['routine_start']
+        if task_info['reused'] is not None:
+            print(f"\nReusing focus routine for unchanged task: {task['summary']}")
+            all_focus_routines.append(task_info['reused'])
+            continue
         print(f"\nGenerating focus routine for: {task['summary']}")
         
-        # For the focus routine, use current time or a reasonable time before the task
-        # If task is far in future, we'll generate it to start ~5-10 min before task
-        time_until_task = (task['start'] - current_time).total_seconds() / 60
-        
-        if time_until_task > 30:
-            # Task is far in future - schedule focus routine to start 10 min before
-            routine_start_time = task['start'] - datetime.timedelta(minutes=10)
-        else:
-            # Task is soon - start focus routine now or shortly after current time
-            routine_start_time = current_time
-        
         focus_routine = generate_focus_prep_routine(
             task['start'],
             task,
             routine_start_time,
             is_first_task=task_info['is_first'],
-            time_since_last_task=240 if not task_info['is_first'] else None  # Pass 240 to indicate it's valid
+            time_since_last_task=240 if not task_info['is_first'] else None,  # Pass 240 to indicate it's valid
+            generate_missing=False
         )
         
         if focus_routine:
@@ -689,15 +1127,14 @@ def main():
                 'routine': focus_routine,
                 'task_name': task['summary'],
                 'task_start': task['start'],
-                'reason': task_info['reason']
+                'reason': task_info['reason'],
+                'event_id': task['event_id'],
+                'event_updated': task['updated'],
+                'routine_start': routine_start_time,
             })
     
     print(f"\nSuccessfully generated {len(all_focus_routines)} focus routine(s)")
     
-    # Generate work schedule with breaks
-    print("\nGenerating optimized schedule with breaks...\n")
-    optimized_schedule = create_optimized_schedule_with_breaks(events, current_time)
-    
     # Create timeline with ALL focus routines
     timeline = create_timeline_json_with_multiple_focus(
         all_focus_routines,
@@ -1,10 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext
-import json
-import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from timeline_loader import get_plan_loader
+
+# How often the viewer checks the timeline store for a new plan version (one indexed query)
+TIMELINE_POLL_MS = 2000
+
 class TimelineViewer:
     def __init__(self, root):
         self.root = root
@@ -29,6 +32,11 @@ class TimelineViewer:
         }
         
         self.timeline_data = None
+        self.timeline_loader = get_plan_loader()
+        self.timeline_index = None
+        # Widgets whose look depends on the clock, rebuilt or updated by update_statuses
+        self._rows = []
+        self._stats_label = None
         # Use system local time
         self.current_time = datetime.now().astimezone()
         
@@ -37,6 +45,9 @@ class TimelineViewer:
         
         # Auto-refresh every minute
         self.auto_refresh()
+        
+        # Reload as soon as the planner rewrites the timeline
+        self.root.after(TIMELINE_POLL_MS, self.watch_timeline)
     
     def setup_ui(self):
         """Setup the user interface."""
@@ -118,16 +129,22 @@ class TimelineViewer:
             self.canvas.yview_scroll(-1, "units")
     
     def load_timeline(self):
-        """Load timeline from JSON file."""
+        """Load today's latest plan from the timeline store."""
         try:
-            timeline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'day_timeline.json')
-            
-            if not os.path.exists(timeline_path):
-                self.show_error("Timeline file not found. Please run the main script first.")
+            try:
+                index = self.timeline_loader.index()
+            except FileNotFoundError:
+                self.timeline_data = None
+                self.show_error("No plan for today yet. Please run the main script first.")
                 return
             
-            with open(timeline_path, 'r', encoding='utf-8') as f:
-                self.timeline_data = json.load(f)
+            # Same content as what is on screen: only statuses need refreshing
+            timeline_data = index.timeline
+            if (timeline_data is self.timeline_data or timeline_data == self.timeline_data) and self._rows:
+                self.update_statuses()
+                return
+            self.timeline_data = timeline_data
+            self.timeline_index = index
             
             # Debug: Print focus routine info
             if 'focus_routine_info' in self.timeline_data:
@@ -144,7 +161,7 @@ class TimelineViewer:
                     print(f"   - {section_type}: {items_count} items")
             
             # Use system local time
-        self.current_time = datetime.now().astimezone()
+            self.current_time = datetime.now().astimezone()
             self.update_time_display()
             self.render_timeline()
             
@@ -159,49 +176,27 @@ class TimelineViewer:
         time_str = self.current_time.strftime('%I:%M %p - %A, %B %d, %Y')
         self.time_label.config(text=f"Current Time: {time_str}")
     
-    def parse_time_to_datetime(self, time_str):
-        """Parse time string (HH:MM AM/PM) to datetime object for today."""
-        try:
-            time_obj = datetime.strptime(time_str.strip(), '%I:%M %p')
-            return self.current_time.replace(
-                hour=time_obj.hour,
-                minute=time_obj.minute,
-                second=0,
-                microsecond=0
-            )
-        except:
-            return None
-    
-    def get_task_status(self, start_time_str, end_time_str):
+    def get_task_status(self, item):
         """
-        Determine if a task is past, ongoing, or future.
+        Determine if a task, segment or focus step is past, ongoing, or future.
         Returns: ('past', None), ('ongoing', progress_percent), or ('future', None)
-        """
-        start_dt = self.parse_time_to_datetime(start_time_str)
-        end_dt = self.parse_time_to_datetime(end_time_str)
         
-        if not start_dt or not end_dt:
+        Times come pre-parsed from the shared timeline index.
+        """
+        if self.timeline_index is None:
             return ('unknown', None)
-        
-        if self.current_time < start_dt:
-            return ('future', None)
-        elif self.current_time > end_dt:
-            return ('past', None)
-        else:
-            # Ongoing - calculate progress
-            total_duration = (end_dt - start_dt).total_seconds()
-            elapsed = (self.current_time - start_dt).total_seconds()
-            progress = (elapsed / total_duration) * 100 if total_duration > 0 else 0
-            return ('ongoing', min(100, max(0, progress)))
+        return self.timeline_index.status(self.timeline_index.block_for(item), self.current_time)
     
     def get_segment_status(self, segment):
         """Get status for a specific segment."""
-        return self.get_task_status(segment['start'], segment['end'])
+        return self.get_task_status(segment)
     
     def show_error(self, message):
         """Show error message."""
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
+        self._rows = []
+        self._stats_label = None
         
         error_label = tk.Label(
             self.scrollable_frame,
@@ -213,11 +208,86 @@ class TimelineViewer:
         )
         error_label.pack()
     
+    def _add_row(self, status_fn, build_fn):
+        """Pack a row whose contents depend on its status.
+        
+        status_fn() returns (status, progress); build_fn(frame, status, progress)
+        fills the row and returns its progress bar (see _create_progress_bar) or None.
+        """
+        row_frame = tk.Frame(self.scrollable_frame, bg='white')
+        row_frame.pack(fill=tk.X, pady=2)
+        row = {'frame': row_frame, 'status_fn': status_fn, 'build_fn': build_fn, 'status': None, 'progress_bar': None}
+        self._rows.append(row)
+        self._update_row(row)
+    
+    def _update_row(self, row):
+        """Rebuild a row if its status changed, otherwise just move its progress bar."""
+        status, progress = row['status_fn']()
+        if status != row['status']:
+            for widget in row['frame'].winfo_children():
+                widget.destroy()
+            row['status'] = status
+            row['progress_bar'] = row['build_fn'](row['frame'], status, progress)
+        elif row['progress_bar'] is not None and progress is not None:
+            self._set_progress(row['progress_bar'], progress)
+    
+    def update_statuses(self):
+        """Refresh the clock-dependent parts of the timeline without rebuilding it."""
+        # Use system local time
+        self.current_time = datetime.now().astimezone()
+        self.update_time_display()
+        for row in self._rows:
+            self._update_row(row)
+        if self._stats_label is not None:
+            self._stats_label.config(text=self.summary_stats_text())
+    
+    def _create_progress_bar(self, parent, bg_color, pady, fill_color, progress, bar_width=None):
+        """Draw a progress bar; returns a handle for _set_progress."""
+        progress_frame = tk.Frame(parent, bg=bg_color)
+        progress_frame.pack(fill=tk.X, padx=15, pady=pady)
+        
+        # Progress bar background
+        progress_bg = tk.Canvas(
+            progress_frame,
+            height=25,
+            bg=self.colors['progress_bg'],
+            highlightthickness=0
+        )
+        progress_bg.pack(fill=tk.X)
+        
+        if bar_width is None:
+            bar_width = progress_bg.winfo_reqwidth() if progress_bg.winfo_reqwidth() > 0 else 870
+        
+        # Progress bar fill
+        fill_id = progress_bg.create_rectangle(0, 0, 0, 25, fill=fill_color, outline='')
+        
+        # Progress text
+        text_id = progress_bg.create_text(bar_width // 2, 12, font=('Arial', 10, 'bold'))
+        
+        progress_bar = {'canvas': progress_bg, 'fill': fill_id, 'text': text_id, 'width': bar_width, 'progress': None}
+        self._set_progress(progress_bar, progress)
+        return progress_bar
+    
+    def _set_progress(self, progress_bar, progress):
+        shown = round(progress, 1)
+        if shown == progress_bar['progress']:
+            return
+        progress_bar['progress'] = shown
+        canvas = progress_bar['canvas']
+        canvas.coords(progress_bar['fill'], 0, 0, int(progress_bar['width'] * (progress / 100)), 25)
+        canvas.itemconfig(
+            progress_bar['text'],
+            text=f"{progress:.1f}% Complete",
+            fill='white' if progress > 50 else self.colors['text']
+        )
+    
     def render_timeline(self):
         """Render the complete timeline."""
         # Clear existing content
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
+        self._rows = []
+        self._stats_label = None
         
         if not self.timeline_data or 'sections' not in self.timeline_data:
             self.show_error("No timeline data available")
@@ -400,21 +470,18 @@ class TimelineViewer:
     
     def render_focus_item(self, item, is_last):
         """Render a single focus routine item."""
-        # Get status of this focus item
-        time_str = item['time']
-        duration = item['duration_minutes']
-        start_dt = self.parse_time_to_datetime(time_str)
-        
-        status = 'future'
-        progress = None
-        if start_dt:
-            end_dt = start_dt + timedelta(minutes=duration)
-            end_time_str = end_dt.strftime('%I:%M %p')
-            status, progress = self.get_task_status(time_str, end_time_str)
-        
-        item_frame = tk.Frame(self.scrollable_frame, bg='white')
-        item_frame.pack(fill=tk.X, pady=2)
-        
+        self._add_row(
+            lambda: self.get_focus_item_status(item),
+            lambda item_frame, status, progress: self._build_focus_item(item_frame, item, is_last, status, progress)
+        )
+    
+    def get_focus_item_status(self, item):
+        """Get status for a focus routine step."""
+        status, progress = self.get_task_status(item)
+        return ('future', None) if status == 'unknown' else (status, progress)
+    
+    def _build_focus_item(self, item_frame, item, is_last, status, progress):
+        """Fill a focus routine row for the given status."""
         # Timeline section
         timeline_frame = tk.Frame(item_frame, width=100, bg='white')
         timeline_frame.pack(side=tk.LEFT, fill=tk.Y)
@@ -506,35 +573,9 @@ class TimelineViewer:
         activity_label.pack(fill=tk.X, padx=15, pady=(10, 5))
         
         # Progress bar for ongoing tasks
+        progress_bar = None
         if status == 'ongoing' and progress is not None:
-            progress_frame = tk.Frame(content_frame, bg=bg_color)
-            progress_frame.pack(fill=tk.X, padx=15, pady=(0, 5))
-            
-            # Progress bar background
-            progress_bg = tk.Canvas(
-                progress_frame,
-                height=25,
-                bg=self.colors['progress_bg'],
-                highlightthickness=0
-            )
-            progress_bg.pack(fill=tk.X)
-            
-            # Progress bar fill
-            bar_width = progress_bg.winfo_reqwidth() if progress_bg.winfo_reqwidth() > 0 else 870
-            fill_width = int(bar_width * (progress / 100))
-            progress_bg.create_rectangle(
-                0, 0, fill_width, 25,
-                fill=self.colors['ongoing'],
-                outline=''
-            )
-            
-            # Progress text
-            progress_bg.create_text(
-                bar_width // 2, 12,
-                text=f"{progress:.1f}% Complete",
-                font=('Arial', 10, 'bold'),
-                fill='white' if progress > 50 else self.colors['text']
-            )
+            progress_bar = self._create_progress_bar(content_frame, bg_color, (0, 5), self.colors['ongoing'], progress)
         
         # Description
         desc_label = tk.Label(
@@ -561,6 +602,7 @@ class TimelineViewer:
             justify=tk.LEFT
         )
         purpose_label.pack(fill=tk.X, padx=15, pady=(3, 10))
+        return progress_bar
     
     def render_work_schedule(self, section, start_y):
         """Render work schedule section."""
@@ -668,17 +710,21 @@ class TimelineViewer:
     
     def render_segment(self, segment, parent_is_past, is_last_segment):
         """Render a work or break segment with progress tracking."""
-        # Get segment status
-        status, progress = self.get_segment_status(segment)
-        
-        # Override with parent status if parent is past
-        if parent_is_past:
-            status = 'past'
-            progress = None
-        
-        segment_frame = tk.Frame(self.scrollable_frame, bg='white')
-        segment_frame.pack(fill=tk.X, pady=2)
-        
+        def status_fn():
+            # Override with parent status if parent is past
+            if parent_is_past:
+                return 'past', None
+            return self.get_segment_status(segment)
+        
+        self._add_row(
+            status_fn,
+            lambda segment_frame, status, progress: self._build_segment(
+                segment_frame, segment, is_last_segment, status, progress
+            )
+        )
+    
+    def _build_segment(self, segment_frame, segment, is_last_segment, status, progress):
+        """Fill a work or break segment row for the given status."""
         # Timeline section
         timeline_frame = tk.Frame(segment_frame, width=100, bg='white')
         timeline_frame.pack(side=tk.LEFT, fill=tk.Y)
@@ -836,36 +882,9 @@ class TimelineViewer:
         
         # Add progress bar for ongoing segments
         if status == 'ongoing' and progress is not None:
-            progress_frame = tk.Frame(content_frame, bg=bg_color)
-            progress_frame.pack(fill=tk.X, padx=15, pady=(5, 10))
-            
-            # Progress bar background
-            progress_bg = tk.Canvas(
-                progress_frame,
-                height=25,
-                bg=self.colors['progress_bg'],
-                highlightthickness=0
-            )
-            progress_bg.pack(fill=tk.X)
-            
-            # Calculate bar dimensions
-            bar_width = 870  # Approximate width
-            fill_width = int(bar_width * (progress / 100))
-            
-            # Progress bar fill
-            progress_bg.create_rectangle(
-                0, 0, fill_width, 25,
-                fill=marker_color,
-                outline=''
-            )
-            
-            # Progress text
-            progress_bg.create_text(
-                bar_width // 2, 12,
-                text=f"{progress:.1f}% Complete",
-                font=('Arial', 10, 'bold'),
-                fill='white' if progress > 50 else self.colors['text']
-            )
+            # Approximate width
+            return self._create_progress_bar(content_frame, bg_color, (5, 10), marker_color, progress, bar_width=870)
+        return None
     
     def render_summary_footer(self):
         """Render a summary footer with key information."""
@@ -888,43 +907,15 @@ class TimelineViewer:
         )
         title_label.pack(fill=tk.X, padx=15, pady=(10, 5))
         
-        # Count sections
-        focus_count = 0
-        work_count = 0
-        completed_count = 0
-        ongoing_count = 0
-        upcoming_count = 0
-        
-        for section in self.timeline_data.get('sections', []):
-            if section['section_type'] == 'focus_routine':
-                focus_count = len(section.get('items', []))
-            elif section['section_type'] == 'work_schedule':
-                work_count = len(section.get('items', []))
-                for item in section.get('items', []):
-                    if item.get('is_past'):
-                        completed_count += 1
-                    else:
-                        # Check if ongoing
-                        status, _ = self.get_task_status(item['start'], item['end'])
-                        if status == 'ongoing':
-                            ongoing_count += 1
-                        else:
-                            upcoming_count += 1
-        
-        # Display stats
-        stats_text = f"✅ Completed Tasks: {completed_count}  |  ⏳ Ongoing: {ongoing_count}  |  🔜 Upcoming: {upcoming_count}"
-        if focus_count > 0:
-            stats_text += f"  |  🎯 Focus Steps: {focus_count}"
-        
-        stats_label = tk.Label(
+        self._stats_label = tk.Label(
             footer_frame,
-            text=stats_text,
+            text=self.summary_stats_text(),
             font=('Arial', 11),
             fg=self.colors['text'],
             bg='#f8f9fa',
             anchor='w'
         )
-        stats_label.pack(fill=tk.X, padx=15, pady=(5, 10))
+        self._stats_label.pack(fill=tk.X, padx=15, pady=(5, 10))
         
         # Focus routine status
         if 'focus_routine_info' in self.timeline_data:
@@ -949,11 +940,51 @@ class TimelineViewer:
                 )
             focus_status.pack(fill=tk.X, padx=15, pady=(0, 10))
     
+    def summary_stats_text(self):
+        """Task counts shown in the summary footer."""
+        # Count sections
+        focus_count = 0
+        work_count = 0
+        completed_count = 0
+        ongoing_count = 0
+        upcoming_count = 0
+        
+        for section in self.timeline_data.get('sections', []):
+            if section['section_type'] == 'focus_routine':
+                focus_count = len(section.get('items', []))
+            elif section['section_type'] == 'work_schedule':
+                work_count = len(section.get('items', []))
+                for item in section.get('items', []):
+                    if item.get('is_past'):
+                        completed_count += 1
+                    else:
+                        # Check if ongoing
+                        status, _ = self.get_task_status(item)
+                        if status == 'ongoing':
+                            ongoing_count += 1
+                        else:
+                            upcoming_count += 1
+        
+        # Display stats
+        stats_text = f"✅ Completed Tasks: {completed_count}  |  ⏳ Ongoing: {ongoing_count}  |  🔜 Upcoming: {upcoming_count}"
+        if focus_count > 0:
+            stats_text += f"  |  🎯 Focus Steps: {focus_count}"
+        return stats_text
+    
+    def watch_timeline(self):
+        """Reload the timeline when a new plan version is stored (or the day changes)."""
+        try:
+            if self.timeline_loader.changed():
+                self.load_timeline()
+        except Exception as e:
+            # e.g. "database is locked" while the planner writes; try again next poll
+            print(f"Timeline check failed: {e}")
+        finally:
+            self.root.after(TIMELINE_POLL_MS, self.watch_timeline)
+    
     def auto_refresh(self):
         """Auto-refresh the timeline every minute."""
-        # Use system local time
-        self.current_time = datetime.now().astimezone()
-        self.update_time_display()
+        self.update_statuses()
         
         # Schedule next refresh in 60 seconds
         self.root.after(60000, self.auto_refresh)
@@ -0,0 +1,163 @@
+"""Sorted interval index over a day timeline.
+
+Every focus step, task block and work/break segment is parsed once into
+absolute, timezone-aware start and end times. Status checks are then plain
+comparisons, and "what is on now" / "what comes next" are bisect lookups.
+Build it through TimelineLoader.index() so the viewer, the API and anything
+else polling the timeline share one copy per file version.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+
+class TimelineBlock:
+    """One timed entry of the timeline; item is the original JSON dict."""
+
+    __slots__ = ('kind', 'start', 'end', 'item', 'task')
+
+    def __init__(self, kind, start, end, item, task=None):
+        self.kind = kind        # 'focus', 'task' or 'segment'
+        self.start = start
+        self.end = end
+        self.item = item
+        self.task = task        # enclosing task block for segments
+
+    @property
+    def title(self):
+        item = self.item
+        if self.kind == 'task':
+            return item.get('original_task', '')
+        if self.kind == 'segment' and item.get('type') == 'break':
+            return f"Break: {item.get('activity', '')}"
+        return item.get('activity', '')
+
+    def to_dict(self):
+        data = {
+            'kind': self.kind,
+            'title': self.title,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'item': self.item,
+        }
+        if self.task is not None:
+            data['task'] = self.task.item.get('original_task', '')
+            data['event_id'] = self.task.item.get('event_id', '')
+        elif self.kind == 'task':
+            data['event_id'] = self.item.get('event_id', '')
+        return data
+
+
+class _Intervals:
+    """Intervals sorted by start, with parallel start/end arrays and a running max of ends."""
+
+    def __init__(self, blocks):
+        self.blocks = sorted(blocks, key=lambda block: (block.start, block.end))
+        self.starts = [block.start for block in self.blocks]
+        self.max_ends = []
+        running = None
+        for block in self.blocks:
+            running = block.end if running is None or block.end > running else running
+            self.max_ends.append(running)
+
+    def at(self, moment):
+        """Blocks containing moment, latest start first."""
+        found = []
+        i = bisect_right(self.starts, moment) - 1
+        # max_ends is non-decreasing, so once it falls behind moment nothing earlier can contain it
+        while i >= 0 and self.max_ends[i] >= moment:
+            if self.blocks[i].end >= moment:
+                found.append(self.blocks[i])
+            i -= 1
+        return found
+
+    def after(self, moment):
+        """First block starting strictly after moment."""
+        i = bisect_right(self.starts, moment)
+        return self.blocks[i] if i < len(self.blocks) else None
+
+
+class TimelineIndex:
+    def __init__(self, timeline):
+        self.timeline = timeline
+        self.day = _timeline_day(timeline)
+        self._by_item = {}
+        steps, tasks = [], []
+        for section in timeline.get('sections', []):
+            if section.get('section_type') == 'focus_routine':
+                for item in section.get('items', []):
+                    start = self._at(item.get('time'))
+                    if start is not None:
+                        end = start + timedelta(minutes=item.get('duration_minutes', 0))
+                        steps.append(self._add(TimelineBlock('focus', start, end, item)))
+            elif section.get('section_type') == 'work_schedule':
+                for item in section.get('items', []):
+                    task = self._span('task', item)
+                    if task is None:
+                        continue
+                    tasks.append(task)
+                    for segment in item.get('segments', []):
+                        block = self._span('segment', segment, task)
+                        if block is not None:
+                            steps.append(block)
+        # Focus steps and segments are the blocks a user is "in"; tasks group segments
+        self._steps = _Intervals(steps)
+        self._tasks = _Intervals(tasks)
+
+    def block_for(self, item):
+        """Pre-parsed block for a focus step, task or segment dict of this timeline."""
+        return self._by_item.get(id(item))
+
+    @staticmethod
+    def status(block, moment):
+        """('past', None), ('ongoing', progress_percent) or ('future', None); ('unknown', None) without a block."""
+        if block is None:
+            return ('unknown', None)
+        if moment < block.start:
+            return ('future', None)
+        if moment > block.end:
+            return ('past', None)
+        total = (block.end - block.start).total_seconds()
+        progress = (moment - block.start).total_seconds() / total * 100 if total > 0 else 0
+        return ('ongoing', min(100, max(0, progress)))
+
+    def current(self, moment):
+        """Focus step or segment in progress at moment (the latest-starting one), or None."""
+        blocks = self._steps.at(moment)
+        return blocks[0] if blocks else None
+
+    def current_task(self, moment):
+        blocks = self._tasks.at(moment)
+        return blocks[0] if blocks else None
+
+    def next(self, moment):
+        """First focus step or segment that starts after moment, or None."""
+        return self._steps.after(moment)
+
+    def _add(self, block):
+        self._by_item[id(block.item)] = block
+        return block
+
+    def _span(self, kind, item, task=None):
+        start, end = self._at(item.get('start')), self._at(item.get('end'))
+        if start is None or end is None:
+            return None
+        if end < start:  # runs past midnight
+            end += timedelta(days=1)
+        return self._add(TimelineBlock(kind, start, end, item, task))
+
+    def _at(self, time_str):
+        """Absolute local time for an "HH:MM AM/PM" string on the timeline's day."""
+        try:
+            clock = datetime.strptime(time_str.strip(), '%I:%M %p').time()
+        except (AttributeError, ValueError):
+            return None
+        return datetime.combine(self.day, clock).astimezone()
+
+
+def _timeline_day(timeline):
+    """Local calendar day the timeline was generated for (today if unknown)."""
+    try:
+        return datetime.fromisoformat(timeline['generated_at']).astimezone().date()
+    except (KeyError, TypeError, ValueError):
+        return datetime.now().astimezone().date()
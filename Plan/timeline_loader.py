@@ -0,0 +1,168 @@
+"""Shared, change-aware loaders for the day timeline.
+
+Used by the Tkinter viewer (timeline.py) and the mail API's /timeline endpoint.
+TimelineLoader caches day_timeline.json and only re-reads it when the file's
+mtime, size or inode change, so polling it is a single os.stat call.
+PlanLoader does the same for one day's plan in the SQLite timeline store,
+keyed on the plan version, so polling it is a single indexed query.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from timeline_index import TimelineIndex
+from timeline_store import DEFAULT_STORE_PATH, TimelineStore
+
+DEFAULT_TIMELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'day_timeline.json')
+
+
+class TimelineLoader:
+    """Caches one timeline file keyed on (mtime, size, inode)."""
+
+    def __init__(self, path=DEFAULT_TIMELINE_PATH):
+        self.path = os.fspath(path)
+        self._lock = threading.Lock()
+        self._key = None
+        self._data = None
+        self._raw = None
+        self._etag = None
+        self._index = None
+
+    def _stat_key(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def changed(self):
+        """True if the file differs from the cached copy (or appeared/disappeared)."""
+        try:
+            return self._stat_key() != self._key
+        except FileNotFoundError:
+            return self._key is not None
+
+    def load(self):
+        """Return (timeline, etag), re-parsing only if the file changed.
+
+        Raises FileNotFoundError if the file is missing and ValueError
+        (json.JSONDecodeError) if it is not valid JSON.
+        """
+        self._refresh()
+        return self._data, self._etag
+
+    def load_raw(self):
+        """Return (json_bytes, etag) exactly as stored on disk, for HTTP responses."""
+        self._refresh()
+        return self._raw, self._etag
+
+    def index(self):
+        """TimelineIndex for the current file version, built once per version."""
+        self._refresh()
+        with self._lock:
+            if self._index is None or self._index[0] != self._key:
+                self._index = (self._key, TimelineIndex(self._data))
+            return self._index[1]
+
+    def _refresh(self):
+        with self._lock:
+            try:
+                key = self._stat_key()
+            except FileNotFoundError:
+                self._key = self._data = self._raw = self._etag = self._index = None
+                raise
+            if key == self._key:
+                return
+            raw = self._read(key)
+            data = json.loads(raw.decode('utf-8'))
+            self._key, self._data, self._raw = key, data, raw
+            self._etag = make_etag(raw)
+
+    def _read(self, key):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class PlanLoader(TimelineLoader):
+    """Caches the latest stored plan of one day, keyed on (day, plan id, version).
+
+    With plan_date None the loader follows the local calendar day, so a viewer
+    left running picks up the next day's plan after midnight.
+    """
+
+    def __init__(self, store, plan_date=None):
+        super().__init__(store.path)
+        self.store = store
+        self.plan_date = plan_date
+
+    def _stat_key(self):
+        day = self.plan_date or datetime.now().astimezone().date().isoformat()
+        latest = self.store.latest_version(day)
+        if latest is None:
+            raise FileNotFoundError(f"No stored plan for {day}")
+        return (day, *latest)
+
+    def _read(self, key):
+        day, _, version = key
+        return plan_bytes(self.store.load(day, version))
+
+
+_loaders = {}
+_loaders_lock = threading.Lock()
+_stores = {}
+
+
+def get_timeline_store(store_path=DEFAULT_STORE_PATH):
+    """Process-wide TimelineStore for store_path.
+
+    Opening a store imports an existing day_timeline.json whose day has no
+    stored plan yet, so viewers keep working until the planner next runs.
+    """
+    store_path = os.path.abspath(os.fspath(store_path))
+    with _loaders_lock:
+        store = _stores.get(store_path)
+        if store is None:
+            store = _stores[store_path] = TimelineStore(store_path)
+            store.import_json(DEFAULT_TIMELINE_PATH)
+        return store
+
+
+def get_plan_loader(store_path=DEFAULT_STORE_PATH):
+    """Process-wide loader for today's latest plan.
+
+    Only today's plan is polled often enough to be worth caching; read other
+    days with load_plan_raw so browsing dates does not pile up cached copies.
+    """
+    store = get_timeline_store(store_path)
+    with _loaders_lock:
+        loader = _loaders.get((store.path, None))
+        if loader is None:
+            loader = _loaders[(store.path, None)] = PlanLoader(store)
+        return loader
+
+
+def load_plan_raw(plan_date, version=None, store_path=DEFAULT_STORE_PATH):
+    """Uncached (json_bytes, etag) of a stored plan; raises FileNotFoundError if there is none."""
+    timeline = get_timeline_store(store_path).load(plan_date, version)
+    if timeline is None:
+        raise FileNotFoundError(f"No stored plan for {plan_date}")
+    raw = plan_bytes(timeline)
+    return raw, make_etag(raw)
+
+
+def plan_bytes(timeline):
+    return json.dumps(timeline, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def make_etag(raw):
+    """Strong validator: identical bytes give the same ETag even after a rewrite."""
+    return '"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value matches etag."""
+    if not if_none_match or not etag:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return '*' in candidates or any(value.removeprefix('W/') == etag for value in candidates)
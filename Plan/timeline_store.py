@@ -0,0 +1,231 @@
+"""SQLite history of planner output, one version per run and day.
+
+Each saved plan becomes a PlanVersion row plus one row per section, task block
+or focus step (PlanBlock) and per work/break segment (PlanSegment), written in
+a single transaction. Readers fetch one day's latest (or a given) version with
+indexed queries; the stored rows rebuild the same document shape as
+day_timeline.json, with "plan_date" and "version" added.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import date, datetime
+
+from timeline_index import TimelineIndex
+
+DEFAULT_STORE_PATH = os.getenv(
+    'PLAN_TIMELINE_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timeline.db')
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS PlanVersion(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plan_date TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    generated_at TEXT,
+    header_json TEXT,
+    created_at TEXT,
+    UNIQUE(plan_date, version)
+);
+CREATE TABLE IF NOT EXISTS PlanSection(
+    plan_id INTEGER NOT NULL REFERENCES PlanVersion(id),
+    position INTEGER NOT NULL,
+    section_type TEXT,
+    header_json TEXT,
+    PRIMARY KEY (plan_id, position)
+);
+CREATE TABLE IF NOT EXISTS PlanBlock(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plan_id INTEGER NOT NULL REFERENCES PlanVersion(id),
+    section_position INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    kind TEXT,
+    event_id TEXT,
+    start_ts REAL,
+    end_ts REAL,
+    item_json TEXT
+);
+CREATE TABLE IF NOT EXISTS PlanSegment(
+    block_id INTEGER NOT NULL REFERENCES PlanBlock(id),
+    position INTEGER NOT NULL,
+    segment_type TEXT,
+    start_ts REAL,
+    end_ts REAL,
+    segment_json TEXT,
+    PRIMARY KEY (block_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_plan_block_plan ON PlanBlock(plan_id, section_position, position);
+CREATE INDEX IF NOT EXISTS idx_plan_block_event ON PlanBlock(event_id);
+CREATE INDEX IF NOT EXISTS idx_plan_block_start ON PlanBlock(start_ts);
+"""
+
+
+class TimelineStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = os.fspath(path)
+        con = self._connect()
+        try:
+            # Readers keep seeing the previous version while a new one is written
+            con.execute('PRAGMA journal_mode=WAL')
+            con.executescript(_SCHEMA)
+        finally:
+            con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def save(self, timeline):
+        """Store timeline as the next version of its day; returns (plan_date, version)."""
+        index = TimelineIndex(timeline)
+        plan_date = index.day.isoformat()
+        header = {key: value for key, value in timeline.items() if key not in ('sections', 'plan_date', 'version')}
+        con = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock before the version number is read
+            con.execute('BEGIN IMMEDIATE')
+            row = con.execute(
+                'SELECT COALESCE(MAX(version), 0) FROM PlanVersion WHERE plan_date=?', (plan_date,)
+            ).fetchone()
+            version = row[0] + 1
+            plan_id = con.execute(
+                """INSERT INTO PlanVersion(plan_date, version, generated_at, header_json, created_at)
+                VALUES(?,?,?,?,?)""",
+                (plan_date, version, timeline.get('generated_at'), json.dumps(header, ensure_ascii=False),
+                 datetime.now().astimezone().isoformat())
+            ).lastrowid
+            for section_position, section in enumerate(timeline.get('sections', [])):
+                section_header = {key: value for key, value in section.items() if key != 'items'}
+                con.execute(
+                    'INSERT INTO PlanSection(plan_id, position, section_type, header_json) VALUES(?,?,?,?)',
+                    (plan_id, section_position, section.get('section_type'), json.dumps(section_header, ensure_ascii=False))
+                )
+                for position, item in enumerate(section.get('items', [])):
+                    start_ts, end_ts = _bounds(index, item)
+                    block_item = {key: value for key, value in item.items() if key != 'segments'}
+                    block_id = con.execute(
+                        """INSERT INTO PlanBlock(plan_id, section_position, position, kind, event_id, start_ts, end_ts, item_json)
+                        VALUES(?,?,?,?,?,?,?,?)""",
+                        (plan_id, section_position, position, item.get('type'), item.get('event_id'),
+                         start_ts, end_ts, json.dumps(block_item, ensure_ascii=False))
+                    ).lastrowid
+                    con.executemany(
+                        """INSERT INTO PlanSegment(block_id, position, segment_type, start_ts, end_ts, segment_json)
+                        VALUES(?,?,?,?,?,?)""",
+                        [(block_id, segment_position, segment.get('type'), *_bounds(index, segment),
+                          json.dumps(segment, ensure_ascii=False))
+                         for segment_position, segment in enumerate(item.get('segments', []))]
+                    )
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            con.close()
+        return plan_date, version
+
+    def import_json(self, path):
+        """Store a day_timeline.json file unless its day already has a plan; returns the version or None."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                timeline = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.latest_version(TimelineIndex(timeline).day) is not None:
+            return None
+        return self.save(timeline)[1]
+
+    def latest_version(self, plan_date):
+        """(plan_id, version) of the newest plan for plan_date, or None."""
+        with self._connect() as con:
+            row = con.execute(
+                'SELECT id, version FROM PlanVersion WHERE plan_date=? ORDER BY version DESC LIMIT 1',
+                (_day(plan_date),)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def versions(self, plan_date):
+        """[(version, generated_at), ...] for plan_date, oldest first."""
+        with self._connect() as con:
+            return con.execute(
+                'SELECT version, generated_at FROM PlanVersion WHERE plan_date=? ORDER BY version',
+                (_day(plan_date),)
+            ).fetchall()
+
+    def plan_dates(self, start=None, end=None):
+        """Days between start and end (inclusive ISO dates) that have a plan."""
+        with self._connect() as con:
+            return [row[0] for row in con.execute(
+                'SELECT DISTINCT plan_date FROM PlanVersion WHERE plan_date >= ? AND plan_date <= ? ORDER BY plan_date',
+                (_day(start) if start else '0000-00-00', _day(end) if end else '9999-99-99')
+            )]
+
+    def load(self, plan_date, version=None):
+        """Rebuild the timeline document for plan_date (latest version by default), or None."""
+        plan_date = _day(plan_date)
+        with self._connect() as con:
+            if version is None:
+                row = con.execute(
+                    """SELECT id, version, header_json FROM PlanVersion WHERE plan_date=?
+                    ORDER BY version DESC LIMIT 1""",
+                    (plan_date,)
+                ).fetchone()
+            else:
+                row = con.execute(
+                    'SELECT id, version, header_json FROM PlanVersion WHERE plan_date=? AND version=?',
+                    (plan_date, version)
+                ).fetchone()
+            if row is None:
+                return None
+            plan_id, version, header_json = row
+            sections = [
+                dict(json.loads(section_json), items=[])
+                for (section_json,) in con.execute(
+                    'SELECT header_json FROM PlanSection WHERE plan_id=? ORDER BY position', (plan_id,)
+                )
+            ]
+            blocks = {}
+            for block_id, section_position, item_json in con.execute(
+                'SELECT id, section_position, item_json FROM PlanBlock WHERE plan_id=? ORDER BY section_position, position',
+                (plan_id,)
+            ):
+                item = json.loads(item_json)
+                sections[section_position]['items'].append(item)
+                blocks[block_id] = item
+            for block_id, segment_json in con.execute(
+                """SELECT s.block_id, s.segment_json FROM PlanSegment s JOIN PlanBlock b ON b.id = s.block_id
+                WHERE b.plan_id=? ORDER BY s.block_id, s.position""",
+                (plan_id,)
+            ):
+                blocks[block_id].setdefault('segments', []).append(json.loads(segment_json))
+        timeline = json.loads(header_json)
+        timeline.update(plan_date=plan_date, version=version, sections=sections)
+        return timeline
+
+    def event_history(self, event_id):
+        """[(plan_date, version, item), ...] for every stored block of a calendar event."""
+        with self._connect() as con:
+            return [
+                (plan_date, version, json.loads(item_json))
+                for plan_date, version, item_json in con.execute(
+                    """SELECT p.plan_date, p.version, b.item_json FROM PlanBlock b
+                    JOIN PlanVersion p ON p.id = b.plan_id WHERE b.event_id=? ORDER BY p.plan_date, p.version""",
+                    (event_id,)
+                )
+            ]
+
+
+def _bounds(index, item):
+    block = index.block_for(item)
+    if block is None:
+        return None, None
+    return block.start.timestamp(), block.end.timestamp()
+
+
+def _day(value):
+    if value is None:
+        return datetime.now().astimezone().date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
@@ -1,8 +1,12 @@
 # google_calendar_sync.py
 import os
 import json
+import sqlite3
 import datetime
+import threading
 from pathlib import Path
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -12,6 +16,21 @@ from googleapiclient.errors import HttpError
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# FocusMate's mail server mirrors the calendar into its SQLite database; upcoming
+# events are read from it when it has synced recently.
+MIRROR_DB_PATH = os.getenv(
+    'FOCUSMATE_DB_PATH',
+    str(Path(__file__).resolve().parent.parent.parent / 'Email' / 'focusmate.db')
+)
+MIRROR_MAX_AGE = datetime.timedelta(minutes=15)
+
+# Credentials and discovery services are shared by every GoogleCalendarSync in the
+# process (keyed by credentials file); HTTP transports are per thread because
+# httplib2 is not thread-safe.
+_auth_lock = threading.Lock()
+_shared_auth = {}
+_thread_http = threading.local()
+
 class GoogleCalendarSync:
     def __init__(self, tasks_dir: str = "tasks", credentials_file: str = "credentials.json"):
         """
@@ -24,10 +43,34 @@ class GoogleCalendarSync:
         self.tasks_dir = tasks_dir
         self.credentials_file = credentials_file
         self.service = None
+        self._creds = None
         self.calendar_id = 'primary'  # Use primary calendar
         
     def authenticate(self):
-        """Authenticate with Google Calendar API."""
+        """Authenticate with Google Calendar API, reusing credentials loaded earlier in this process."""
+        with _auth_lock:
+            shared = _shared_auth.get(self.credentials_file)
+            if shared is None or not shared[0].valid:
+                creds = self._load_credentials()
+                service = build('calendar', 'v3', credentials=creds)
+                shared = (creds, service)
+                _shared_auth[self.credentials_file] = shared
+                print("[OK] Successfully authenticated with Google Calendar")
+        self._creds, self.service = shared
+
+    def _http(self):
+        """Authorized transport for the calling thread."""
+        transports = getattr(_thread_http, 'transports', None)
+        if transports is None:
+            transports = _thread_http.transports = {}
+        transport = transports.get(self.credentials_file)
+        if transport is None or transport.credentials is not self._creds:
+            transport = AuthorizedHttp(self._creds, http=httplib2.Http())
+            transports[self.credentials_file] = transport
+        return transport
+
+    def _load_credentials(self):
+        """Load credentials from the environment or token.json, refreshing or running OAuth as needed."""
         creds = None
         
         # Try to load from environment variables first (if refresh token is provided)
@@ -83,8 +126,7 @@ class GoogleCalendarSync:
                 with open('token.json', 'w') as token:
                     token.write(creds.to_json())
         
-        self.service = build('calendar', 'v3', credentials=creds)
-        print("[OK] Successfully authenticated with Google Calendar")
+        return creds
     
     def load_tasks(self):
         """Load all task JSON files from the tasks directory."""
@@ -250,7 +292,7 @@ class GoogleCalendarSync:
             created_event = self.service.events().insert(
                 calendarId=self.calendar_id,
                 body=event
-            ).execute()
+            ).execute(http=self._http())
             
             print(f"[OK] Created event: {action} (ID: {created_event['id']})")
             return created_event
@@ -322,26 +364,55 @@ class GoogleCalendarSync:
         print(f"  [SKIP] Skipped: {skipped_count}")
         print(f"{'='*50}")
     
-    def list_upcoming_events(self, max_results: int = 10):
-        """List upcoming events from Google Calendar (for verification)."""
-        if not self.service:
-            self.authenticate()
-        
+    def _mirrored_events(self, max_results: int):
+        """Upcoming events from the local mirror, or None if it is missing or this calendar is stale."""
+        if not os.path.exists(MIRROR_DB_PATH):
+            return None
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            con = sqlite3.connect(f'file:{MIRROR_DB_PATH}?mode=ro', uri=True)
+            try:
+                row = con.execute(
+                    "SELECT value FROM SyncState WHERE key=?",
+                    (f"calendar_mirror:{self.calendar_id}:synced_at",)
+                ).fetchone()
+                if not row or now - datetime.datetime.fromisoformat(row[0]) > MIRROR_MAX_AGE:
+                    return None
+                rows = con.execute(
+                    "SELECT event_json FROM CalendarEvent WHERE calendar_id = ? AND end_ts > ? "
+                    "ORDER BY start_ts, event_id LIMIT ?",
+                    (self.calendar_id, now.timestamp(), max_results)
+                ).fetchall()
+            finally:
+                con.close()
+        except (sqlite3.Error, ValueError):
+            return None
+        return [json.loads(event_json) for (event_json,) in rows]
+
+    def list_upcoming_events(self, max_results: int = 10, use_mirror: bool = True):
+        """List upcoming events (for verification), from the local mirror when fresh.
+
+        Pass use_mirror=False right after creating events: the mirror may not
+        have synced them yet.
+        """
         try:
             now = datetime.datetime.utcnow().isoformat() + 'Z'
             print(f"\n{'='*50}")
             print(f"Upcoming {max_results} events:")
             print(f"{'='*50}")
             
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
-                timeMin=now,
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
+            events = self._mirrored_events(max_results) if use_mirror else None
+            if events is None:
+                if not self.service:
+                    self.authenticate()
+                events_result = self.service.events().list(
+                    calendarId=self.calendar_id,
+                    timeMin=now,
+                    maxResults=max_results,
+                    singleEvents=True,
+                    orderBy='startTime'
+                ).execute(http=self._http())
+                events = events_result.get('items', [])
             
             if not events:
                 print('No upcoming events found.')
@@ -385,8 +456,8 @@ def main():
         # Sync tasks
         syncer.sync_all_tasks(force_resync=args.force)
         
-        # Show upcoming events for verification
-        syncer.list_upcoming_events(max_results=5)
+        # Show upcoming events for verification, straight from the API so new ones appear
+        syncer.list_upcoming_events(max_results=5, use_mirror=False)
         
     except FileNotFoundError as e:
         print(f"\n❌ Error: {e}")